@@ -0,0 +1,162 @@
+# async_mqtt.py
+# Minimaler MQTT-3.1.1-Client auf asyncio-Streams. Eine Instanz = eine TCP-Session,
+# damit ein einzelner Prozess tausende Geräteverbindungen halten kann
+# (paho startet pro Client einen eigenen Netzwerk-Thread).
+# Unterstützt CONNECT, PUBLISH (QoS 0/1), SUBSCRIBE, PING und DISCONNECT.
+import asyncio, struct, time
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 0x10, 0x20, 0x30, 0x40
+SUBSCRIBE, SUBACK, PINGREQ, PINGRESP, DISCONNECT = 0x82, 0x90, 0xC0, 0xD0, 0xE0
+
+
+def _encode_length(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _encode_str(s) -> bytes:
+    data = s.encode() if isinstance(s, str) else s
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(header: int, body: bytes) -> bytes:
+    return bytes([header]) + _encode_length(len(body)) + body
+
+
+class AsyncMqttClient:
+    def __init__(self, client_id: str, keepalive: int = 60, on_message=None):
+        self.client_id = client_id
+        self.keepalive = keepalive
+        self.on_message = on_message  # Callback(topic: str, payload: bytes)
+        self._reader = None
+        self._writer = None
+        self._next_mid = 0
+        self._pending = {}            # packet id → Future (PUBACK/SUBACK)
+        self._connack = None
+        self._tasks = []
+        self._last_send = 0.0
+        self.connected = False
+
+    def _mid(self):
+        self._next_mid = self._next_mid % 65535 + 1
+        return self._next_mid
+
+    def _write(self, data: bytes):
+        self._writer.write(data)
+        self._last_send = time.monotonic()
+
+    async def connect(self, host: str, port: int = 1883, timeout: float = 10.0):
+        """Baut die Session auf und liefert die Verbindungsdauer in Sekunden (TCP + CONNACK)."""
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        self._connack = loop.create_future()
+        self._tasks.append(asyncio.create_task(self._read_loop()))
+
+        body = _encode_str("MQTT") + bytes([4, 0x02]) + struct.pack("!H", self.keepalive) + _encode_str(self.client_id)
+        try:
+            self._write(_packet(CONNECT, body))
+            rc = await asyncio.wait_for(self._connack, timeout)
+            if rc != 0:
+                raise ConnectionError(f"CONNACK rc={rc}")
+        except BaseException:
+            # Handshake gescheitert (Timeout, rc ≠ 0, Abbruch): Socket und Lese-Task nicht liegen lassen
+            await self.close()
+            raise
+        self.connected = True
+        if self.keepalive:
+            self._tasks.append(asyncio.create_task(self._ping_loop()))
+        return time.perf_counter() - t0
+
+    async def publish(self, topic: str, payload: bytes, qos: int = 0):
+        """QoS 0: nur schreiben. QoS 1: wartet auf PUBACK."""
+        header = PUBLISH | (qos << 1)
+        body = _encode_str(topic)
+        fut = None
+        if qos > 0:
+            mid = self._mid()
+            body += struct.pack("!H", mid)
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[mid] = fut
+        self._write(_packet(header, body + payload))
+        await self._writer.drain()
+        if fut:
+            await fut
+
+    async def subscribe(self, topic: str, qos: int = 0):
+        mid = self._mid()
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[mid] = fut
+        self._write(_packet(SUBSCRIBE, struct.pack("!H", mid) + _encode_str(topic) + bytes([qos])))
+        await fut
+
+    async def close(self):
+        if self._writer is None:
+            return
+        try:
+            if self.connected:
+                self._write(_packet(DISCONNECT, b""))
+                await self._writer.drain()
+            self._writer.close()
+        except (ConnectionError, OSError):
+            pass
+        self.connected = False
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive / 2)
+            if time.monotonic() - self._last_send >= self.keepalive / 2:
+                self._write(_packet(PINGREQ, b""))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header = (await self._reader.readexactly(1))[0]
+                length, shift = 0, 0
+                while True:
+                    byte = (await self._reader.readexactly(1))[0]
+                    length += (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = await self._reader.readexactly(length) if length else b""
+                self._handle(header, body)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            self.connected = False
+            if self._connack is not None and not self._connack.done():
+                self._connack.set_exception(ConnectionError("Verbindung vor CONNACK getrennt"))
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(ConnectionError("Verbindung getrennt"))
+            self._pending.clear()
+
+    def _handle(self, header: int, body: bytes):
+        ptype = header & 0xF0
+        if ptype == CONNACK:
+            if not self._connack.done():
+                self._connack.set_result(body[1])
+        elif ptype in (PUBACK, SUBACK):
+            fut = self._pending.pop(struct.unpack_from("!H", body)[0], None)
+            if fut and not fut.done():
+                fut.set_result(None)
+        elif ptype == PUBLISH:
+            qos = (header >> 1) & 0x03
+            tlen = struct.unpack_from("!H", body)[0]
+            topic = body[2:2 + tlen].decode(errors="replace")
+            pos = 2 + tlen
+            if qos > 0:
+                mid = body[pos:pos + 2]
+                pos += 2
+                self._write(bytes([PUBACK, 2]) + mid)
+            if self.on_message:
+                self.on_message(topic, body[pos:])
@@ -0,0 +1,189 @@
+# clock_sync.py
+# NTP-artige Schätzung von Uhrenversatz und Drift zwischen Lastgenerator und SUT-Host
+# über MQTT-Request/Response-Paare. Gegenstelle ist habapp_rules/ClockSyncResponder.py.
+import struct, threading, time
+import paho.mqtt.client as mqtt
+
+SYNC_TOPIC = "/clocksync/request"
+SYNC_RESPONSE_TOPIC = "/clocksync/response"
+# Magic beginnt mit 0xFF wie beim Probe-Format, damit HABApp den Payload als bytes durchreicht
+SYNC_MAGIC = b"\xffC"
+SYNC_REQUEST = struct.Struct("!2sQq")    # Magic | Sequenz | t1 (Client sendet, ns)
+SYNC_STAMPS = struct.Struct("!qq")       # angehängt vom Responder: t2 (Empfang), t3 (Antwort), ns
+
+
+class ClockSync:
+    """
+    Jede Probe liefert t1 (Client sendet), t2 (SUT empfängt), t3 (SUT antwortet), t4 (Client empfängt):
+        Versatz θ = ((t2 − t1) + (t3 − t4)) / 2      (SUT-Uhr minus Client-Uhr)
+        Rundlauf δ = (t4 − t1) − (t3 − t2)
+    Der wahre Versatz liegt unabhängig von der Asymmetrie der Wege in θ ± δ/2. Für die
+    Schätzung zählen daher nur die Proben mit dem kleinsten Rundlauf (unteres Quartil);
+    über sie wird per Regression eine lineare Drift gelegt.
+
+    start() misst zuerst einen Burst von `burst` Proben und danach alle `period` Sekunden
+    eine weitere Probe im Hintergrund, bis stop() aufgerufen wird.
+    """
+    QUANTILE = 0.25
+    MIN_SPAN_S = 10.0   # kürzere Messreihen liefern keine belastbare Drift
+
+    def __init__(self, BROKER_IP, burst: int = 20, period: float = 5.0, timeout: float = 2.0):
+        self.burst = burst
+        self.period = period
+        self.timeout = timeout
+        self.samples = []            # (t_client Mitte in s, θ in s, δ in s)
+        self._pending = {}           # Sequenz → t1 ns
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._estimate = None
+
+        self.client = mqtt.Client(client_id=f"clocksync_{time.time_ns()}")
+        self.client.on_message = self._on_message
+        self.client.connect(BROKER_IP, 1883)
+        self.client.subscribe(SYNC_RESPONSE_TOPIC, qos=0)
+        self.client.loop_start()
+
+    # --- Messung ---
+
+    def _on_message(self, client, userdata, msg):
+        t4 = time.time_ns()
+        data = msg.payload
+        if len(data) < SYNC_REQUEST.size + SYNC_STAMPS.size or data[:2] != SYNC_MAGIC:
+            return
+        _, seq, t1 = SYNC_REQUEST.unpack_from(data)
+        t2, t3 = SYNC_STAMPS.unpack_from(data, SYNC_REQUEST.size)
+        with self._lock:
+            if self._pending.pop(seq, None) != t1:
+                return  # unbekannt oder doppelt
+            offset = ((t2 - t1) + (t3 - t4)) / 2e9
+            delay = ((t4 - t1) - (t3 - t2)) / 1e9
+            self.samples.append(((t1 + t4) / 2e9, offset, delay))
+            self._estimate = None
+
+    def probe(self):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            t1 = time.time_ns()
+            self._pending[seq] = t1
+        self.client.publish(SYNC_TOPIC, SYNC_REQUEST.pack(SYNC_MAGIC, seq, t1), qos=0)
+
+    def measure(self, n: int, interval: float = 0.02):
+        """n Proben im Abstand interval senden und auf die Antworten warten."""
+        before = len(self.samples)
+        for _ in range(n):
+            self.probe()
+            time.sleep(interval)
+        deadline = time.monotonic() + self.timeout
+        while len(self.samples) - before < n and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self._lock:
+            self._pending.clear()  # verlorene Proben nicht ewig vorhalten
+        return len(self.samples) - before
+
+    def start(self):
+        received = self.measure(self.burst)
+        if not received:
+            print(f"⚠️ Uhrensynchronisation: keine Antwort auf {SYNC_TOPIC} – läuft der ClockSyncResponder?")
+        else:
+            est = self.estimate()
+            print(f"🕒 Uhrenversatz SUT − Client: {est['Versatz (ms)']:.3f} ms ± {est['Fehlergrenze (ms)']:.3f} ms "
+                  f"({received} Proben)")
+        if self.period > 0:
+            self._thread = threading.Thread(target=self._run, name="ClockSync", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.probe()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.period + 1)
+        time.sleep(min(self.timeout, 0.5))  # letzte Antwort abwarten
+        self.client.loop_stop()
+        self.client.disconnect()
+        return self
+
+    # --- Auswertung ---
+
+    def _fit(self):
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return None
+        delays = sorted(d for _, _, d in samples)
+        cutoff = delays[min(len(delays) - 1, int(len(delays) * self.QUANTILE))]
+        best = [s for s in samples if s[2] <= cutoff]
+        t_ref = best[0][0]
+        xs = [t - t_ref for t, _, _ in best]
+        ys = [o for _, o, _ in best]
+        span = max(xs) - min(xs)
+        drift = 0.0
+        if len(best) >= 3 and span >= self.MIN_SPAN_S:
+            mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+            drift = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sum((x - mx) ** 2 for x in xs)
+            intercept = my - drift * mx
+        else:
+            intercept = min(best, key=lambda s: s[2])[1]
+        # Fehlergrenze: halber Rundlauf der verwendeten Proben plus größte Abweichung vom Modell
+        residual = max(abs(y - (intercept + drift * x)) for x, y in zip(xs, ys))
+        bound = max(d for _, _, d in best) / 2 + residual
+        return {"t_ref": t_ref, "offset": intercept, "drift": drift, "bound": bound,
+                "n": len(samples), "used": len(best), "min_delay": delays[0], "span": span}
+
+    def estimate(self):
+        if self._estimate is None:
+            self._estimate = self._fit()
+        e = self._estimate
+        if e is None:
+            return {"Proben": 0, "Versatz (ms)": 0.0, "Drift (ppm)": 0.0, "Fehlergrenze (ms)": float("inf"),
+                    "Min. Rundlauf (ms)": 0.0, "Messdauer (s)": 0.0}
+        return {
+            "Proben": e["n"],
+            "Versatz (ms)": e["offset"] * 1000,
+            "Drift (ppm)": e["drift"] * 1e6,
+            "Fehlergrenze (ms)": e["bound"] * 1000,
+            "Min. Rundlauf (ms)": e["min_delay"] * 1000,
+            "Messdauer (s)": e["span"],
+        }
+
+    def offset_at(self, t_client: float) -> float:
+        """Versatz SUT − Client in Sekunden zum Client-Zeitpunkt t_client (time.time())."""
+        self.estimate()
+        e = self._estimate
+        if e is None:
+            return 0.0
+        return e["offset"] + e["drift"] * (t_client - e["t_ref"])
+
+    def to_client(self, t_sut: float, t_client_hint: float) -> float:
+        """SUT-Zeitstempel auf die Client-Uhr umrechnen (t_client_hint: ungefährer Client-Zeitpunkt)."""
+        return t_sut - self.offset_at(t_client_hint)
+
+
+def write_clock_lines(f, clock_stats):
+    """Markdown-Aufzählung zur Uhrensynchronisation."""
+    f.write(f"- Uhrenversatz SUT − Client: {clock_stats['Versatz (ms)']:.3f} ms "
+            f"± {clock_stats['Fehlergrenze (ms)']:.3f} ms\n")
+    f.write(f"- Drift: {clock_stats['Drift (ppm)']:.2f} ppm über {clock_stats['Messdauer (s)']:.0f} s "
+            f"({clock_stats['Proben']} Proben, min. Rundlauf {clock_stats['Min. Rundlauf (ms)']:.3f} ms)\n")
+
+
+def finish_clock_sync(clock):
+    """
+    Stoppt die Synchronisation und liefert estimate() – oder None ohne --clock_sync bzw. wenn
+    keine Sync-Probe beantwortet wurde (z. B. ClockSyncResponder nicht geladen). Einweg- und
+    Client/SUT-Werte dürfen nur mit einem Ergebnis ungleich None ausgewertet werden.
+    """
+    if clock is None:
+        return None
+    stats = clock.stop().estimate()
+    if stats["Proben"] > 0:
+        return stats
+    print("⚠️ Uhrensynchronisation ohne beantwortete Probe (ClockSyncResponder aktiv?) – "
+          "Einweg- und Client/SUT-Werte werden nicht ausgewertet")
+    return None
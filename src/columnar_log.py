@@ -0,0 +1,171 @@
+# columnar_log.py
+# Spaltenorientiertes Binärformat für Messwerte pro Nachricht: ein Verzeichnis mit je einer
+# .npy-Datei pro Spalte (int64, little endian) und einer meta.json. Lesen ohne Parsen:
+# mit NumPy über np.load(mmap_mode="r"), ohne NumPy über mmap + memoryview.cast("q").
+import os, sys, json, mmap, struct, threading, atexit
+from array import array
+from datetime import datetime
+
+_np = False  # NumPy erst beim ersten Lesen importieren, nicht bei jedem Start von main.py
+
+
+def _numpy():
+    """NumPy-Modul oder None – NumPy ist optional, der Reader fällt auf memoryview zurück."""
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
+BASE_COLUMNS = ("seq", "send_ns", "recv_ns", "stage")
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_LEN = 128   # fest, damit die Zeilenzahl beim Schließen in place nachgetragen werden kann
+
+
+def _npy_header(rows: int) -> bytes:
+    text = "{'descr': '<i8', 'fortran_order': False, 'shape': (%d,), }" % rows
+    text = text.ljust(NPY_HEADER_LEN - len(NPY_MAGIC) - 2 - 1) + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(text)) + text.encode("latin1")
+
+
+class ColumnarWriter:
+    """
+    Schreibt Datensätze (seq, send_ns, recv_ns, stage, *hops) spaltenweise nach
+    latency_logs_stability/latency_cols_<mode>_<ts>/<spalte>.npy. Gepuffert wird in
+    array("q") je Spalte; ab `chunk` Zeilen wird angehängt, der Speicher bleibt konstant.
+    close() (bei Abbruch auch über atexit) trägt die Zeilenzahl in die Header ein.
+    """
+
+    def __init__(self, mode: str, hops=(), folder: str = "latency_logs_stability", chunk: int = 65536):
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(folder, f"latency_cols_{mode}_{timestamp_str}")
+        os.makedirs(self.path, exist_ok=True)
+        self.mode = mode
+        self.columns = BASE_COLUMNS + tuple(hops)
+        self.chunk = chunk
+        self.rows = 0
+        self._buffers = {c: array("q") for c in self.columns}
+        self._files = {}
+        for c in self.columns:
+            f = open(os.path.join(self.path, c + ".npy"), "wb")
+            f.write(_npy_header(0))
+            self._files[c] = f
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def append(self, seq: int, send_ns: int, recv_ns: int, stage: int = 0, hops=()):
+        with self._lock:
+            b = self._buffers
+            b["seq"].append(seq)
+            b["send_ns"].append(send_ns)
+            b["recv_ns"].append(recv_ns)
+            b["stage"].append(stage)
+            for name, value in zip(self.columns[len(BASE_COLUMNS):], hops):
+                b[name].append(value)
+            if len(b["seq"]) >= self.chunk:
+                self._flush()
+
+    def _flush(self):
+        n = len(self._buffers["seq"])
+        for c in self.columns:
+            buf = self._buffers[c]
+            if len(buf) < n:  # fehlende Hop-Stempel als 0
+                buf.extend([0] * (n - len(buf)))
+            if sys.byteorder == "big":
+                buf.byteswap()
+            buf.tofile(self._files[c])
+            self._buffers[c] = array("q")
+        self.rows += n
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return self.path
+            self._closed = True
+            self._flush()
+            for f in self._files.values():
+                f.seek(0)
+                f.write(_npy_header(self.rows))
+                f.close()
+        atexit.unregister(self.close)
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"Modus": self.mode, "Zeilen": self.rows, "Spalten": list(self.columns)}, f, ensure_ascii=False)
+        print(f"✅ Spaltenlog gespeichert: {self.path} ({self.rows} Zeilen)")
+        return self.path
+
+
+class ColumnarLog:
+    """
+    Liest ein von ColumnarWriter geschriebenes Verzeichnis ohne Parsen: column() liefert
+    ein NumPy-memmap bzw. ohne NumPy eine memoryview auf die gemappte Datei.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.columns = self.meta["Spalten"]
+        self.rows = self.meta["Zeilen"]
+        self._maps = []
+        self._cache = {}
+        self._np = _numpy()
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name: str):
+        if name not in self._cache:
+            file = os.path.join(self.path, name + ".npy")
+            if self._np is not None:
+                self._cache[name] = self._np.load(file, mmap_mode="r")
+            else:
+                with open(file, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                header_len = len(NPY_MAGIC) + 2 + struct.unpack_from("<H", mm, len(NPY_MAGIC))[0]
+                self._maps.append(mm)
+                view = memoryview(mm)[header_len:header_len + 8 * self.rows].cast("q")
+                if sys.byteorder == "big":
+                    view = array("q", view)
+                    view.byteswap()
+                self._cache[name] = view
+        return self._cache[name]
+
+    def chunks(self, names, size: int = 65536):
+        """Spalten names blockweise als Listen von int – Auswertung mit konstantem Speicher."""
+        cols = [self.column(name) for name in names]
+        for start in range(0, self.rows, size):
+            yield [col[start:start + size].tolist() for col in cols]
+
+    def latency_ms(self):
+        """Rundlauf recv_ns − send_ns in ms (NumPy-Array bzw. Liste)."""
+        send, recv = self.column("send_ns"), self.column("recv_ns")
+        if self._np is not None:
+            return (recv - send) / 1e6
+        return [(r - s) / 1e6 for s, r in zip(send, recv)]
+
+    def seconds(self):
+        """Empfangszeitpunkt in Sekunden relativ zur ersten gesendeten Nachricht."""
+        send, recv = self.column("send_ns"), self.column("recv_ns")
+        if not self.rows:
+            return [] if self._np is None else self._np.empty(0)
+        t0 = min(send) if self._np is None else send.min()
+        if self._np is not None:
+            return (recv - t0) / 1e9
+        return [(r - t0) / 1e9 for r in recv]
+
+    def close(self):
+        self._cache.clear()
+        for mm in self._maps:
+            try:
+                mm.close()
+            except BufferError:
+                pass  # noch referenzierte Views
+        self._maps.clear()
+
+
+def is_columnar_log(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "meta.json"))
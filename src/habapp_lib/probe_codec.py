@@ -0,0 +1,70 @@
+# habapp_lib/probe_codec.py
+# Binäres Probe-Format – einzige Definition für Client (utils.py) und HABApp-Responder.
+# Der Ordner habapp_lib wird in HABApp als lib-Verzeichnis eingetragen (oder die Datei dorthin
+# kopiert), damit die Regeln in habapp_rules/ `from probe_codec import …` nutzen können.
+# Nur Standardbibliothek, kein HABApp-Import.
+#
+# Header (Network Byte Order): Magic (2 B) | Tag (1 B) | Sequenz (8 B) | Sendezeit ns (8 B) | Padding-Länge (2 B),
+# danach Padding. Antworten tragen Padding-Länge 0 und hängen je Hop einen ns-Zeitstempel an.
+# Das Magic beginnt mit 0xFF (nie gültiges UTF-8), damit HABApp den Payload als bytes durchreicht.
+# Client und Responder erkennen das Format am Topic-Suffix PROBE_SUFFIX.
+import struct
+import time
+
+PROBE_MAGIC = b"\xffP"
+PROBE_HEADER = struct.Struct("!2sBQqH")
+PROBE_SUFFIX = "/bin"
+
+
+def encode_probe(seq: int, send_ns: int, pad_len: int = 0, tag: int = 0) -> bytes:
+    return PROBE_HEADER.pack(PROBE_MAGIC, tag, seq, send_ns, pad_len) + b"\0" * pad_len
+
+
+def decode_probe(data: bytes):
+    """Liefert (tag, seq, send_ns, stamps) oder None, falls kein Probe-Payload."""
+    if len(data) < PROBE_HEADER.size or data[:2] != PROBE_MAGIC:
+        return None
+    _, tag, seq, send_ns, pad_len = PROBE_HEADER.unpack_from(data)
+    offset = PROBE_HEADER.size + pad_len
+    n_stamps = (len(data) - offset) // 8
+    stamps = struct.unpack_from(f"!{n_stamps}q", data, offset) if n_stamps > 0 else ()
+    return tag, seq, send_ns, stamps
+
+
+def encode_reply(tag: int, seq: int, send_ns: int, *stamps_ns: int) -> bytes:
+    """Antwort: Header ohne Padding plus die Hop-Zeitstempel in ns."""
+    return PROBE_HEADER.pack(PROBE_MAGIC, tag, seq, send_ns, 0) + struct.pack(f"!{len(stamps_ns)}q", *stamps_ns)
+
+
+def read_probe(raw):
+    """Wie decode_probe, nimmt aber den Wert eines HABApp-MqttItems (bytes oder str) entgegen."""
+    data = raw.encode() if isinstance(raw, str) else raw
+    if not isinstance(data, (bytes, bytearray)):
+        return None
+    return decode_probe(data)
+
+
+def echo_reply(raw, stamp_ns: int):
+    """Antwort eines Echo-Responders (Tag und Sequenz unverändert, ein Zeitstempel) oder None."""
+    probe = read_probe(raw)
+    if probe is None:
+        return None
+    tag, seq, send_ns, _ = probe
+    return encode_reply(tag, seq, send_ns, stamp_ns)
+
+
+def echo_handler(publish, response_topic: str, log=None):
+    """
+    Callback für MqttItem.listen_event() eines Echo-Responders: beantwortet jede Binär-Probe
+    mit echo_reply() auf response_topic. publish ist z. B. rule.mqtt.publish, damit dieses
+    Modul ohne HABApp-Import auskommt.
+    """
+    def on_binary(event):
+        # Header ohne Padding zurückschicken, Empfangszeit (ns) anhängen
+        response = echo_reply(event.value, time.time_ns())
+        if response is None:
+            if log is not None:
+                log.warning(f"Ungültiger Binär-Payload: {event.value!r}")
+            return
+        publish(response_topic, response)
+    return on_binary
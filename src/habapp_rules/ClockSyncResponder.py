@@ -0,0 +1,34 @@
+import logging
+import HABApp
+from HABApp.mqtt.items import MqttItem
+from HABApp.core.events import ValueUpdateEventFilter
+import struct
+import time
+
+log = logging.getLogger('MQTTEventBus')
+
+# Format wie clock_sync.py im Client: Magic | Sequenz | t1 (ns); Antwort hängt t2/t3 (ns) an
+SYNC_MAGIC = b"\xffC"
+SYNC_REQUEST = struct.Struct("!2sQq")
+SYNC_STAMPS = struct.Struct("!qq")
+
+
+class ClockSyncResponder(HABApp.Rule):
+    def __init__(self):
+        super().__init__()
+        self.request = MqttItem.get_create_item("/clocksync/request")
+        # Jede Anfrage hat eine eigene Sequenz → ValueUpdate statt ValueChange
+        self.request.listen_event(self.on_request, ValueUpdateEventFilter())
+
+    def on_request(self, event):
+        t2 = time.time_ns()  # so früh wie möglich stempeln
+        raw = event.value
+        data = raw.encode() if isinstance(raw, str) else raw
+        if not isinstance(data, (bytes, bytearray)) or len(data) < SYNC_REQUEST.size or data[:2] != SYNC_MAGIC:
+            log.warning(f"Ungültige Sync-Anfrage: {raw!r}")
+            return
+        head = bytes(data[:SYNC_REQUEST.size])
+        self.mqtt.publish("/clocksync/response", head + SYNC_STAMPS.pack(t2, time.time_ns()))
+
+
+ClockSyncResponder()
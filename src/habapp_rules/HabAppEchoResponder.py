@@ -1,9 +1,10 @@
 import logging
 import HABApp
 from HABApp.mqtt.items import MqttItem
-from HABApp.core.events import ValueChangeEvent
+from HABApp.core.events import ValueChangeEvent, ValueUpdateEventFilter
 import json
 import time
+from probe_codec import echo_handler  # habapp_lib/, im HABApp-lib-Ordner
 
 log = logging.getLogger('MQTTEventBus')
 
@@ -17,6 +18,11 @@ class HabAppEchoResponder(HABApp.Rule):
         self.cmd = MqttItem.get_create_item("/latency/habapp/echo")
         self.cmd.listen_event(self.on_command)
 
+        # Binär-Probes: jede Nachricht hat eine eigene Sequenz, daher ValueUpdate statt Zeitstempel-Filter
+        self.cmd_bin = MqttItem.get_create_item("/latency/habapp/echo/bin")
+        self.cmd_bin.listen_event(echo_handler(self.mqtt.publish, "/latency/habapp/echo/response/bin", log),
+                                  ValueUpdateEventFilter())
+
     def on_command(self, event: ValueChangeEvent):
         raw = event.value
         log.warning(f"Eingehender Payload: {raw} ({type(raw)})")
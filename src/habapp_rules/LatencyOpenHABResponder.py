@@ -6,11 +6,17 @@ from HABApp.mqtt.items import MqttItem, MqttPairItem
 from HABApp.openhab.items import OpenhabItem
 from HABApp.core import Items
 from HABApp.core.errors import ItemNotFoundException
-from HABApp.core.events import ValueChangeEvent
+from HABApp.core.events import ValueChangeEvent, ValueUpdateEventFilter
 import logging
+from probe_codec import read_probe, encode_reply  # habapp_lib/, im HABApp-lib-Ordner
 
 
 log = logging.getLogger('MQTTEventBus')
+
+# Binäres Probe-Format aus probe_codec: Tag im Command = 1 (ON) / 0 (OFF), in der Antwort = neuer
+# State; angehängt in ns: openHAB-Command, openHAB-State, HABApp-Empfang, HABApp-Publish
+# (Reihenfolge abwärtskompatibel)
+
 #log_state = True  # Parameter('mqtt_event_bus', 'log_state', default_value=False).value
 
 class LatencyOpenHABResponder(HABApp.Rule):
@@ -21,6 +27,8 @@ class LatencyOpenHABResponder(HABApp.Rule):
         self.command_times = {}  # msg_id → timestamp
         self.mqtt_pairs = {}
         self.payload = None
+        self.probe = None  # (seq, send_ns) der letzten Binär-Probe, None bei JSON
+        self.recv_time = 0.0  # Empfang des letzten Commands in HABApp (Trace-Hop)
 
         # Nur gezielte Items verwenden
         self.item_name = "testSwitch"
@@ -42,6 +50,10 @@ class LatencyOpenHABResponder(HABApp.Rule):
         # Command Event Listener registrieren
         mqtt_pair.listen_event(self.on_mqtt_command)
 
+        # Binär-Probes auf <Command-Topic>/bin
+        self.cmd_bin = MqttItem.get_create_item(self.cmd_topic + "/bin")
+        self.cmd_bin.listen_event(self.on_binary_command, ValueUpdateEventFilter())
+
         # openHAB-Item abonnieren
         self.item = OpenhabItem.get_item(self.item_name)
         self.item.listen_event(self.on_item_state)
@@ -56,15 +68,27 @@ class LatencyOpenHABResponder(HABApp.Rule):
             self.openhab.send_command(item_name, value)
 
     async def on_mqtt_command(self, event: ValueChangeEvent):
+        self.recv_time = time.time()
         try:
             # if self.item_name in event.name:
             self.payload = event.value
+            self.probe = None
             value = self.payload.get("command")
             if value is not None:
                 self.command_queue.put_nowait((self.item_name, value))
         except Exception as e:
             log.error(f"Fehler beim Parsen des Commands: {e}")
 
+    async def on_binary_command(self, event):
+        self.recv_time = time.time()
+        probe = read_probe(event.value)
+        if probe is None:
+            log.warning(f"Ungültiger Binär-Payload: {event.value!r}")
+            return
+        tag, seq, send_ns, _ = probe
+        self.probe = (seq, send_ns)
+        self.command_queue.put_nowait((self.item_name, "ON" if tag else "OFF"))
+
     def on_item_state(self, event: ValueChangeEvent):
         if self.item_name in event.name:
         #    mqtt_item = self.mqtt_pair
@@ -78,16 +102,27 @@ class LatencyOpenHABResponder(HABApp.Rule):
 
             #mqtt_item = self.mqtt_pairs.get(event.name)
             #if mqtt_item and event.old_value != event.value:
-                if event.name in self.command_times:
+                if event.name in self.command_times and self.probe is not None:
+                    seq, send_ns = self.probe
+                    state_tag = 1 if str(event.value) == "ON" else 0
+                    state_ns = time.time_ns()
+                    cmd_ns = int(self.command_times.pop(event.name) * 1e9)
+                    response = encode_reply(state_tag, seq, send_ns,
+                                            cmd_ns, state_ns, int(self.recv_time * 1e9), time.time_ns())
+                    self.mqtt.publish(self.state_topic + "/bin", response, qos=0)
+                elif event.name in self.command_times:
                     response = {
                         "id": self.payload.get("id"),
                         "item": self.item_name,
                         "client_timestamp": self.payload.get("client_timestamp"),
+                        "client_send_time": self.payload.get("client_send_time"),
                         "command": self.payload.get("command"),
                         "state": str(event.value),
+                        "habapp_recv_time": self.recv_time,
                         "openhab_command_time": self.command_times.pop(event.name),
                         "openhab_state_time": time.time()
                     }
+                    response["habapp_publish_time"] = time.time()
                     mqtt_item.publish(json.dumps(response), qos=0)
 
 
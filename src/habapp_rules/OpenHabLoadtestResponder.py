@@ -4,6 +4,7 @@ from HABApp.mqtt.items import MqttItem
 from HABApp.core.events import ValueUpdateEventFilter
 import json
 import time
+from probe_codec import echo_handler  # habapp_lib/, im HABApp-lib-Ordner
 
 log = logging.getLogger('MQTTEventBus')
 
@@ -17,6 +18,11 @@ class OpenHabLoadtestResponder(HABApp.Rule):
         # Nur auf ValueUpdateEvent hören (Filter-Instanz!)
         self.cmd.listen_event(self.on_message, ValueUpdateEventFilter())
 
+        # Binär-Probes kommen auf <Topic>/bin und werden auf <Response>/bin beantwortet
+        self.cmd_bin = MqttItem.get_create_item("/loadtest/openhab/command/bin")
+        self.cmd_bin.listen_event(echo_handler(self.mqtt.publish, "/loadtest/openhab/response/bin", log),
+                                  ValueUpdateEventFilter())
+
     def on_message(self, event):
         raw = event.value
         try:
@@ -0,0 +1,306 @@
+# load_profiles.py
+# Ankunftsprozesse für Last- und Stresstests (--profile). Statt eines festen Abstands folgt
+# die Sendefolge einem Ratenverlauf λ(t), dessen Mittel über die Dauer --rate ist (onoff und
+# diurnal über ganze Perioden; die Standardwerte sind so gewählt):
+#   constant                   gleichmäßige Abstände (wie RateScheduler)
+#   poisson                    exponentialverteilte Abstände
+#   onoff:on=1,off=4           Bursts: on s mit Rate·(on+off)/on, dann off s Pause;
+#                              on=0.01 ≈ Szene, die viele Geräte auf einmal schaltet
+#   diurnal:period=…,amp=0.8   Sinus um die mittlere Rate (Standard: eine Periode pro Lauf)
+#   step:steps=5               Treppe mit steps gleich hohen Stufen, k-te Stufe Rate·2k/(steps+1)
+#   spike:at=0.5,length=…,factor=10   Grundlast, ab at·Dauer factor-fach (Standard 10 % der Dauer);
+#                              die Grundlast ist so abgesenkt, dass das Mittel Rate bleibt
+# Jedes Profil akzeptiert poisson=1 (zufällige statt gleichmäßiger Ankünfte) und jitter=<s>.
+# Die Sendezeitpunkte werden im Voraus berechnet und in Leerlaufzeit nachgefüllt, der Sende-Loop
+# liest nur noch den nächsten Wert aus einem Puffer. LoadCurve hält Soll, Gesendet und Empfangen
+# je Sekunde fest.
+import math, os, random, time
+from array import array
+from datetime import datetime
+from utils import RateScheduler
+
+PROFILES = ("constant", "poisson", "onoff", "diurnal", "step", "spike")
+GRID_S = 0.01     # Auflösung des Ratenverlaufs
+BATCH = 2048      # Sendezeitpunkte pro Nachfüllen
+LOW_WATER = 512   # darunter wird in der nächsten Wartezeit nachgefüllt
+
+
+def parse_profile(spec: str):
+    """'onoff:on=0.5,off=4.5' → ('onoff', {'on': 0.5, 'off': 4.5})"""
+    name, _, rest = spec.partition(":")
+    name = name.strip().lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unbekanntes Lastprofil {name!r} (möglich: {', '.join(PROFILES)})")
+    params = {}
+    for item in filter(None, (p.strip() for p in rest.split(","))):
+        key, _, value = item.partition("=")
+        params[key.strip()] = float(value)
+    return name, params
+
+
+def rate_function(name, params, rate, duration):
+    """λ(t) in msg/s für das Profil name mit Mittel rate über duration; duration skaliert diurnal, step und spike."""
+    duration = duration if duration and duration > 0 else 60.0
+    if name == "onoff":
+        on = max(params.get("on", 1.0), GRID_S)
+        period = on + params.get("off", 4.0)
+        burst = rate * period / on
+        return lambda t: burst if t % period < on else 0.0
+    if name == "diurnal":
+        period = params.get("period", duration)
+        amp = min(max(params.get("amp", 0.8), 0.0), 1.0)
+        return lambda t: rate * (1 + amp * math.sin(2 * math.pi * t / period))
+    if name == "step":
+        steps = max(1, int(params.get("steps", 5)))
+        width = duration / steps
+        # Stufen 1..steps im Verhältnis, Mittel (steps+1)/2 → auf rate normiert
+        return lambda t: rate * 2 * min(int(t / width) + 1, steps) / (steps + 1)
+    if name == "spike":
+        start = params.get("at", 0.5) * duration
+        end = start + params.get("length", duration / 10)
+        factor = params.get("factor", 10.0)
+        share = max(0.0, min(end, duration) - start) / duration  # Anteil der Spitze an der Dauer
+        base = rate / (1 + (factor - 1) * share)
+        peak = base * factor
+        return lambda t: peak if start <= t < end else base
+    return lambda t: rate
+
+
+def arrivals(name, params, rate, duration, seed=None):
+    """
+    Endlose Folge von Sendezeitpunkten (s ab Start). Der Ratenverlauf wird in GRID_S-Zellen
+    als konstant angenommen; gleichmäßig heißt: eine Nachricht je Einheit Λ(t) = ∫λ,
+    zufällig: exponentialverteilte Λ-Abstände (inhomogener Poisson-Prozess).
+    """
+    rng = random.Random(seed)
+    lam = rate_function(name, params, rate, duration)
+    poisson = name == "poisson" or bool(params.get("poisson", 0))
+    jitter = params.get("jitter", 0.0)
+    need = rng.expovariate(1.0) if poisson else 0.0  # Λ bis zur nächsten Ankunft
+    cell = 0
+    while True:
+        t = cell * GRID_S
+        r = lam(t + GRID_S / 2)
+        mass = r * GRID_S
+        used = 0.0
+        while r > 0 and need <= mass - used + 1e-9:  # Rundung: Ankunft auf der Zellgrenze gehört noch hierher
+            used += need
+            at = t + used / r
+            yield max(0.0, at + rng.uniform(-jitter, jitter)) if jitter else at
+            need = rng.expovariate(1.0) if poisson else 1.0
+        need -= mass - used
+        cell += 1
+
+
+class ProfileScheduler:
+    """
+    Drop-in für RateScheduler mit vorberechneter Sendefolge. wait() liefert den geplanten
+    Sendezeitpunkt (time.time()-Achse); verspätet ist ein Slot ab LATE_S Verzug. Mit Jitter
+    kann die Folge leicht ungeordnet sein – sie wird je Puffer sortiert.
+    """
+    LATE_S = 0.001
+
+    def __init__(self, profile: str, rate, duration, catch_up=True, seed=None, curve=None):
+        self.profile = profile
+        self.name, self.params = parse_profile(profile)
+        self.rate = rate
+        self.catch_up = catch_up
+        self.curve = curve
+        self._arrivals = arrivals(self.name, self.params, rate, duration, seed)
+        self._buf = array("d")
+        self._i = 0
+        self._refill()
+        self.start()
+
+    def _refill(self):
+        del self._buf[:self._i]
+        self._i = 0
+        batch = sorted(next(self._arrivals) for _ in range(BATCH))
+        self._buf.extend(batch)
+
+    def start(self):
+        self.t0_wall = time.time()
+        self.t0_perf = time.perf_counter()
+        if self.curve:
+            self.curve.start(self.t0_wall)
+        self.slot = 0
+        self.sent = 0
+        self.late = 0
+        self.missed = 0
+        self.max_lag = 0.0
+        self.idle = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0_perf
+
+    def _next(self):
+        if self._i >= len(self._buf):
+            self._refill()
+        offset = self._buf[self._i]
+        self._i += 1
+        self.slot += 1
+        if self.curve:
+            self.curve.offer(offset)
+        return offset
+
+    def wait(self):
+        offset = self._next()
+        due = self.t0_perf + offset
+        now = time.perf_counter()
+        if now < due and len(self._buf) - self._i < LOW_WATER:
+            self._refill()  # Wartezeit nutzen, statt später im Takt zu rechnen
+            now = time.perf_counter()
+        if now < due:
+            self.idle += due - now
+            time.sleep(due - now)
+            now = due
+        else:
+            lag = now - due
+            if lag > self.LATE_S:
+                if self.catch_up:
+                    self.late += 1
+                else:
+                    # verpasste Slots überspringen, bis der nächste wieder in der Zukunft liegt
+                    self.missed += 1
+                    while True:
+                        if self._i >= len(self._buf):
+                            self._refill()
+                        if self.t0_perf + self._buf[self._i] >= now - self.LATE_S:
+                            break
+                        self._next()
+                        self.missed += 1
+                    offset = self._next()
+                    due = self.t0_perf + offset
+                    lag = max(0.0, now - due)
+                    if now < due:
+                        self.idle += due - now
+                        time.sleep(due - now)
+                        now = due
+            self.max_lag = max(self.max_lag, lag)
+
+        self.sent += 1
+        if self.curve:
+            self.curve.send(now - self.t0_perf)
+        return self.t0_wall + offset
+
+    def stats(self):
+        return {
+            "Profil": self.profile,
+            "Soll-Rate": self.rate,
+            "Slots": self.slot,
+            "Verspätet": self.late,
+            "Verpasst": self.missed,
+            "Max. Verzug (ms)": self.max_lag * 1000,
+            "Leerlauf (s)": self.idle,
+        }
+
+    def perf_ns(self, planned):
+        return int((self.t0_perf + planned - self.t0_wall) * 1e9)
+
+
+class LoadCurve:
+    """
+    Soll (geplante Slots), Gesendet und Empfangen je Sekunde ab dem ersten start().
+    Stresstests starten pro Stufe einen neuen Scheduler, die Kurve läuft über alle Stufen weiter.
+    """
+
+    def __init__(self):
+        self.t0 = None
+        self._offset = 0.0   # Start des aktuellen Schedulers relativ zu t0
+        self.offered = array("Q")
+        self.sent = array("Q")
+        self.received = array("Q")
+
+    def start(self, t0_wall):
+        if self.t0 is None:
+            self.t0 = t0_wall
+        self._offset = t0_wall - self.t0
+
+    @staticmethod
+    def _count(bins, second):
+        if second < 0:
+            return
+        if second >= len(bins):
+            bins.frombytes(bytes(8 * (second + 1 - len(bins))))
+        bins[second] += 1
+
+    def offer(self, offset):
+        self._count(self.offered, int(self._offset + offset))
+
+    def send(self, offset):
+        self._count(self.sent, int(self._offset + offset))
+
+    def receive(self):
+        """Aus on_message (paho-Thread) aufrufen."""
+        if self.t0 is not None:
+            self._count(self.received, int(time.time() - self.t0))
+
+    def rows(self):
+        """(Sekunde, Soll, Gesendet, Empfangen) bis zur letzten gesendeten Sekunde plus Nachlauf."""
+        n = max(len(self.sent), len(self.received))
+        get = lambda bins, i: bins[i] if i < len(bins) else 0
+        return [(i, get(self.offered, i), get(self.sent, i), get(self.received, i)) for i in range(n)]
+
+    def stats(self):
+        rows = self.rows()
+        active = [r for r in rows if r[1] or r[2]]
+        deviation = [abs(r[2] - r[1]) for r in active]
+        return {
+            "Soll Max (msg/s)": max((r[1] for r in rows), default=0),
+            "Gesendet Max (msg/s)": max((r[2] for r in rows), default=0),
+            "Empfangen Max (msg/s)": max((r[3] for r in rows), default=0),
+            "Soll-Ist Abw. Ø (msg/s)": sum(deviation) / len(deviation) if deviation else 0.0,
+            "Soll-Ist Abw. Max (msg/s)": max(deviation, default=0),
+        }
+
+    def save_csv(self, mode: str, folder: str = "latency_logs_stability"):
+        os.makedirs(folder, exist_ok=True)
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(folder, f"load_curve_{mode}_{ts}.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("Sekunde;Soll;Gesendet;Empfangen\n")
+            for row in self.rows():
+                f.write(";".join(map(str, row)) + "\n")
+        return path
+
+    def write_markdown(self, f, csv_path=None, profile=None, max_rows=60):
+        """Soll- und Ist-Verlauf, bei langen Läufen auf höchstens max_rows Zeilen zusammengefasst (Ø msg/s)."""
+        rows = self.rows()
+        if not rows:
+            return
+        stats = self.stats()
+        width = max(1, math.ceil(len(rows) / max_rows))
+        f.write("\n## Lastverlauf Soll vs. Ist\n\n")
+        if profile:
+            f.write(f"- Profil: `{profile}`\n")
+        received = any(self.received)  # ohne Empfänger (z. B. traffic_replay) nur Soll und Gesendet
+        f.write(f"- Max. Soll: {stats['Soll Max (msg/s)']} msg/s | Max. gesendet: {stats['Gesendet Max (msg/s)']} msg/s"
+                + (f" | Max. empfangen: {stats['Empfangen Max (msg/s)']} msg/s" if received else "") + "\n")
+        f.write(f"- Abweichung Gesendet ↔ Soll je Sekunde: Ø {stats['Soll-Ist Abw. Ø (msg/s)']:.1f}, "
+                f"max. {stats['Soll-Ist Abw. Max (msg/s)']} msg/s\n")
+        if csv_path:
+            f.write(f"- Verlauf je Sekunde: `{csv_path}`\n")
+        columns = ["Zeit (s)", "Soll (msg/s)", "Gesendet (msg/s)"] + (["Empfangen (msg/s)"] if received else [])
+        f.write("\n| " + " | ".join(columns) + " |\n")
+        f.write("|" + "|".join("-" * (len(c) + 2) for c in columns) + "|\n")
+        for start in range(0, len(rows), width):
+            chunk = rows[start:start + width]
+            means = [sum(r[k] for r in chunk) / len(chunk) for k in range(1, len(columns))]
+            f.write(f"| {start} | " + " | ".join(f"{m:.0f}" for m in means) + " |\n")
+
+def scheduler_from_args(args, rate, duration, curve=None, catch_up=None):
+    """RateScheduler ohne --profile (bisheriges Verhalten), sonst ProfileScheduler mit derselben mittleren Rate."""
+    if catch_up is None:
+        catch_up = not getattr(args, "skip_missed", False)
+    profile = getattr(args, "profile", None)
+    if not profile:
+        return RateScheduler(rate, catch_up=catch_up)
+    if not rate or rate <= 0:
+        print(f"⚠️ --profile {profile} braucht eine Rate (--rate oder --delay) – sende unbegrenzt ohne Profil")
+        return RateScheduler(rate, catch_up=catch_up)
+    return ProfileScheduler(profile, rate, duration, catch_up=catch_up, seed=getattr(args, "seed", None), curve=curve)
+
+
+def curve_from_args(args):
+    """LoadCurve, wenn ein Profil gewählt ist – sonst None (konstante Rate, Soll = Soll-Rate)."""
+    return LoadCurve() if getattr(args, "profile", None) else None
@@ -0,0 +1,150 @@
+# mode_registry.py
+# Verzeichnis aller Testmodi für main.py. Jeder Modus ist als "modul:funktion" hinterlegt und
+# wird erst beim Aufruf importiert – paho, psutil, asyncio usw. lädt nur der gewählte Modus.
+# Modus-spezifische Argumente stehen hier statt global in main.py und werden nur für den
+# gewählten Modus registriert (`--mode X --help` zeigt sie).
+import importlib
+from collections import namedtuple
+
+Mode = namedtuple("Mode", "target help options")
+
+# Argumente, die nur einzelne Modi verwenden: Flag → argparse-Parameter
+OPTIONS = {
+    "--window": dict(type=int, default=1, help="Max. unbestätigte QoS-1/2-Nachrichten (1 = Stop-and-Wait)"),
+    "--workers": dict(type=int, default=1, help="Anzahl Publisher-Prozesse"),
+    "--drain": dict(type=float, default=2.0, help="Sekunden Wartezeit auf Antworten nach jeder Stufe bzw. nach dem Lauf"),
+    "--probe_format": dict(choices=["json", "binary"], default="json", help="Payload-Format der Echo-Modi"),
+    "--inflight_timeout": dict(type=float, default=30.0, help="Sekunden ohne Antwort, bis eine Nachricht als verloren zählt"),
+    "--clock_sync": dict(action="store_true", help="Uhrenversatz zum HABApp-Host schätzen und Einweg-Latenzen ausweisen"),
+    "--devices": dict(type=int, default=100, help="Anzahl simulierter Geräte"),
+    "--device_rate": dict(type=float, default=1.0, help="Basisrate pro Gerät in msg/s"),
+    "--rate_spread": dict(type=float, default=0.0, help="Relative Streuung der Geräteraten (0 ≤ Wert < 1), z. B. 0.5 = ±50%%"),
+    "--connect_concurrency": dict(type=int, default=200, help="Max. parallele Verbindungsaufbauten"),
+    "--iterations": dict(type=int, default=200000, help="Nachrichten pro Größe"),
+    "--grid": dict(default="qos=0,1,2",
+                   help='Raster, z. B. "mode=mqtt_throughput qos=0,1,2 payload_size=64,1024" oder JSON-Datei'),
+    "--cooldown": dict(type=float, help="Pause zwischen zwei Zellen in s (Standard: --pause_between_qos)"),
+    "--sweep_name": dict(help="Name des Sweeps; existiert er bereits, werden fertige Zellen übersprungen"),
+    "--profile": dict(help='Ankunftsprozess: constant, poisson, onoff, diurnal, step, spike, '
+                           'mit Parametern z. B. "onoff:on=0.5,off=4.5" oder "diurnal:poisson=1"'),
+    "--seed": dict(type=int, help="Startwert für zufällige Profile (reproduzierbare Sendefolge)"),
+    "--record_topics": dict(default="#", help='Kommagetrennte Abos für den Mitschnitt, z. B. "#" oder "zigbee2mqtt/#"'),
+    "--log": dict(help="Traffic-Log für die Wiedergabe (Standard: neuester in latency_traffic/)"),
+    "--speed": dict(type=float, default=1.0, help="Wiedergabe-Geschwindigkeit: 1 = Echtzeit, N = N-fach, 0 = maximal"),
+    "--connections": dict(type=int, default=1, help="Anzahl Verbindungen für die Wiedergabe"),
+    "--topic_prefix": dict(default="replay/", help='Präfix vor jedem Topic bei der Wiedergabe ("" = unverändert)'),
+    "--targets": dict(default="mqtt,habapp,openhab", help="Probe-Ziele, kommagetrennt (mqtt, habapp, openhab)"),
+    "--max_loss": dict(type=float, default=1.0, help="SLO: max. Verlust in %% je Versuch"),
+    "--max_p99": dict(type=float, default=100.0, help="SLO: max. p99-Latenz in ms je Versuch"),
+    "--trial_seconds": dict(type=float, default=10.0, help="Dauer eines Versuchs in s"),
+    "--start_rate": dict(type=float, default=100.0, help="Erste Rate der Suche in msg/s"),
+    "--max_rate": dict(type=float, default=50000.0, help="Obergrenze der Suche in msg/s"),
+    "--tolerance": dict(type=float, default=0.05, help="Bisektion endet bei dieser relativen Klammerbreite"),
+    "--repeats": dict(type=int, default=3, help="Unabhängige Suchen je Ziel (für das Konfidenzintervall)"),
+    "--load_target": dict(choices=["mqtt", "habapp", "openhab"], default="habapp",
+                          help="Wohin die Hintergrundlast geht (Durchsatz-Topics des Ziels)"),
+    "--load_rates": dict(default="0,200,500,1000,2000", help="Laststufen in msg/s, kommagetrennt (0 = ohne Last)"),
+    "--probe_rate": dict(type=float, default=10.0, help="Probe-Rate je Ziel in msg/s"),
+}
+
+# --duration zählt in diesen Modi Minuten, in allen übrigen Sekunden (Stresstests und
+# latency_under_load: Sekunden je Stufe)
+DURATION_MINUTES = {"mqtt_echo", "habapp_echo", "openhab_bridge_echo", "openhab_trace", "compare_echo_modes",
+                    "mqtt_throughput", "habapp_throughput", "openhab_throughput", "traffic_record"}
+
+ECHO = ("--probe_format", "--inflight_timeout")
+PROFILE = ("--profile", "--seed")
+
+MODES = {
+    "mqtt_echo": Mode("modes.mqtt_echo:run_mqtt_echo",
+                      "Rundlauf Client → Broker → Client", ECHO),
+    "habapp_echo": Mode("modes.habapp_echo:run_habapp_echo",
+                        "Rundlauf über eine HABApp-Regel", ECHO + ("--clock_sync",)),
+    "openhab_bridge_echo": Mode("modes.openhab_bridge_echo:run_openhab_bridge_echo",
+                                "Rundlauf über HABApp und ein openHAB-Item", ECHO),
+    "openhab_trace": Mode("modes.openhab_trace:run_openhab_trace",
+                          "openHAB-Rundlauf mit Zeitstempel pro Hop", ECHO + ("--clock_sync", "--drain")),
+    "compare_echo_modes": Mode("modes.compare_echo_modes:run_compare_echo_modes",
+                               "Alle drei Echo-Modi nacheinander plus Vergleichstabelle", ECHO + ("--clock_sync",)),
+    "mqtt_throughput": Mode("modes.mqtt_throughput:run_mqtt_throughput",
+                            "Durchsatz Broker", ("--window", "--workers")),
+    "mqtt_stresstest": Mode("modes.mqtt_stresstest:run_mqtt_stresstest",
+                            "Stufenweise steigende Rate gegen den Broker", ("--workers", "--drain") + PROFILE),
+    "mqtt_loadtest": Mode("modes.mqtt_loadtest:run_mqtt_loadtest",
+                          "Dauerlast gegen den Broker", PROFILE),
+    "habapp_throughput": Mode("modes.habapp_throughput:run_habapp_throughput",
+                              "Durchsatz über HABApp", ("--window",)),
+    "habapp_stresstest": Mode("modes.habapp_stresstest:run_habapp_stresstest",
+                              "Stufenweise steigende Rate über HABApp", ("--drain",) + PROFILE),
+    "habapp_loadtest": Mode("modes.habapp_loadtest:run_habapp_loadtest",
+                            "Dauerlast über HABApp", ("--window",) + PROFILE),
+    "openhab_throughput": Mode("modes.openhab_throughput:run_openhab_throughput",
+                               "Durchsatz über HABApp und openHAB", ("--window",)),
+    "openhab_stresstest": Mode("modes.openhab_stresstest:run_openhab_stresstest",
+                               "Stufenweise steigende Rate über openHAB", ("--drain",) + PROFILE),
+    "openhab_loadtest": Mode("modes.openhab_loadtest:run_openhab_loadtest",
+                             "Dauerlast über openHAB", ("--window",) + PROFILE),
+    "mqtt_devices": Mode("modes.mqtt_devices:run_mqtt_devices",
+                         "Viele Geräte mit je eigener Verbindung",
+                         ("--devices", "--device_rate", "--rate_spread", "--connect_concurrency")),
+    "payload_benchmark": Mode("modes.payload_benchmark:run_payload_benchmark",
+                              "Payload-Erzeugung vorher/nachher (ohne Broker)", ("--iterations",)),
+    "sweep": Mode("modes.sweep:run_sweep",
+                  "Parameter-Raster über beliebige Modi mit Abkühlpause und Checkpoint",
+                  ("--grid", "--cooldown", "--sweep_name")),
+    "traffic_record": Mode("modes.traffic_record:run_traffic_record",
+                           "Broker-Verkehr (Topic, QoS, Payload, Zeit) binär mitschneiden", ("--record_topics",)),
+    "traffic_replay": Mode("modes.traffic_replay:run_traffic_replay",
+                           "Mitschnitt mit 1×, N× oder maximaler Geschwindigkeit wiedergeben",
+                           ("--log", "--speed", "--connections", "--topic_prefix") + PROFILE),
+    "capacity_search": Mode("modes.capacity_search:run_capacity_search",
+                            "Höchste Rate unter einem SLO (Verlust, p99) je Ziel, mit Konfidenzintervall",
+                            ("--targets", "--max_loss", "--max_p99", "--trial_seconds", "--start_rate",
+                             "--max_rate", "--tolerance", "--repeats", "--drain")),
+    "latency_under_load": Mode("modes.latency_under_load:run_latency_under_load",
+                               "Probe-Latenz je Laststufe bei gleichzeitiger Hintergrundlast",
+                               ("--targets", "--load_target", "--load_rates", "--probe_rate", "--workers",
+                                "--drain") + PROFILE),
+}
+
+
+def add_mode_arguments(parser, name: str):
+    """Registriert die Argumente des Modus name in einer eigenen Gruppe."""
+    mode = MODES.get(name)
+    if not mode or not mode.options:
+        return
+    group = parser.add_argument_group(f"Optionen für {name}")
+    for flag in mode.options:
+        group.add_argument(flag, **OPTIONS[flag])
+
+
+def mode_defaults(name: str):
+    """Standardwerte der modus-spezifischen Argumente als {dest: Wert} (für Aufrufe ohne main.py)."""
+    defaults = {}
+    for flag in MODES[name].options if name in MODES else ():
+        spec = OPTIONS[flag]
+        defaults[flag.lstrip("-")] = spec.get("default", False if spec.get("action") == "store_true" else None)
+    return defaults
+
+
+def duration_seconds(name: str, duration):
+    """--duration des Modus name in Sekunden (None bleibt None)."""
+    if duration is None:
+        return None
+    return duration * 60 if name in DURATION_MINUTES else duration
+
+
+def load_mode(name: str):
+    """Importiert erst jetzt das Modul des Modus und liefert dessen run-Funktion (oder None)."""
+    mode = MODES.get(name)
+    if not mode:
+        return None
+    module, function = mode.target.split(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def print_modes():
+    width = max(len(name) for name in MODES)
+    for name, mode in MODES.items():
+        options = " ".join(mode.options)
+        print(f"  {name:<{width}}  {mode.help}" + (f"  [{options}]" if options else ""))
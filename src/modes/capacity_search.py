@@ -0,0 +1,263 @@
+# modes/capacity_search.py
+# Sucht je Ziel die höchste Rate, bei der das SLO noch hält (Verlust ≤ --max_loss %,
+# p99 ≤ --max_p99 ms). Statt die Wartezeit wie die Stresstests stur zu halbieren:
+#   1. Klammern: ab --start_rate verdoppeln bis zum ersten Fehlschlag (dort endet die Rampe)
+#   2. Bisektion zwischen letzter bestandener und erster gescheiterter Rate bis auf --tolerance
+#   3. --repeats unabhängige Suchen je Ziel, jede wieder ab --start_rate;
+#      Kapazität = Mittelwert mit 95-%-Konfidenzintervall (t-Verteilung)
+# Gemessen wird mit Binär-Probes über die Echo-Topics, die Responder müssen also laufen:
+#   python3 main.py --mode capacity_search --qos 1 --targets mqtt,habapp --max_p99 50
+import math, os, time
+from datetime import datetime
+import paho.mqtt.client as mqtt
+from utils import RateScheduler, InflightTracker, LatencyHistogram
+from utils import PROBE_HEADER, PROBE_SUFFIX, encode_probe, decode_probe
+from results_db import record_run
+
+# Ziel → (Request-Topic, Antwort-Topic); None = args.topic, der Broker spiegelt selbst
+TARGETS = {
+    "mqtt": (None, None),
+    "habapp": ("/latency/habapp/echo", "/latency/habapp/echo/response"),
+    "openhab": ("/latency/openhab/command", "/latency/openhab/state"),
+}
+MIN_RATE = 1.0
+RATE_SHORTFALL = 0.95  # Generator unter 95 % der Soll-Rate → Versuch zählt als gescheitert
+
+
+class NoResponder(Exception):
+    """Erster Versuch eines Ziels ohne jede Antwort – weiter nach unten zu suchen ist sinnlos."""
+
+
+# zweiseitige 95-%-Quantile der t-Verteilung nach Freiheitsgraden
+T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+       10: 2.228, 15: 2.131, 20: 2.086, 30: 2.042}
+
+
+def confidence_interval(values):
+    """(Mittelwert, halbe Breite des 95-%-Intervalls); halbe Breite None bei weniger als zwei Werten."""
+    n = len(values)
+    if n == 0:
+        return None, None
+    mean = sum(values) / n
+    if n < 2:
+        return mean, None
+    sd = math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+    t = T95[max(k for k in T95 if k <= n - 1)]
+    return mean, t * sd / math.sqrt(n)
+
+
+def search_capacity(trial, start, factor=2.0, tolerance=0.05, min_rate=MIN_RATE, max_rate=1e6):
+    """
+    Liefert (höchste bestandene Rate, niedrigste gescheiterte Rate); trial(rate) → bool.
+    Fehlt eine Grenze, ist die Kapazität < min_rate (erste None) bzw. ≥ max_rate (zweite None).
+    """
+    lo = hi = None
+    rate = min(max(start, min_rate), max_rate)
+    while lo is None or hi is None:
+        if trial(rate):
+            lo = rate
+            if hi is None:
+                if rate >= max_rate:
+                    break
+                rate = min(rate * factor, max_rate)
+        else:
+            hi = rate
+            if lo is None:
+                if rate <= min_rate:
+                    break
+                rate = max(rate / factor, min_rate)
+    while lo is not None and hi is not None and hi - lo > tolerance * lo:
+        mid = (lo + hi) / 2
+        if trial(mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo, hi
+
+
+class ProbeLink:
+    """Eine Verbindung je Ziel über alle Versuche; die Sequenznummern laufen durch."""
+
+    def __init__(self, BROKER_IP, request, response, qos):
+        self.request, self.qos = request, qos
+        self.seq = 0
+        self.inflight = self.histogram = None
+        self.last_msg = 0.0
+        self.client = mqtt.Client()
+        self.client.on_message = self._on_message
+        self.client.connect(BROKER_IP, 1883)
+        self.client.subscribe(response, qos=qos)
+        self.client.loop_start()
+
+    def _on_message(self, client, userdata, msg):
+        self.last_msg = time.monotonic()
+        probe = decode_probe(msg.payload)
+        inflight, histogram = self.inflight, self.histogram
+        if probe is None or inflight is None:
+            return
+        latency_ms = inflight.ack(probe[1])
+        if latency_ms is not None:
+            histogram.record(latency_ms)
+
+    def settle(self, quiet=0.5, limit=10.0):
+        """Wartet, bis der Rückstau des vorigen Versuchs abgeflossen ist (quiet s ohne Nachricht)."""
+        deadline = time.monotonic() + limit
+        while time.monotonic() - self.last_msg < quiet and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def trial(self, rate, seconds, pad_len, drain):
+        self.settle()
+        inflight = InflightTracker.for_rate(rate, seconds + drain)
+        histogram = LatencyHistogram()
+        self.inflight, self.histogram = inflight, histogram
+        scheduler = RateScheduler(rate)
+        while True:
+            planned = scheduler.wait()
+            if planned - scheduler.t0_wall >= seconds:
+                break
+            self.seq += 1
+            inflight.send(self.seq, scheduler.perf_ns(planned))
+            # Tag wechselt ON/OFF, damit sich der openHAB-Zustand bei jedem Command ändert
+            self.client.publish(self.request, encode_probe(self.seq, int(planned * 1e9), pad_len, tag=self.seq & 1),
+                                qos=self.qos)
+        send_s = scheduler.elapsed()
+        deadline = time.monotonic() + drain
+        while inflight.in_flight() > 0 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.inflight = None
+        inflight.finish()
+        summary = histogram.summary()
+        return {
+            "Rate": rate,
+            "Ist-Rate": inflight.sent / send_s if send_s > 0 else 0.0,
+            "Gesendet": inflight.sent,
+            "Empfangen": inflight.received,
+            "Verlust%": inflight.lost / inflight.sent * 100 if inflight.sent else 0.0,
+            "p50": summary["p50"],
+            "p90": summary["p90"],
+            "p99": summary["p99"],
+            "Max": summary["Max"],
+            "Max. Verzug (ms)": scheduler.stats()["Max. Verzug (ms)"],
+        }
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def run_capacity_search(args, BROKER_IP):
+    targets = [t.strip() for t in (getattr(args, "targets", None) or "mqtt,habapp,openhab").split(",") if t.strip()]
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        print(f"❌ Unbekannte Ziele: {', '.join(unknown)} (möglich: {', '.join(TARGETS)})")
+        return None
+    max_loss = getattr(args, "max_loss", 1.0)
+    max_p99 = getattr(args, "max_p99", 100.0)
+    seconds = getattr(args, "trial_seconds", 10.0)
+    start_rate = getattr(args, "start_rate", 100.0)
+    max_rate = getattr(args, "max_rate", 50000.0)
+    tolerance = getattr(args, "tolerance", 0.05)
+    repeats = max(1, getattr(args, "repeats", 3))
+    # Antworten bis p99-Grenze plus Reserve abwarten, sonst zählen langsame Antworten als Verlust
+    drain = max(getattr(args, "drain", 2.0), 2 * max_p99 / 1000)
+    pad_len = max(0, args.payload_size - PROBE_HEADER.size)
+
+    print(f"\n🎯 Kapazitätssuche QoS {args.qos}: SLO Verlust ≤ {max_loss} %, p99 ≤ {max_p99} ms, "
+          f"{seconds} s je Versuch, {repeats} Suche(n) je Ziel")
+
+    trials, capacities = [], {}
+    for name in targets:
+        request, response = TARGETS[name]
+        request = (request or args.topic) + PROBE_SUFFIX
+        response = (response or args.topic) + PROBE_SUFFIX
+        link = ProbeLink(BROKER_IP, request, response, args.qos)
+        found, brackets = [], []
+        try:
+            for search in range(1, repeats + 1):
+                def trial(rate):
+                    result = link.trial(rate, seconds, pad_len, drain)
+                    reasons = []
+                    if result["Empfangen"] == 0:
+                        if not any(t["Ziel"] == name and t["Empfangen"] for t in trials):
+                            raise NoResponder(rate)
+                        reasons.append("keine Antwort")
+                    elif result["Verlust%"] > max_loss:
+                        reasons.append(f"Verlust {result['Verlust%']:.2f} %")
+                    if result["Empfangen"] and result["p99"] > max_p99:
+                        reasons.append(f"p99 {result['p99']:.1f} ms")
+                    if result["Ist-Rate"] < RATE_SHORTFALL * rate:
+                        reasons.append(f"Generator nur {result['Ist-Rate']:.0f} msg/s")
+                    passed = not reasons
+                    trials.append({"Stufe": len(trials) + 1, "Ziel": name, "Suche": search, **result,
+                                   "Bestanden": passed, "Grund": ", ".join(reasons) or "ok"})
+                    print(f"  {'✅' if passed else '❌'} [{name} #{search}] {rate:.0f} msg/s → "
+                          f"{result['Ist-Rate']:.0f} msg/s, Verlust {result['Verlust%']:.2f} %, "
+                          f"p99 {result['p99']:.2f} ms" + ("" if passed else f" ({', '.join(reasons)})"))
+                    return passed
+
+                # Jede Suche startet neu bei --start_rate: nur unabhängige Einzelwerte tragen das t-Intervall
+                print(f"\n🔎 {name}, Suche {search}/{repeats}: Start {start_rate:.0f} msg/s")
+                try:
+                    lo, hi = search_capacity(trial, start_rate, 2.0, tolerance, MIN_RATE, max_rate)
+                except NoResponder:
+                    print(f"❌ {name}: keine einzige Antwort auf {response} – läuft der Responder? Ziel übersprungen")
+                    break
+                brackets.append((lo, hi))
+                if lo is None:
+                    print(f"❌ {name}: SLO schon bei {MIN_RATE:.0f} msg/s verletzt – Suche abgebrochen")
+                    break
+                found.append(lo)
+                if hi is None:
+                    print(f"⚠️ {name}: SLO hält noch bei --max_rate {max_rate:.0f} msg/s – Kapazität liegt höher")
+        finally:
+            link.close()
+
+        mean, half = confidence_interval(found)
+        capacities[name] = {"Kapazität": mean, "KI95": half, "Einzelwerte": found, "Klammern": brackets,
+                            "Versuche": sum(1 for t in trials if t["Ziel"] == name)}
+        if mean is not None:
+            print(f"🏁 {name}: {mean:.0f} msg/s" + (f" ± {half:.0f} (95 %)" if half is not None else ""))
+
+    md_file = _write_capacity_report(args, targets, capacities, trials, max_loss, max_p99, seconds, tolerance)
+    metrics = {}
+    for name, c in capacities.items():
+        metrics[f"{name} Kapazität"] = c["Kapazität"]
+        metrics[f"{name} KI95"] = c["KI95"]
+    metrics["Versuche"] = len(trials)
+    record_run("capacity_search", args, metrics, stages=trials, files={"Markdown": md_file}, qos=args.qos)
+    return capacities
+
+
+def _write_capacity_report(args, targets, capacities, trials, max_loss, max_p99, seconds, tolerance):
+    os.makedirs("latency_markdowns", exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    md_file = os.path.join("latency_markdowns", f"capacity_qos{args.qos}_{ts}.md")
+
+    def rate(v):
+        return "–" if v is None else f"{v:.0f}"
+
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(f"# Kapazitätssuche QoS {args.qos}\n\n")
+        f.write(f"- SLO: Verlust ≤ {max_loss} %, p99 ≤ {max_p99} ms\n")
+        f.write(f"- {seconds} s je Versuch, Payload {args.payload_size} Bytes, Toleranz {tolerance * 100:.0f} %\n")
+        f.write("- Kapazität = höchste bestandene Rate je Suche, Intervall = 95 % (t-Verteilung)\n\n")
+        f.write("| Ziel | Kapazität (msg/s) | 95-%-KI | Einzelwerte | Klammern [bestanden, gescheitert] | Versuche |\n")
+        f.write("|---|---|---|---|---|---|\n")
+        for name in targets:
+            c = capacities[name]
+            ci = "–" if c["KI95"] is None else f"{c['Kapazität'] - c['KI95']:.0f} – {c['Kapazität'] + c['KI95']:.0f}"
+            brackets = ", ".join(f"[{rate(lo)}, {rate(hi)}]" for lo, hi in c["Klammern"])
+            f.write(f"| {name} | {rate(c['Kapazität'])} | {ci} | {', '.join(rate(v) for v in c['Einzelwerte']) or '–'} "
+                    f"| {brackets} | {c['Versuche']} |\n")
+
+        f.write("\n## Versuche\n\n")
+        f.write("| # | Ziel | Suche | Soll (msg/s) | Ist (msg/s) | Gesendet | Empfangen | Verlust (%) "
+                "| p50 (ms) | p99 (ms) | Ergebnis |\n")
+        f.write("|---|---|---|---|---|---|---|---|---|---|---|\n")
+        for t in trials:
+            f.write(f"| {t['Stufe']} | {t['Ziel']} | {t['Suche']} | {t['Rate']:.0f} | {t['Ist-Rate']:.0f} "
+                    f"| {t['Gesendet']} | {t['Empfangen']} | {t['Verlust%']:.2f} | {t['p50']:.2f} "
+                    f"| {t['p99']:.2f} | {'✅' if t['Bestanden'] else '❌ ' + t['Grund']} |\n")
+
+    print(f"\n📝 Kapazitätsbericht gespeichert unter: {md_file}")
+    return md_file
@@ -1,53 +1,122 @@
 # modes/habapp_echo.py
 import time, json, paho.mqtt.client as mqtt
-from utils import save_latency_csv, save_summary
+from utils import LatencyLogWriter, save_summary, RateScheduler, target_rate, LatencyHistogram
+from utils import InflightTracker, probe_seq
+from utils import PROBE_HEADER, PROBE_SUFFIX, encode_probe, decode_probe, use_binary_probe
 from plot_latency import plot_latency
+from resource_monitor import sampler_from_args, GeneratorMonitor
+from clock_sync import ClockSync, finish_clock_sync
+from columnar_log import ColumnarWriter, ColumnarLog
 
 def run_habapp_echo(args, BROKER_IP):
-    latency_data = []
-    sent_timestamps = {}
+    latency_log = LatencyLogWriter(args.mode)  # streamt (Sekunde, Latenz) auf die Platte
+    columns = ColumnarWriter(args.mode, hops=("habapp_ns",))  # pro Nachricht, binär
     total_sent = total_received = 0
+    histogram = LatencyHistogram()  # Perzentile ohne alle Rohwerte sortieren zu müssen
+    # Binärformat: Topics mit Suffix, der Responder antwortet im selben Format
+    binary = use_binary_probe(args)
+    suffix = PROBE_SUFFIX if binary else ""
+    pad_len = max(0, args.payload_size - PROBE_HEADER.size)
+    # --clock_sync: Einweg-Latenzen über den geschätzten Uhrenversatz zum HABApp-Host
+    # (ausgewertet nach dem Lauf aus der habapp_ns-Spalte des Spaltenlogs)
+    clock = ClockSync(BROKER_IP).start() if getattr(args, "clock_sync", False) else None
 
     def on_message(client, userdata, msg):
         nonlocal total_received
         try:
-            payload = json.loads(msg.payload.decode())
-            msg_id = payload.get("id")
-            if msg_id and msg_id in sent_timestamps:
-                latency = (time.time() - sent_timestamps.pop(msg_id)) * 1000
+            if binary:
+                probe = decode_probe(msg.payload)
+                seq = probe[1] if probe else None
+                stamps = (probe[2] / 1e9, probe[3][0] / 1e9) if probe and probe[3] else None
+            else:
+                payload = json.loads(msg.payload.decode())
+                seq = probe_seq(payload.get("id"))
+                stamps = (payload.get("original"), payload.get("habapp_time"))
+            latency = inflight.ack(seq) if seq is not None else None
+            if latency is not None:
+                t_recv_ns = time.time_ns()
+                habapp_ns = int(stamps[1] * 1e9) if stamps and isinstance(stamps[1], (int, float)) else 0
+                columns.append(seq, t_recv_ns - int(latency * 1e6), t_recv_ns, hops=(habapp_ns,))
+                msg_id = f"msg_{seq}"
                 duration = time.time() - start_time
-                latency_data.append((duration, latency))
+                latency_log.append(duration, latency)
+                histogram.record(latency)
                 print(f"📨 [Echo] {msg_id}: {latency:.2f} ms")
                 total_received += 1
             else:
-                print(f"⚠️ [Echo] Ignoriert: Keine passende ID für {msg.payload.decode()}")
+                print(f"⚠️ [Echo] Ignoriert: Unbekannte, verspätete oder doppelte Antwort {msg.payload!r}")
         except Exception as e:
             print("Fehler beim Verarbeiten der Antwort:", e)
 
+    # vor loop_start(), damit on_message nie auf ein noch nicht zugewiesenes inflight trifft
+    scheduler = RateScheduler(target_rate(args), catch_up=not getattr(args, "skip_missed", False))
+    inflight = InflightTracker.for_rate(scheduler.rate, getattr(args, "inflight_timeout", 30.0))
+    start_time = scheduler.t0_wall
     client = mqtt.Client()
     client.on_message = on_message
     client.connect(BROKER_IP, 1883)
-    client.subscribe("/latency/habapp/echo/response", qos=0)
+    client.subscribe("/latency/habapp/echo/response" + suffix, qos=0)
     client.loop_start()
 
-    start_time = time.time()
+    sampler = sampler_from_args(args, BROKER_IP).start()
+    scheduler.start()
+    start_time = scheduler.t0_wall
     i = 0
 
+    gen = GeneratorMonitor(client).start()
     while True:
-        now = time.time()
-        if now - start_time >= args.duration * 60:
+        # Latenz ab Soll-Zeitpunkt messen (Coordinated-Omission-Korrektur)
+        planned = scheduler.wait()
+        if planned - start_time >= args.duration * 60:
             break
         i += 1
         msg_id = f"msg_{i}"
-        payload = json.dumps({"id": msg_id, "data": now})
-        print(f"➡️ [Echo] Gesendet: {payload}")
-        client.publish("/latency/habapp/echo", payload, qos=args.qos)
-        sent_timestamps[msg_id] = now
+        if binary:
+            payload = encode_probe(i, int(planned * 1e9), pad_len)
+            print(f"➡️ [Echo] Gesendet: {msg_id} (binär, {len(payload)} B)")
+        else:
+            payload = json.dumps({"id": msg_id, "data": planned})
+            print(f"➡️ [Echo] Gesendet: {payload}")
+        inflight.send(i, scheduler.perf_ns(planned))
+        t_pub = time.perf_counter_ns()
+        client.publish("/latency/habapp/echo" + suffix, payload, qos=args.qos)
+        gen.publish_done(t_pub)
         total_sent += 1
-        time.sleep(args.delay)
 
+    gen_stats = gen.stop().stats(scheduler.stats())
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Latenzen enthalten Verzug des Clients: {gen_stats['Grund']}")
     time.sleep(5)
     client.loop_stop()
-    path = save_latency_csv(latency_data, args.mode)
-    save_summary(latency_data, total_sent, total_received, filepath="habapp_echo", mode="habapp_echo", qos=args.qos)
-    plot_latency(path, output_folder="latency_plots")
\ No newline at end of file
+    inflight.finish()
+    sampler.stop()
+
+    path = latency_log.close()
+    columns_path = columns.close()
+
+    one_way = None
+    clock_stats = finish_clock_sync(clock)  # None ohne --clock_sync oder ohne beantwortete Probe
+    if clock_stats:
+        # Versatz mit allen Proben (vor und während des Laufs) inkl. Drift auf die Client-Uhr umrechnen;
+        # das Spaltenlog wird blockweise gelesen, nicht als Liste aller Nachrichten gehalten
+        one_way = {"Hinweg": LatencyHistogram(), "Rückweg": LatencyHistogram()}
+        log = ColumnarLog(columns_path)
+        for chunk in log.chunks(["send_ns", "habapp_ns", "recv_ns"]):
+            for send_ns, habapp_ns, recv_ns in zip(*chunk):
+                if not habapp_ns:  # Antwort ohne habapp_time
+                    continue
+                t_send = send_ns / 1e9
+                t_habapp = clock.to_client(habapp_ns / 1e9, t_send)
+                one_way["Hinweg"].record((t_habapp - t_send) * 1000)
+                one_way["Rückweg"].record((recv_ns / 1e9 - t_habapp) * 1000)
+        log.close()
+        bound = clock_stats["Fehlergrenze (ms)"]
+        for name, hist in one_way.items():
+            print(f"   {name}: p50 {hist.percentile(50):.2f} ms | p99 {hist.percentile(99):.2f} ms (± {bound:.2f} ms)")
+    save_summary([], total_sent, total_received, duration=latency_log.last_ts,
+                 filepath="habapp_echo", mode="habapp_echo", qos=args.qos,
+                 scheduler_stats=scheduler.stats(), histogram=histogram,
+                 inflight_stats=inflight.stats(), resources=sampler,
+                 clock_stats=clock_stats, one_way=one_way, columns=columns_path, args=args,
+                 generator_stats=gen_stats)
+    plot_latency(columns_path, output_folder="latency_plots")
\ No newline at end of file
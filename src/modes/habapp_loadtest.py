@@ -1,19 +1,24 @@
 import time, threading, paho.mqtt.client as mqtt
-from utils import generate_payload
+from utils import PayloadFactory, target_rate, PublishWindow
+from utils import SequenceTracker, write_sequence_lines
+from results_db import record_run
+from load_profiles import scheduler_from_args, curve_from_args
+from resource_monitor import sampler_from_args, GeneratorMonitor, write_generator_lines
 from datetime import datetime
 import os
-import psutil
 
 def run_habapp_loadtest(args, BROKER_IP):
+    curve = curve_from_args(args)  # Soll/Gesendet/Empfangen je Sekunde, nur mit --profile
     total_sent = 0
-    total_received = 0
     interval = getattr(args, "interval", 10)  # Standard: alle 10 Sekunden Zwischenwerte
     qos = getattr(args, "qos", 1)             # Standard QoS 1
+    sequences = SequenceTracker()
 
     # --- Subscriber ---
     def on_message(client, userdata, msg):
-        nonlocal total_received
-        total_received += 1
+        sequences.receive(msg.payload)
+        if curve:
+            curve.receive()
 
     sub_client = mqtt.Client(clean_session=True)
     sub_client.on_message = on_message
@@ -30,42 +35,44 @@ def run_habapp_loadtest(args, BROKER_IP):
     pub_client = mqtt.Client(clean_session=True)
     pub_client.connect(BROKER_IP, 1883)
     pub_client.loop_start()
+    window = PublishWindow(pub_client, getattr(args, "window", 1))
 
-    delay = args.delay
+    scheduler = scheduler_from_args(args, target_rate(args), args.duration, curve)
     start_time = time.time()
     next_report = start_time + interval
-    next_monitor = start_time + 60   # erste Minute
+    sampler = sampler_from_args(args, BROKER_IP).start()  # Systemmonitoring im eigenen Thread
 
     # Ergebnisse für Zwischenwerte
     timeline = []
-    cpu_series = []
-    ram_series = []
-    timestamps = []
 
+    payloads = PayloadFactory(args.payload_size, "habapp_loadtest_msg")
+    gen = GeneratorMonitor(pub_client).start()
     while time.time() - start_time < args.duration:
-        msg_id = f"habapp_loadtest_msg{total_sent}"
-        payload = generate_payload(args.payload_size, msg_id)
+        scheduler.wait()
+        payload = payloads.make(total_sent)
 
-        # Publish mit ACK-Wartezeit
-        info = pub_client.publish("/loadtest/habapp/input", payload, qos=qos)
-        info.wait_for_publish()   # blockiert bis Broker bestätigt hat
+        # Publish mit begrenztem In-Flight-Fenster
+        t_pub = time.perf_counter_ns()
+        window.publish("/loadtest/habapp/input", payload, qos)
+        gen.publish_done(t_pub)
 
         total_sent += 1
-        if delay > 0:
-            time.sleep(delay)
 
         now = time.time()
 
         # Zwischenwerte alle `interval` Sekunden
         if now >= next_report:
             elapsed = now - start_time
+            total_received = sequences.stats()["Eindeutig"]
             send_rate = total_sent / elapsed if elapsed > 0 else 0
             recv_rate = total_received / elapsed if elapsed > 0 else 0
             loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
+            seq_delta = sequences.interval()
 
             print(f"⏱ Zwischenstand nach {elapsed:.1f}s: "
                   f"Gesendet={total_sent}, Empfangen={total_received}, "
-                  f"Verlust={loss_pct:.2f}%")
+                  f"Verlust={loss_pct:.2f}%, Duplikate={seq_delta['Duplikate']}, "
+                  f"Außer Reihe={seq_delta['Außer Reihe']}, Lücken={seq_delta['Lücken']}")
 
             timeline.append({
                 "Zeit_s": round(elapsed, 1),
@@ -74,19 +81,22 @@ def run_habapp_loadtest(args, BROKER_IP):
                 "Send-Rate": send_rate,
                 "Recv-Rate": recv_rate,
                 "Verlust%": loss_pct,
+                "Duplikate": seq_delta["Duplikate"],
+                "Außer Reihe": seq_delta["Außer Reihe"],
+                "Lücken": seq_delta["Lücken"],
             })
 
             next_report += interval
 
-        # Systemmonitoring pro Minute
-        if now >= next_monitor:
-            cpu_usage = psutil.cpu_percent(interval=None)
-            ram_usage = psutil.virtual_memory().percent
-            cpu_series.append(cpu_usage)
-            ram_series.append(ram_usage)
-            timestamps.append(int((now - start_time) // 60))
-            print(f"[Monitoring] Minute {timestamps[-1]}: CPU={cpu_usage:.1f}% | RAM={ram_usage:.1f}%")
-            next_monitor += 60
+    gen_stats = gen.stop().stats(scheduler.stats(), window.stats())
+    window.drain()
+    win = window.stats()
+    seq_stats = sequences.stats()
+    total_received = seq_stats["Eindeutig"]  # Duplikate/Redeliveries zählen nicht als empfangen
+    sampler.stop()
+    resource_csv = sampler.save_csv(f"habapp_loadtest_qos{qos}")
+    curve_csv = curve.save_csv(f"habapp_loadtest_qos{qos}") if curve else None
+    minutes = sampler.per_minute()
 
     duration = time.time() - start_time
     send_rate = total_sent / duration if duration > 0 else 0
@@ -95,6 +105,8 @@ def run_habapp_loadtest(args, BROKER_IP):
 
     pub_client.loop_stop()
     sub_client.loop_stop()
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Lastkurve ist durch den Client begrenzt: {gen_stats['Grund']}")
 
     # --- Markdown speichern ---
     os.makedirs("latency_markdowns", exist_ok=True)
@@ -108,21 +120,53 @@ def run_habapp_loadtest(args, BROKER_IP):
         f.write(f"- Empfangen: {total_received}\n")
         f.write(f"- Send-Rate: {send_rate:.2f} msg/s\n")
         f.write(f"- Empfangsrate: {recv_rate:.2f} msg/s\n")
-        f.write(f"- Verlustquote: {loss_pct:.2f}%\n\n")
+        f.write(f"- Verlustquote: {loss_pct:.2f}%\n")
+        write_sequence_lines(f, seq_stats)
+        f.write(f"- Soll-Rate: {scheduler.rate:.2f} msg/s\n")
+        f.write(f"- Verspätete Slots: {scheduler.late}\n")
+        f.write(f"- Verpasste Slots: {scheduler.missed}\n")
+        f.write(f"- Max. Verzug: {scheduler.max_lag * 1000:.2f} ms\n")
+        if qos > 0:
+            f.write(f"- In-Flight-Fenster: {win['Window']} (max. {win['Max. In-Flight']})\n")
+            f.write(f"- Ack-Latenz Ø: {win['Ack Ø (ms)']:.2f} ms | Max: {win['Ack Max (ms)']:.2f} ms\n")
+        write_generator_lines(f, gen_stats, gen.thread_cpu)
+        f.write("\n")
 
         if timeline:
             f.write("## Zwischenwerte\n\n")
-            f.write("| Zeit (s) | Gesendet | Empfangen | Send-Rate (msg/s) | Empfangsrate (msg/s) | Verlust% |\n")
-            f.write("|----------|----------|-----------|-------------------|----------------------|----------|\n")
+            f.write("| Zeit (s) | Gesendet | Empfangen | Send-Rate (msg/s) | Empfangsrate (msg/s) | Verlust% | "
+                    "Duplikate | Außer Reihe | Lücken |\n")
+            f.write("|----------|----------|-----------|-------------------|----------------------|----------|"
+                    "-----------|-------------|--------|\n")
             for t in timeline:
                 f.write(f"| {t['Zeit_s']} | {t['Gesendet']} | {t['Empfangen']} | "
-                        f"{t['Send-Rate']:.2f} | {t['Recv-Rate']:.2f} | {t['Verlust%']:.2f}% |\n")
+                        f"{t['Send-Rate']:.2f} | {t['Recv-Rate']:.2f} | {t['Verlust%']:.2f}% | "
+                        f"{t['Duplikate']} | {t['Außer Reihe']} | {t['Lücken']} |\n")
 
-        if cpu_series:
+        if minutes:
             f.write("\n## Systemmonitoring pro Minute\n\n")
             f.write("| Minute | CPU% | RAM% |\n")
             f.write("|--------|------|------|\n")
-            for i, cpu in enumerate(cpu_series):
-                f.write(f"| {timestamps[i]} | {cpu:.1f} | {ram_series[i]:.1f} |\n")
-
-    print(f"\n📝 HABApp-Lasttest gespeichert unter: {md_file}")
\ No newline at end of file
+            for minute, cpu, ram in minutes:
+                f.write(f"| {minute} | {cpu:.1f} | {ram:.1f} |\n")
+
+        if curve:
+            curve.write_markdown(f, curve_csv, args.profile)
+        sampler.write_markdown(f, resource_csv)
+
+    print(f"\n📝 HABApp-Lasttest gespeichert unter: {md_file}")
+    record_run("habapp_loadtest", args, {
+        "Dauer_s": duration,
+        "Gesendet": total_sent,
+        "Empfangen": total_received,
+        "Send-Rate": send_rate,
+        "Recv-Rate": recv_rate,
+        "Verlust%": loss_pct,
+        **seq_stats,
+        "CPU%": sampler.mean("CPU%"),
+        "RAM%": sampler.mean("RAM%"),
+        "Soll-Rate": scheduler.rate,
+        "Verpasst": scheduler.missed,
+        "Generator gesättigt": gen_stats["Generator gesättigt"],
+        **(curve.stats() if curve else {}),
+    }, files={"Markdown": md_file, "Ressourcen": resource_csv, "Lastverlauf": curve_csv}, qos=qos)
\ No newline at end of file
@@ -1,22 +1,23 @@
 # modes/habapp_throughput.py
 import time, threading, paho.mqtt.client as mqtt
-from utils import generate_payload
+from utils import PayloadFactory, RateScheduler, target_rate, PublishWindow
+from utils import SequenceTracker, write_sequence_lines
+from results_db import record_run
+from resource_monitor import sampler_from_args, GeneratorMonitor, write_generator_lines
 from datetime import datetime
 import os
-import psutil
 
 def run_habapp_throughput(args, BROKER_IP):
     qos = getattr(args, "qos", 1)  # Standard: QoS 1
     print(f"\n🚀 Starte HABApp-Durchsatztest mit QoS {qos} …")
 
     total_sent = 0
-    total_received = 0
     start_time = time.time()
+    sequences = SequenceTracker()
 
     # --- Subscriber ---
     def on_message(client, userdata, msg):
-        nonlocal total_received
-        total_received += 1
+        sequences.receive(msg.payload)
 
     sub_client = mqtt.Client()
     sub_client.on_message = on_message
@@ -33,45 +34,54 @@ def run_habapp_throughput(args, BROKER_IP):
     pub_client = mqtt.Client()
     pub_client.connect(BROKER_IP, 1883)
     pub_client.loop_start()
+    window = PublishWindow(pub_client, getattr(args, "window", 1))
 
-    # --- Monitoring ---
-    cpu_samples = []
-    ram_samples = []
+    # --- Monitoring (eigener Thread, festes Intervall) ---
+    sampler = sampler_from_args(args, BROKER_IP).start()
 
+    scheduler = RateScheduler(target_rate(args), catch_up=not getattr(args, "skip_missed", False))
+
+    payloads = PayloadFactory(args.payload_size, f"habapp_qos{qos}_msg")
+    gen = GeneratorMonitor(pub_client).start()
     while time.time() - start_time < args.duration * 60:
-        msg_id = f"habapp_qos{qos}_msg{total_sent}"
-        payload = generate_payload(args.payload_size, msg_id)
-        info = pub_client.publish("/throughput/habapp/input", payload, qos=qos)
-        if qos > 0:
-            info.wait_for_publish()
+        scheduler.wait()
+        payload = payloads.make(total_sent)
+        t_pub = time.perf_counter_ns()
+        window.publish("/throughput/habapp/input", payload, qos)  # blockiert nur bei vollem Fenster
+        gen.publish_done(t_pub)
 
         total_sent += 1
-        if args.delay > 0:
-            time.sleep(args.delay)
-
-        # alle ~5 Sekunden CPU/RAM loggen
-        if total_sent % int(max(1, 5 / max(args.delay, 0.001))) == 0:
-            cpu_usage = psutil.cpu_percent(interval=None)
-            ram_usage = psutil.virtual_memory().percent
-            cpu_samples.append(cpu_usage)
-            ram_samples.append(ram_usage)
 
+    gen_stats = gen.stop().stats(scheduler.stats(), window.stats())
+    window.drain()
+    win = window.stats()
     pub_client.loop_stop()
     sub_client.loop_stop()
 
     duration = time.time() - start_time
+    seq_stats = sequences.stats()
+    total_received = seq_stats["Eindeutig"]  # Duplikate/Redeliveries zählen nicht als empfangen
     send_rate = total_sent / duration if duration > 0 else 0
     recv_rate = total_received / duration if duration > 0 else 0
     loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
 
-    avg_cpu = sum(cpu_samples) / len(cpu_samples) if cpu_samples else 0
-    avg_ram = sum(ram_samples) / len(ram_samples) if ram_samples else 0
+    sampler.stop()
+    avg_cpu = sampler.mean("CPU%")
+    avg_ram = sampler.mean("RAM%")
+    resource_csv = sampler.save_csv(f"habapp_throughput_qos{qos}")
 
     print(f"\n📊 QoS {qos} abgeschlossen:")
     print(f"   Gesendet:   {total_sent} → {send_rate:.2f} msg/s")
     print(f"   Empfangen:  {total_received} → {recv_rate:.2f} msg/s")
     print(f"   Verlust:    {total_sent - total_received} ({loss_pct:.2f}%)")
+    print(f"   Duplikate: {seq_stats['Duplikate']} | Außer der Reihe: {seq_stats['Außer Reihe']} | Lücken: {seq_stats['Lücken']}")
     print(f"   CPU: {avg_cpu:.1f}% | RAM: {avg_ram:.1f}%")
+    print(f"   Soll-Rate: {scheduler.rate:.2f} msg/s | Verspätet: {scheduler.late} | Verpasst: {scheduler.missed}")
+    if qos > 0:
+        print(f"   In-Flight-Fenster: {win['Window']} (max. {win['Max. In-Flight']}) | "
+              f"Ack Ø {win['Ack Ø (ms)']:.2f} ms | Ack Max {win['Ack Max (ms)']:.2f} ms")
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Durchsatz ist durch den Client begrenzt: {gen_stats['Grund']}")
 
     # --- Markdown speichern ---
     os.makedirs("latency_markdowns", exist_ok=True)
@@ -86,19 +96,42 @@ def run_habapp_throughput(args, BROKER_IP):
         f.write(f"- Send-Rate: {send_rate:.2f} msg/s\n")
         f.write(f"- Empfangsrate: {recv_rate:.2f} msg/s\n")
         f.write(f"- Verlustquote: {loss_pct:.2f}%\n")
+        write_sequence_lines(f, seq_stats)
         f.write(f"- CPU%: {avg_cpu:.1f}\n")
         f.write(f"- RAM%: {avg_ram:.1f}\n")
+        f.write(f"- Soll-Rate: {scheduler.rate:.2f} msg/s\n")
+        f.write(f"- Verspätete Slots: {scheduler.late}\n")
+        f.write(f"- Verpasste Slots: {scheduler.missed}\n")
+        f.write(f"- Max. Verzug: {scheduler.max_lag * 1000:.2f} ms\n")
+        if qos > 0:
+            f.write(f"- In-Flight-Fenster: {win['Window']}\n")
+            f.write(f"- Max. In-Flight: {win['Max. In-Flight']}\n")
+            f.write(f"- Ack-Latenz Ø: {win['Ack Ø (ms)']:.2f} ms\n")
+            f.write(f"- Ack-Latenz Max: {win['Ack Max (ms)']:.2f} ms\n")
+        write_generator_lines(f, gen_stats, gen.thread_cpu)
+
+        sampler.write_markdown(f, resource_csv)
 
     print(f"\n📝 HABApp-Durchsatztest gespeichert unter: {md_file}")
 
-    return {
+    result = {
         "QoS": qos,
         "Gesendet": total_sent,
         "Empfangen": total_received,
         "Send-Rate": send_rate,
         "Recv-Rate": recv_rate,
         "Verlust%": loss_pct,
+        "Duplikate": seq_stats["Duplikate"],
+        "Außer Reihe": seq_stats["Außer Reihe"],
+        "Lücken": seq_stats["Lücken"],
         "Dauer_s": duration,
         "CPU%": avg_cpu,
         "RAM%": avg_ram,
-    }
\ No newline at end of file
+        "Soll-Rate": scheduler.rate,
+        "Verpasst": scheduler.missed,
+        "Window": win["Window"] if qos > 0 else None,
+        "Ack Ø (ms)": win["Ack Ø (ms)"] if qos > 0 else None,
+        "Generator gesättigt": gen_stats["Generator gesättigt"],
+    }
+    record_run("habapp_throughput", args, result, files={"Markdown": md_file, "Ressourcen": resource_csv}, qos=qos)
+    return result
\ No newline at end of file
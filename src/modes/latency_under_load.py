@@ -0,0 +1,160 @@
+# modes/latency_under_load.py
+# Latenz unter Last in einem Lauf: pro Stufe erzeugt eine Publisher-Flotte (eigene Prozesse)
+# Hintergrundlast auf den Durchsatz-Topics von Broker, HABApp oder openHAB, während
+# niederfrequente Binär-Probes über die Echo-Topics laufen. Ergebnis ist je Probe-Ziel
+# p50/p90/p99 über der tatsächlich erreichten Last – die Latenz-Durchsatz-Kurve.
+#   python3 main.py --mode latency_under_load --load_target habapp --load_rates 0,200,500,1000 \
+#       --duration 30 --probe_rate 10 --targets habapp,openhab
+import os, threading, time
+from datetime import datetime
+from modes.capacity_search import TARGETS, ProbeLink
+from publisher_fleet import FleetReceiver, run_publishers, merge_worker_results
+from resource_monitor import sampler_from_args
+from utils import PROBE_HEADER, PROBE_SUFFIX
+from results_db import record_run
+
+# Lastziel → (Publish-Topic, Antwort-Topic); None = args.topic + "/load", der Broker spiegelt an den Zähler
+LOAD_TOPICS = {
+    "mqtt": (None, None),
+    "habapp": ("/throughput/habapp/input", "/throughput/habapp/response"),
+    "openhab": ("/throughput/openhab/command", "/throughput/openhab/response"),
+}
+WARMUP_S = 2.0  # Last läuft vor den Probes an, damit Queues im eingeschwungenen Zustand sind
+PROBE_KEYS = ("p50", "p90", "p99", "Max", "Verlust%", "Empfangen")
+
+
+def run_latency_under_load(args, BROKER_IP):
+    targets = [t.strip() for t in (getattr(args, "targets", None) or "mqtt,habapp,openhab").split(",") if t.strip()]
+    load_target = getattr(args, "load_target", "habapp")
+    unknown = [t for t in targets + [load_target] if t not in TARGETS]
+    if unknown:
+        print(f"❌ Unbekannte Ziele: {', '.join(unknown)} (möglich: {', '.join(TARGETS)})")
+        return None
+    rates = [float(r) for r in str(getattr(args, "load_rates", "0,200,500,1000,2000")).split(",") if r.strip()]
+    probe_rate = getattr(args, "probe_rate", 10.0)
+    stage_seconds = args.duration  # wie die Stresstests: Sekunden je Stufe
+    drain = getattr(args, "drain", 2.0)
+    workers = max(1, getattr(args, "workers", 1))
+    pad_len = max(0, args.payload_size - PROBE_HEADER.size)
+    load_topic, load_response = LOAD_TOPICS[load_target]
+    load_topic = load_topic or args.topic + "/load"
+    load_response = load_response or load_topic
+
+    print(f"\n🚀 Latenz unter Last QoS {args.qos}: Last auf {load_target} ({load_topic}) mit "
+          f"{', '.join(f'{r:g}' for r in rates)} msg/s, Probes {probe_rate:g} msg/s an {', '.join(targets)}, "
+          f"{stage_seconds} s je Stufe")
+
+    receiver = FleetReceiver(BROKER_IP, load_response, args.qos)
+    links = {}
+    for name in targets:
+        request, response = TARGETS[name]
+        links[name] = ProbeLink(BROKER_IP, (request or args.topic) + PROBE_SUFFIX,
+                                (response or args.topic) + PROBE_SUFFIX, args.qos)
+    sampler = sampler_from_args(args, BROKER_IP).start()
+
+    results = []
+    try:
+        for stage, rate in enumerate(rates, start=1):
+            prefix = f"load{stage}"
+            worker_results = []
+            load_thread = None
+            stage_start = time.time()
+            if rate > 0:
+                def load():
+                    worker_results.extend(run_publishers(
+                        BROKER_IP, load_topic, args.qos, args.payload_size, rate, WARMUP_S + stage_seconds + drain,
+                        workers, prefix=prefix, profile=getattr(args, "profile", None), seed=getattr(args, "seed", None)))
+                load_thread = threading.Thread(target=load, daemon=True)
+                load_thread.start()
+                time.sleep(WARMUP_S)
+
+            probes = {}
+            def probe(name, link):
+                probes[name] = link.trial(probe_rate, stage_seconds, pad_len, drain)
+            threads = [threading.Thread(target=probe, args=item, daemon=True) for item in links.items()]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if load_thread:
+                load_thread.join()
+            time.sleep(drain)  # Antworten auf die Last dieser Stufe abwarten
+            stage_end = time.time()
+
+            load = merge_worker_results(worker_results) if worker_results else {"Gesendet": 0, "Dauer_s": 0}
+            load_received = receiver.sequences(f"{prefix}_msg")["Eindeutig"]
+            samples = sampler.between(stage_start, stage_end)
+            row = {
+                "Stufe": stage,
+                "Start": stage_start,
+                "Dauer_s": stage_end - stage_start,
+                "Last-Soll": rate,
+                "Last-Ist": load["Gesendet"] / load["Dauer_s"] if load["Dauer_s"] else 0.0,
+                "Last-Empfangen": load_received / load["Dauer_s"] if load["Dauer_s"] else 0.0,
+                "Last-Verlust%": (1 - load_received / load["Gesendet"]) * 100 if load["Gesendet"] else 0.0,
+                "CPU%": sampler.mean("CPU%", samples),
+                "RAM%": sampler.mean("RAM%", samples),
+                "Generator gesättigt": load.get("Generator gesättigt", False),
+            }
+            for name, p in probes.items():
+                row.update({f"{name} {k}": p[k] for k in PROBE_KEYS})
+            results.append(row)
+
+            print(f"\n📊 Stufe {stage}: Last {row['Last-Ist']:.0f} msg/s gesendet, {row['Last-Empfangen']:.0f} msg/s "
+                  f"beantwortet ({row['Last-Verlust%']:.2f}% Verlust), CPU {row['CPU%']:.1f}%")
+            for name, p in probes.items():
+                print(f"   {name:<8} p50 {p['p50']:.2f} ms | p90 {p['p90']:.2f} ms | p99 {p['p99']:.2f} ms | "
+                      f"max {p['Max']:.2f} ms | Verlust {p['Verlust%']:.2f}%")
+            if row["Generator gesättigt"]:
+                print(f"⚠️ Lastgenerator gesättigt – Stufe erreicht die Soll-Last nicht: {load['Grund']}")
+    finally:
+        for link in links.values():
+            link.close()
+        receiver.stop()
+        sampler.stop()
+
+    resource_csv = sampler.save_csv(f"latency_under_load_qos{args.qos}")
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs("latency_logs_stability", exist_ok=True)
+    csv_file = os.path.join("latency_logs_stability", f"latency_under_load_qos{args.qos}_{ts}.csv")
+    columns = list(results[0]) if results else []
+    with open(csv_file, "w", encoding="utf-8") as f:
+        f.write(";".join(columns) + "\n")
+        for r in results:
+            f.write(";".join(str(r[c]) for c in columns) + "\n")
+
+    os.makedirs("latency_markdowns", exist_ok=True)
+    md_file = os.path.join("latency_markdowns", f"latency_under_load_qos{args.qos}_{ts}.md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(f"# Latenz unter Last QoS {args.qos}\n\n")
+        f.write(f"- Last: {load_target} über `{load_topic}`, {workers} Publisher-Prozess(e)"
+                + (f", Profil `{args.profile}`" if getattr(args, "profile", None) else "") + "\n")
+        f.write(f"- Probes: {probe_rate:g} msg/s je Ziel, Binärformat, {stage_seconds} s je Stufe "
+                f"nach {WARMUP_S:.0f} s Anlauf der Last\n")
+        f.write(f"- Kurve als CSV: `{csv_file}`\n\n")
+        f.write("## Last je Stufe\n\n")
+        f.write("| Stufe | Soll (msg/s) | Gesendet (msg/s) | Beantwortet (msg/s) | Verlust% | CPU% | Generator gesättigt |\n")
+        f.write("|-------|--------------|------------------|---------------------|----------|------|---------------------|\n")
+        for r in results:
+            f.write(f"| {r['Stufe']} | {r['Last-Soll']:.0f} | {r['Last-Ist']:.0f} | {r['Last-Empfangen']:.0f} | "
+                    f"{r['Last-Verlust%']:.2f}% | {r['CPU%']:.1f} | {'ja' if r['Generator gesättigt'] else 'nein'} |\n")
+        for name in targets:
+            f.write(f"\n## Probe-Latenz {name}\n\n")
+            f.write("| Last (msg/s) | p50 (ms) | p90 (ms) | p99 (ms) | Max (ms) | Verlust% | Antworten |\n")
+            f.write("|--------------|----------|----------|----------|----------|----------|-----------|\n")
+            for r in results:
+                f.write(f"| {r['Last-Ist']:.0f} | {r[f'{name} p50']:.2f} | {r[f'{name} p90']:.2f} | "
+                        f"{r[f'{name} p99']:.2f} | {r[f'{name} Max']:.2f} | {r[f'{name} Verlust%']:.2f}% | "
+                        f"{r[f'{name} Empfangen']} |\n")
+        sampler.write_markdown(f, resource_csv)
+        sampler.write_stage_table(f, [(r["Stufe"], r["Start"], r["Start"] + r["Dauer_s"]) for r in results])
+
+    print(f"\n📝 Latenz unter Last gespeichert unter: {md_file}")
+    metrics = {"Stufen": len(results), "Max. Last-Ist": max((r["Last-Ist"] for r in results), default=0.0)}
+    if results:
+        for name in targets:
+            metrics[f"{name} p99 erste Stufe"] = results[0][f"{name} p99"]
+            metrics[f"{name} p99 letzte Stufe"] = results[-1][f"{name} p99"]
+    record_run("latency_under_load", args, metrics, stages=results,
+               files={"Markdown": md_file, "Kurve": csv_file, "Ressourcen": resource_csv}, qos=args.qos)
+    return results
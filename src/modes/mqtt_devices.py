@@ -0,0 +1,220 @@
+# modes/mqtt_devices.py
+# Simuliert viele Geräte mit jeweils eigener MQTT-Session (asyncio, ein Prozess).
+import asyncio, os, random, statistics, time
+from datetime import datetime
+from async_mqtt import AsyncMqttClient
+from utils import PayloadFactory
+from results_db import record_run
+from resource_monitor import sampler_from_args, GeneratorMonitor, write_generator_lines
+
+
+def _raise_fd_limit():
+    # Tausende Sockets brauchen mehr File-Deskriptoren als das Standard-Soft-Limit
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def _run_devices(args, BROKER_IP, qos):
+    n_devices = getattr(args, "devices", 100)
+    base_rate = getattr(args, "device_rate", 1.0)
+    spread = getattr(args, "rate_spread", 0.0)
+    concurrency = getattr(args, "connect_concurrency", 200)
+    duration = args.duration  # Dauer in Sekunden
+    run_id = datetime.now().strftime("%H%M%S")
+
+    # Jedes Gerät: eigenes Topic, eigene Rate (±spread um die Basisrate)
+    devices = [{
+        "Device": n,
+        "Topic": f"/devices/sim/{n}/state",
+        "Rate": base_rate * random.uniform(1 - spread, 1 + spread),
+        "Connect_ms": None,
+        "Gesendet": 0,
+        "Fehler": None,
+    } for n in range(n_devices)]
+
+    # --- Subscriber: zählt alles, was die Geräte senden ---
+    total_received = 0
+
+    def on_message(topic, payload):
+        nonlocal total_received
+        total_received += 1
+
+    sub = AsyncMqttClient(f"devsim_sub_{run_id}", on_message=on_message)
+    await sub.connect(BROKER_IP, 1883)
+    await sub.subscribe("/devices/sim/#", qos=qos)
+
+    # --- Verbindungsaufbau, begrenzt parallel ---
+    clients = [AsyncMqttClient(f"devsim_{run_id}_{d['Device']}") for d in devices]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def connect(d, client):
+        async with sem:
+            try:
+                d["Connect_ms"] = await client.connect(BROKER_IP, 1883) * 1000
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                d["Fehler"] = str(e) or type(e).__name__
+                await client.close()  # halb aufgebaute Verbindung nicht offen lassen
+
+    print(f"🔌 Baue {n_devices} Verbindungen auf (max. {concurrency} parallel) …")
+    t_setup = time.perf_counter()
+    await asyncio.gather(*(connect(d, c) for d, c in zip(devices, clients)))
+    setup_s = time.perf_counter() - t_setup
+    connected = [(d, c) for d, c in zip(devices, clients) if c.connected]
+    print(f"✅ {len(connected)}/{n_devices} verbunden in {setup_s:.2f}s")
+
+    # --- Senden: jedes Gerät mit absoluten Deadlines und zufälliger Phase ---
+    # Alle Geräte teilen sich einen Event-Loop-Thread; verspätete Slots zählen wie beim RateScheduler
+    late = 0
+    gen = GeneratorMonitor().start()
+    start = time.perf_counter()
+    end = start + duration
+
+    async def device_loop(d, client):
+        nonlocal late
+        interval = 1.0 / d["Rate"] if d["Rate"] > 0 else 0
+        due = start + random.uniform(0, interval)
+        payloads = PayloadFactory(args.payload_size, f"dev{d['Device']}_msg")
+        while True:
+            now = time.perf_counter()
+            if due >= end or now >= end:
+                break
+            if due > now:
+                await asyncio.sleep(due - now)
+            elif interval and now - due > interval:
+                late += 1
+            try:
+                t_pub = time.perf_counter_ns()
+                await client.publish(d["Topic"], payloads.make(d["Gesendet"]), qos=qos)
+                gen.publish_done(t_pub)
+            except (ConnectionError, OSError) as e:
+                d["Fehler"] = str(e) or type(e).__name__
+                break
+            d["Gesendet"] += 1
+            if interval:
+                due += interval
+            else:
+                await asyncio.sleep(0)  # unbegrenzt: anderen Geräten Vortritt lassen
+
+    await asyncio.gather(*(device_loop(d, c) for d, c in connected))
+    send_duration = time.perf_counter() - start
+    gen.stop()
+    # Leerlauf des Loops ≈ Wandzeit minus CPU-Zeit des Loop-Threads (kein zentraler Scheduler)
+    sched = {"Soll-Rate": sum(d["Rate"] for d, _ in connected), "Slots": sum(d["Gesendet"] for d, _ in connected),
+             "Verspätet": late, "Verpasst": 0, "Leerlauf (s)": max(0.0, gen.wall - gen.thread_cpu.get("Sender", 0.0))}
+    gen_stats = gen.stats(sched)
+    await asyncio.sleep(2)  # Nachzügler abwarten
+
+    await asyncio.gather(*(c.close() for _, c in connected))
+    await sub.close()
+    return devices, setup_s, send_duration, total_received, gen_stats, gen.thread_cpu
+
+
+def run_mqtt_devices(args, BROKER_IP):
+    spread = getattr(args, "rate_spread", 0.0)
+    if not 0 <= spread < 1:
+        # ab 1 wären einzelne Geräteraten ≤ 0 – device_loop sendet dann ungebremst
+        print(f"❌ --rate_spread {spread:g} ungültig: erlaubt ist 0 ≤ Streuung < 1")
+        return None
+    qos = getattr(args, "qos", 0)
+    if qos > 1:
+        print("⚠️ Geräte-Simulation unterstützt nur QoS 0/1 – verwende QoS 1.")
+        qos = 1
+    print(f"\n🚀 Starte Geräte-Simulation mit QoS {qos} …")
+
+    _raise_fd_limit()
+    sampler = sampler_from_args(args, BROKER_IP).start()
+    devices, setup_s, duration, total_received, gen_stats, thread_cpu = asyncio.run(_run_devices(args, BROKER_IP, qos))
+    sampler.stop()
+
+    connect_times = sorted(d["Connect_ms"] for d in devices if d["Connect_ms"] is not None)
+    failed = sum(1 for d in devices if d["Connect_ms"] is None)
+    rates = sorted(d["Gesendet"] / duration for d in devices if d["Connect_ms"] is not None) if duration > 0 else []
+    total_sent = sum(d["Gesendet"] for d in devices)
+    send_rate = total_sent / duration if duration > 0 else 0
+    recv_rate = total_received / duration if duration > 0 else 0
+    loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
+
+    result = {
+        "QoS": qos,
+        "Geräte": len(devices),
+        "Verbunden": len(connect_times),
+        "Fehlgeschlagen": failed,
+        "Aufbau_s": setup_s,
+        "Connect Ø (ms)": statistics.mean(connect_times) if connect_times else 0,
+        "Connect p99 (ms)": _percentile(connect_times, 99),
+        "Connect Max (ms)": connect_times[-1] if connect_times else 0,
+        "Rate/Gerät Min": rates[0] if rates else 0,
+        "Rate/Gerät Ø": statistics.mean(rates) if rates else 0,
+        "Rate/Gerät Max": rates[-1] if rates else 0,
+        "Gesendet": total_sent,
+        "Empfangen": total_received,
+        "Send-Rate": send_rate,
+        "Recv-Rate": recv_rate,
+        "Verlust%": loss_pct,
+        "Dauer_s": duration,
+        "CPU%": sampler.mean("CPU%"),
+        "RAM%": sampler.mean("RAM%"),
+        "Generator gesättigt": gen_stats["Generator gesättigt"],
+    }
+
+    print(f"\n📊 Geräte-Simulation abgeschlossen:")
+    print(f"   Verbunden:  {result['Verbunden']}/{result['Geräte']} in {setup_s:.2f}s "
+          f"(Ø {result['Connect Ø (ms)']:.2f} ms, p99 {result['Connect p99 (ms)']:.2f} ms)")
+    print(f"   Gesendet:   {total_sent} → {send_rate:.2f} msg/s")
+    print(f"   Empfangen:  {total_received} → {recv_rate:.2f} msg/s")
+    print(f"   Verlust:    {total_sent - total_received} ({loss_pct:.2f}%)")
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Geräte-Raten sind durch den Client begrenzt: {gen_stats['Grund']}")
+
+    # --- Markdown + CSV pro Gerät speichern ---
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs("latency_logs_stability", exist_ok=True)
+    csv_file = os.path.join("latency_logs_stability", f"device_rates_{ts}.csv")
+    with open(csv_file, "w", encoding="utf-8") as f:
+        f.write("Device;Topic;Soll-Rate;Connect_ms;Gesendet;Rate;Fehler\n")
+        for d in devices:
+            rate = d["Gesendet"] / duration if duration > 0 else 0
+            connect_ms = f"{d['Connect_ms']:.2f}" if d["Connect_ms"] is not None else ""
+            f.write(f"{d['Device']};{d['Topic']};{d['Rate']:.3f};{connect_ms};{d['Gesendet']};{rate:.3f};{d['Fehler'] or ''}\n")
+
+    os.makedirs("latency_markdowns", exist_ok=True)
+    md_file = os.path.join("latency_markdowns", f"mqtt_devices_{len(devices)}dev_qos{qos}_{ts}.md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(f"# MQTT Geräte-Simulation QoS {qos}\n\n")
+        f.write(f"- Geräte: {result['Geräte']} (verbunden: {result['Verbunden']}, fehlgeschlagen: {failed})\n")
+        f.write(f"- Verbindungsaufbau gesamt: {setup_s:.2f} s\n")
+        f.write(f"- Dauer: {duration:.2f} s\n")
+        f.write(f"- Gesendet: {total_sent}\n")
+        f.write(f"- Empfangen: {total_received}\n")
+        f.write(f"- Send-Rate: {send_rate:.2f} msg/s\n")
+        f.write(f"- Empfangsrate: {recv_rate:.2f} msg/s\n")
+        f.write(f"- Verlustquote: {loss_pct:.2f}%\n")
+        write_generator_lines(f, gen_stats, thread_cpu)
+        f.write("\n")
+
+        f.write("## Verbindungsaufbau und Rate pro Gerät\n\n")
+        f.write("| Kennzahl | Min | Ø | p50 | p99 | Max |\n")
+        f.write("|----------|-----|---|-----|-----|-----|\n")
+        for label, values in (("Connect (ms)", connect_times), ("Rate (msg/s)", rates)):
+            if values:
+                f.write(f"| {label} | {values[0]:.2f} | {statistics.mean(values):.2f} | "
+                        f"{_percentile(values, 50):.2f} | {_percentile(values, 99):.2f} | {values[-1]:.2f} |\n")
+        f.write(f"\nWerte pro Gerät: `{csv_file}`\n")
+
+        sampler.write_markdown(f, sampler.save_csv(f"mqtt_devices_qos{qos}"))
+
+    print(f"\n📝 Geräte-Simulation gespeichert unter: {md_file}")
+    record_run("mqtt_devices", args, result, files={"Markdown": md_file, "Geräte": csv_file}, qos=qos)
+    return result
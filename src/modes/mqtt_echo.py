@@ -1,44 +1,84 @@
 # modes/mqtt_echo.py
 import time, json, paho.mqtt.client as mqtt
-from utils import save_latency_csv, save_summary
+from utils import LatencyLogWriter, save_summary, RateScheduler, target_rate, LatencyHistogram
+from utils import InflightTracker, probe_seq
+from utils import PROBE_HEADER, PROBE_SUFFIX, encode_probe, decode_probe, use_binary_probe
 from plot_latency import plot_latency
+from resource_monitor import sampler_from_args, GeneratorMonitor
+from columnar_log import ColumnarWriter
 
 def run_mqtt_echo(args, BROKER_IP):
-    latency_data, sent_timestamps = [], {}
+    latency_log = LatencyLogWriter(args.mode)  # streamt (Sekunde, Latenz) auf die Platte
+    columns = ColumnarWriter(args.mode)         # seq, send_ns, recv_ns pro Nachricht (binär)
     total_sent = total_received = 0
+    histogram = LatencyHistogram()  # Perzentile ohne alle Rohwerte sortieren zu müssen
+    binary = use_binary_probe(args)
+    topic = args.topic + PROBE_SUFFIX if binary else args.topic
+    pad_len = max(0, args.payload_size - PROBE_HEADER.size)
 
     def on_message(client, userdata, msg):
         nonlocal total_received
-        payload = json.loads(msg.payload.decode())
-        msg_id = payload.get("id")
-        if msg_id and msg_id in sent_timestamps:
-            t_sent = sent_timestamps.pop(msg_id)
-            latency_ms = (time.time() - t_sent) * 1000
+        if binary:
+            probe = decode_probe(msg.payload)
+            seq = probe[1] if probe else None
+        else:
+            seq = probe_seq(json.loads(msg.payload.decode()).get("id"))
+        latency_ms = inflight.ack(seq) if seq is not None else None
+        if latency_ms is not None:
+            t_recv_ns = time.time_ns()
+            columns.append(seq, t_recv_ns - int(latency_ms * 1e6), t_recv_ns)
+            msg_id = f"msg_{seq}"
             duration = time.time() - start_time
-            latency_data.append((duration, latency_ms))
+            latency_log.append(duration, latency_ms)
+            histogram.record(latency_ms)
             print(f"📨 {msg_id}: {latency_ms:.2f} ms")
             total_received += 1
 
+    # Scheduler und Tracker vor loop_start(): eine alte oder retained Antwort darf den Callback
+    # nicht vor der Zuweisung von inflight erreichen (NameError beendet paho's Netzwerk-Thread)
+    scheduler = RateScheduler(target_rate(args), catch_up=not getattr(args, "skip_missed", False))
+    inflight = InflightTracker.for_rate(scheduler.rate, getattr(args, "inflight_timeout", 30.0))
+    start_time = scheduler.t0_wall
     client = mqtt.Client()
     client.on_message = on_message
     client.connect(BROKER_IP, 1883)
-    client.subscribe(args.topic, qos=args.qos)
+    client.subscribe(topic, qos=args.qos)
     client.loop_start()
 
-    start_time = time.time()
+    sampler = sampler_from_args(args, BROKER_IP).start()
+    scheduler.start()  # Takt erst ab hier, Verbindungsaufbau und Sampler-Start zählen nicht mit
+    start_time = scheduler.t0_wall
     i = 0
-    while time.time() - start_time < args.duration * 60:
+    gen = GeneratorMonitor(client).start()
+    while True:
+        # Latenz ab Soll-Zeitpunkt messen (Coordinated-Omission-Korrektur)
+        planned = scheduler.wait()
+        if planned - start_time >= args.duration * 60:
+            break
         i += 1
         msg_id = f"msg_{i}"
-        now = time.time()
-        payload = json.dumps({"id": msg_id, "data": now})
-        client.publish(args.topic, payload, qos=args.qos)
-        sent_timestamps[msg_id] = now
+        if binary:
+            payload = encode_probe(i, int(planned * 1e9), pad_len)
+        else:
+            payload = json.dumps({"id": msg_id, "data": planned})
+        inflight.send(i, scheduler.perf_ns(planned))
+        t_pub = time.perf_counter_ns()
+        client.publish(topic, payload, qos=args.qos)
+        gen.publish_done(t_pub)
         total_sent += 1
-        time.sleep(args.delay)
 
+    gen_stats = gen.stop().stats(scheduler.stats())
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Latenzen enthalten Verzug des Clients: {gen_stats['Grund']}")
     time.sleep(5)
     client.loop_stop()
-    path = save_latency_csv(latency_data, mode=args.mode)
-    save_summary(latency_data, total_sent, total_received, filepath="mqtt_echo", mode="mqtt_echo", qos=args.qos)
-    plot_latency(path, output_folder="latency_plots")
\ No newline at end of file
+    inflight.finish()
+    sampler.stop()
+    path = latency_log.close()
+    columns_path = columns.close()
+    save_summary([], total_sent, total_received, duration=latency_log.last_ts,
+                 filepath="mqtt_echo", mode="mqtt_echo", qos=args.qos,
+                 scheduler_stats=scheduler.stats(), histogram=histogram,
+                 inflight_stats=inflight.stats(), resources=sampler, columns=columns_path, args=args,
+                 generator_stats=gen_stats)
+    plot_latency(columns_path, output_folder="latency_plots")
\ No newline at end of file
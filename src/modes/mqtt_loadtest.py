@@ -1,17 +1,21 @@
 import time, threading, paho.mqtt.client as mqtt
-from utils import generate_payload
+from utils import PayloadFactory, target_rate, SequenceTracker, write_sequence_lines
+from results_db import record_run
+from load_profiles import scheduler_from_args, curve_from_args
+from resource_monitor import sampler_from_args, GeneratorMonitor, write_generator_lines
 from datetime import datetime
 import os
-import psutil  
 
 def run_mqtt_loadtest(args, BROKER_IP):
+    curve = curve_from_args(args)  # Soll/Gesendet/Empfangen je Sekunde, nur mit --profile
     total_sent = 0
-    total_received = 0
+    sequences = SequenceTracker()
 
     # --- Subscriber ---
     def on_message(client, userdata, msg):
-        nonlocal total_received
-        total_received += 1
+        sequences.receive(msg.payload)
+        if curve:
+            curve.receive()
 
     sub_client = mqtt.Client()
     sub_client.on_message = on_message
@@ -29,42 +33,44 @@ def run_mqtt_loadtest(args, BROKER_IP):
     pub_client.connect(BROKER_IP, 1883)
     pub_client.loop_start()
 
-    delay = args.delay
+    scheduler = scheduler_from_args(args, target_rate(args), args.duration, curve)
     start_time = time.time()
 
-    # --- Monitoring Zeitreihe ---
-    cpu_series = []
-    ram_series = []
-    timestamps = []
-
-    next_sample = start_time + 60  # erste Minute
+    # --- Monitoring Zeitreihe (eigener Thread) + Sequenzprüfung pro Minute ---
+    sampler = sampler_from_args(args, BROKER_IP).start()
+    seq_by_minute = {}
+    next_minute = start_time + 60
 
+    payloads = PayloadFactory(args.payload_size, "loadtest_msg")
+    gen = GeneratorMonitor(pub_client).start()
     while time.time() - start_time < args.duration:
-        msg_id = f"loadtest_msg{total_sent}"
-        payload = generate_payload(args.payload_size, msg_id)
+        scheduler.wait()
+        payload = payloads.make(total_sent)
+        t_pub = time.perf_counter_ns()
         pub_client.publish(args.topic, payload, qos=args.qos)
+        gen.publish_done(t_pub)
         total_sent += 1
 
-        if delay > 0:
-            time.sleep(delay)
-
-        # alle 60 Sekunden CPU/RAM loggen
-        if time.time() >= next_sample:
-            cpu_usage = psutil.cpu_percent(interval=None)
-            ram_usage = psutil.virtual_memory().percent
-            cpu_series.append(cpu_usage)
-            ram_series.append(ram_usage)
-            timestamps.append(int((time.time() - start_time) // 60))  # Minuten seit Start
-            print(f"[Monitoring] Minute {timestamps[-1]}: CPU={cpu_usage:.1f}% | RAM={ram_usage:.1f}%")
-            next_sample += 60
+        if time.time() >= next_minute:
+            seq_by_minute[len(seq_by_minute)] = sequences.interval()
+            next_minute += 60
 
     duration = time.time() - start_time
+    gen_stats = gen.stop().stats(scheduler.stats())
+    seq_by_minute[len(seq_by_minute)] = sequences.interval()  # angefangene letzte Minute
+    sampler.stop()
+    resource_csv = sampler.save_csv(f"loadtest_qos{args.qos}")
+    curve_csv = curve.save_csv(f"loadtest_qos{args.qos}") if curve else None
+    seq_stats = sequences.stats()
+    total_received = seq_stats["Eindeutig"]  # Duplikate/Redeliveries zählen nicht als empfangen
     send_rate = total_sent / duration if duration > 0 else 0
     recv_rate = total_received / duration if duration > 0 else 0
     loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
 
     pub_client.loop_stop()
     sub_client.loop_stop()
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Lastkurve ist durch den Client begrenzt: {gen_stats['Grund']}")
 
     # --- Markdown speichern ---
     os.makedirs("latency_markdowns", exist_ok=True)
@@ -78,12 +84,40 @@ def run_mqtt_loadtest(args, BROKER_IP):
         f.write(f"- Empfangen: {total_received}\n")
         f.write(f"- Send-Rate: {send_rate:.2f} msg/s\n")
         f.write(f"- Empfangsrate: {recv_rate:.2f} msg/s\n")
-        f.write(f"- Verlustquote: {loss_pct:.2f}%\n\n")
+        f.write(f"- Verlustquote: {loss_pct:.2f}%\n")
+        write_sequence_lines(f, seq_stats)
+        f.write(f"- Soll-Rate: {scheduler.rate:.2f} msg/s\n")
+        f.write(f"- Verspätete Slots: {scheduler.late}\n")
+        f.write(f"- Verpasste Slots: {scheduler.missed}\n")
+        f.write(f"- Max. Verzug: {scheduler.max_lag * 1000:.2f} ms\n")
+        write_generator_lines(f, gen_stats, gen.thread_cpu)
+        f.write("\n")
 
         f.write("## Systemmonitoring pro Minute\n\n")
-        f.write("| Minute | CPU% | RAM% |\n")
-        f.write("|--------|------|------|\n")
-        for i, cpu in enumerate(cpu_series):
-            f.write(f"| {timestamps[i]} | {cpu:.1f} | {ram_series[i]:.1f} |\n")
-
-    print(f"\n📝 Lasttest-Ergebnisse gespeichert unter: {md_file}")
\ No newline at end of file
+        f.write("| Minute | CPU% | RAM% | Duplikate | Außer Reihe | Lücken |\n")
+        f.write("|--------|------|------|-----------|-------------|--------|\n")
+        for minute, cpu, ram in sampler.per_minute():
+            seq = seq_by_minute.get(minute, {"Duplikate": 0, "Außer Reihe": 0, "Lücken": 0})
+            f.write(f"| {minute} | {cpu:.1f} | {ram:.1f} | "
+                    f"{seq['Duplikate']} | {seq['Außer Reihe']} | {seq['Lücken']} |\n")
+
+        if curve:
+            curve.write_markdown(f, curve_csv, args.profile)
+        sampler.write_markdown(f, resource_csv)
+
+    print(f"\n📝 Lasttest-Ergebnisse gespeichert unter: {md_file}")
+    record_run("mqtt_loadtest", args, {
+        "Dauer_s": duration,
+        "Gesendet": total_sent,
+        "Empfangen": total_received,
+        "Send-Rate": send_rate,
+        "Recv-Rate": recv_rate,
+        "Verlust%": loss_pct,
+        **seq_stats,
+        "CPU%": sampler.mean("CPU%"),
+        "RAM%": sampler.mean("RAM%"),
+        "Soll-Rate": scheduler.rate,
+        "Verpasst": scheduler.missed,
+        "Generator gesättigt": gen_stats["Generator gesättigt"],
+        **(curve.stats() if curve else {}),
+    }, files={"Markdown": md_file, "Ressourcen": resource_csv, "Lastverlauf": curve_csv}, qos=args.qos)
\ No newline at end of file
@@ -1,82 +1,123 @@
 # modes/mqtt_stresstest.py
 import time, threading, paho.mqtt.client as mqtt
-from utils import generate_payload
+from utils import PayloadFactory, SequenceTracker
+from publisher_fleet import FleetReceiver, run_publishers, merge_worker_results, write_worker_table
+from results_db import record_run
+from load_profiles import scheduler_from_args, curve_from_args
+from resource_monitor import sampler_from_args, GeneratorMonitor
 from datetime import datetime
 import os
-import psutil   # ✅ Systemmonitoring
 
 def run_mqtt_stresstest(args, BROKER_IP):
+    curve = curve_from_args(args)  # Soll/Gesendet/Empfangen je Sekunde, nur mit --profile
     results = []
-
-    # --- Subscriber ---
-    total_received = 0
-    def on_message(client, userdata, msg):
-        nonlocal total_received
-        total_received += 1
-
-    sub_client = mqtt.Client()
-    sub_client.on_message = on_message
-    sub_client.connect(BROKER_IP, 1883)
-    sub_client.subscribe(args.topic, qos=args.qos)
-
-    def sub_loop():
-        sub_client.loop_forever()
-
-    sub_thread = threading.Thread(target=sub_loop, daemon=True)
-    sub_thread.start()
-
-    # --- Publisher ---
-    pub_client = mqtt.Client()
-    pub_client.connect(BROKER_IP, 1883)
-    pub_client.loop_start()
+    workers = getattr(args, "workers", 1)
+    catch_up = not getattr(args, "skip_missed", False)
+
+    if workers > 1:
+        # --- Publisher-Flotte: N Prozesse senden, ein eigener Prozess zählt pro Stufe ---
+        receiver = FleetReceiver(BROKER_IP, args.topic, args.qos)
+        if curve:
+            print("ℹ️ Mit --workers > 1 formt --profile die Last, der Soll/Ist-Verlauf wird nicht aufgezeichnet")
+            curve = None
+    else:
+        receiver = None
+
+        # --- Subscriber ---
+        # Nachrichten werden über das Stufen-Präfix der msg_id ihrer Stufe zugeordnet,
+        # auch wenn sie erst während der nächsten Stufe eintreffen
+        sequences = SequenceTracker()
+        def on_message(client, userdata, msg):
+            sequences.receive(msg.payload)
+            if curve:
+                curve.receive()
+
+        sub_client = mqtt.Client()
+        sub_client.on_message = on_message
+        sub_client.connect(BROKER_IP, 1883)
+        sub_client.subscribe(args.topic, qos=args.qos)
+
+        def sub_loop():
+            sub_client.loop_forever()
+
+        sub_thread = threading.Thread(target=sub_loop, daemon=True)
+        sub_thread.start()
+
+        # --- Publisher ---
+        pub_client = mqtt.Client()
+        pub_client.connect(BROKER_IP, 1883)
+        pub_client.loop_start()
 
     # Parameter: Start-Rate, Schrittweite, Dauer pro Stufe
-    current_delay = args.delay       # Start-Delay zwischen Nachrichten
+    current_delay = 1.0 / args.rate if getattr(args, "rate", None) else args.delay  # Start-Delay zwischen Nachrichten
     step_factor = 0.5                # halbiert Delay pro Stufe (doppelt so schnell)
     stage_duration = args.duration   # Dauer pro Stufe in Sekunden
+    drain = getattr(args, "drain", 2.0)  # Wartezeit auf Nachzügler nach jeder Stufe
 
     stage = 0
+    sampler = sampler_from_args(args, BROKER_IP).start()  # Systemmonitoring im eigenen Thread
     while current_delay > 0.0001:  # Abbruch, wenn Delay extrem klein
         stage += 1
-        total_sent = 0
-        total_received = 0
-        start_time = time.time()
-
-        # --- Monitoring pro Stufe ---
-        cpu_samples = []
-        ram_samples = []
-
-        while time.time() - start_time < stage_duration:
-            msg_id = f"stage{stage}_msg{total_sent}"
-            payload = generate_payload(args.payload_size, msg_id)
-            pub_client.publish(args.topic, payload, qos=args.qos)
-            total_sent += 1
-            if current_delay > 0:
-                time.sleep(current_delay)
-
-            # alle 5 Sekunden CPU/RAM loggen
-            if total_sent % int(max(1, 5 / current_delay)) == 0:
-                cpu_usage = psutil.cpu_percent(interval=None)
-                ram_usage = psutil.virtual_memory().percent
-                cpu_samples.append(cpu_usage)
-                ram_samples.append(ram_usage)
-
-        duration = time.time() - start_time
+        worker_results = []
+        stage_prefix = f"stage{stage}_msg"
+
+        stage_start = time.time()
+        if receiver:
+            worker_results = run_publishers(BROKER_IP, args.topic, args.qos, args.payload_size, 1.0 / current_delay,
+                                            stage_duration, workers, prefix=f"stage{stage}",
+                                            catch_up=catch_up, profile=getattr(args, "profile", None),
+                                            seed=getattr(args, "seed", None))
+            sched = merge_worker_results(worker_results)
+            gen_stats = sched  # Generator-Kennzahlen sind bereits über die Worker zusammengefasst
+            total_sent = sched["Gesendet"]
+            duration = sched["Dauer_s"]
+            time.sleep(drain)  # Nachzügler dieser Stufe abwarten
+            seq_stats = receiver.sequences(stage_prefix)
+        else:
+            total_sent = 0
+            start_time = time.time()
+            scheduler = scheduler_from_args(args, 1.0 / current_delay, stage_duration, curve, catch_up)
+
+            payloads = PayloadFactory(args.payload_size, stage_prefix)
+            gen = GeneratorMonitor(pub_client).start()
+            while time.time() - start_time < stage_duration:
+                scheduler.wait()
+                payload = payloads.make(total_sent)
+                t_pub = time.perf_counter_ns()
+                pub_client.publish(args.topic, payload, qos=args.qos)
+                gen.publish_done(t_pub)
+                total_sent += 1
+
+            sched = scheduler.stats()
+            duration = time.time() - start_time
+            gen_stats = gen.stop().stats(sched)
+            time.sleep(drain)  # Nachzügler dieser Stufe abwarten
+            seq_stats = sequences.stats(stage_prefix)
+        total_received = seq_stats["Eindeutig"]  # Duplikate/Redeliveries zählen nicht als empfangen
         send_rate = total_sent / duration if duration > 0 else 0
         recv_rate = total_received / duration if duration > 0 else 0
         loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
 
-        avg_cpu = sum(cpu_samples) / len(cpu_samples) if cpu_samples else 0
-        avg_ram = sum(ram_samples) / len(ram_samples) if ram_samples else 0
+        stage_samples = sampler.between(stage_start, stage_start + duration)
+        avg_cpu = sampler.mean("CPU%", stage_samples)
+        avg_ram = sampler.mean("RAM%", stage_samples)
 
         print(f"\n📊 Stufe {stage}: Delay={current_delay:.6f}s")
         print(f"   Gesendet:   {total_sent} → {send_rate:.2f} msg/s")
         print(f"   Empfangen:  {total_received} → {recv_rate:.2f} msg/s")
         print(f"   Verlust:    {total_sent - total_received} ({loss_pct:.2f}%)")
+        print(f"   Duplikate: {seq_stats['Duplikate']} | Außer der Reihe: {seq_stats['Außer Reihe']} | Lücken: {seq_stats['Lücken']}")
         print(f"   CPU: {avg_cpu:.1f}% | RAM: {avg_ram:.1f}%")
+        print(f"   Soll-Rate: {sched['Soll-Rate']:.2f} msg/s | Verspätet: {sched['Verspätet']} | Verpasst: {sched['Verpasst']}")
+        print(f"   Generator: Sender-CPU {gen_stats['Sender-CPU%']:.1f}% | publish() p99 {gen_stats['Publish p99 (µs)']:.0f} µs | "
+              f"Queue max {gen_stats['Queue Max']}")
+        if gen_stats["Generator gesättigt"]:
+            print(f"⚠️ Generator gesättigt – Ergebnis dieser Stufe ist durch den Client begrenzt: {gen_stats['Grund']}")
 
         results.append({
             "Stufe": stage,
+            "Präfix": stage_prefix,
+            "Start": stage_start,
             "Delay": current_delay,
             "Gesendet": total_sent,
             "Empfangen": total_received,
@@ -86,13 +127,35 @@ def run_mqtt_stresstest(args, BROKER_IP):
             "Dauer_s": duration,
             "CPU%": avg_cpu,
             "RAM%": avg_ram,
+            "Soll-Rate": sched["Soll-Rate"],
+            "Verpasst": sched["Verpasst"],
+            "Duplikate": seq_stats["Duplikate"],
+            "Außer Reihe": seq_stats["Außer Reihe"],
+            "Lücken": seq_stats["Lücken"],
+            "Sender-CPU%": gen_stats["Sender-CPU%"],
+            "Publish p99 (µs)": gen_stats["Publish p99 (µs)"],
+            "Queue Max": gen_stats["Queue Max"],
+            "Generator gesättigt": gen_stats["Generator gesättigt"],
+            "Grund": gen_stats["Grund"],
+            "Worker": worker_results,
         })
 
         # Delay reduzieren → Rate erhöhen
         current_delay *= step_factor
 
-    pub_client.loop_stop()
-    sub_client.loop_stop()
+    # Nachrichten, die erst nach der Drain-Phase ihrer Stufe ankamen
+    if receiver:
+        for r in results:
+            r["Nachzügler"] = receiver.sequences(r["Präfix"])["Eindeutig"] - r["Empfangen"]
+        receiver.stop()
+    else:
+        pub_client.loop_stop()
+        sub_client.loop_stop()
+        for r in results:
+            r["Nachzügler"] = sequences.stats(r["Präfix"])["Eindeutig"] - r["Empfangen"]
+    sampler.stop()
+    resource_csv = sampler.save_csv(f"stresstest_qos{args.qos}")
+    curve_csv = curve.save_csv(f"stresstest_qos{args.qos}") if curve else None
 
     # --- Markdown-Tabelle speichern ---
     os.makedirs("latency_markdowns", exist_ok=True)
@@ -101,11 +164,40 @@ def run_mqtt_stresstest(args, BROKER_IP):
 
     with open(md_file, "w", encoding="utf-8") as f:
         f.write(f"# MQTT Stresstest QoS {args.qos}\n\n")
-        f.write("| Stufe | Delay (s) | Gesendet | Empfangen | Send-Rate (msg/s) | Recv-Rate (msg/s) | Verlust% | CPU% | RAM% |\n")
-        f.write("|-------|-----------|----------|-----------|-------------------|-------------------|----------|------|------|\n")
+        f.write(f"Drain pro Stufe: {drain:.1f} s – Nachrichten werden über die msg_id ihrer Stufe zugeordnet.\n\n")
+        f.write("| Stufe | Delay (s) | Gesendet | Empfangen | Send-Rate (msg/s) | Recv-Rate (msg/s) | Verlust% | CPU% | RAM% | Soll-Rate (msg/s) | Verpasst | Duplikate | Außer Reihe | Lücken | Nachzügler | Sender-CPU% | Publish p99 (µs) | Queue Max | Generator gesättigt |\n")
+        f.write("|-------|-----------|----------|-----------|-------------------|-------------------|----------|------|------|-------------------|----------|-----------|-------------|--------|------------|-------------|------------------|-----------|---------------------|\n")
         for r in results:
             f.write(f"| {r['Stufe']} | {r['Delay']:.6f} | {r['Gesendet']} | {r['Empfangen']} | "
                     f"{r['Send-Rate']:.2f} | {r['Recv-Rate']:.2f} | {r['Verlust%']:.2f}% | "
-                    f"{r['CPU%']:.1f} | {r['RAM%']:.1f} |\n")
-
-    print(f"\n📝 Markdown-Tabelle gespeichert unter: {md_file}")
\ No newline at end of file
+                    f"{r['CPU%']:.1f} | {r['RAM%']:.1f} | {r['Soll-Rate']:.2f} | {r['Verpasst']} | "
+                    f"{r['Duplikate']} | {r['Außer Reihe']} | {r['Lücken']} | {r['Nachzügler']} | "
+                    f"{r['Sender-CPU%']:.1f} | {r['Publish p99 (µs)']:.0f} | {r['Queue Max']} | "
+                    f"{'ja' if r['Generator gesättigt'] else 'nein'} |\n")
+
+        saturated = [r for r in results if r["Generator gesättigt"]]
+        if saturated:
+            f.write("\n**Generator gesättigt** – diese Stufen messen den Lastgenerator, nicht das SUT:\n\n")
+            for r in saturated:
+                f.write(f"- Stufe {r['Stufe']}: {r['Grund']}\n")
+
+        if workers > 1:
+            f.write(f"\n## Publisher-Worker pro Stufe ({workers} Prozesse)\n")
+            for r in results:
+                f.write(f"\n### Stufe {r['Stufe']}\n\n")
+                write_worker_table(f, r["Worker"])
+
+        if curve:
+            curve.write_markdown(f, curve_csv, args.profile)
+        sampler.write_markdown(f, resource_csv)
+        sampler.write_stage_table(f, [(r["Stufe"], r["Start"], r["Start"] + r["Dauer_s"]) for r in results])
+
+    print(f"\n📝 Markdown-Tabelle gespeichert unter: {md_file}")
+    record_run("mqtt_stresstest", args, {
+        "Stufen": len(results),
+        "Gesendet": sum(r["Gesendet"] for r in results),
+        "Empfangen": sum(r["Empfangen"] for r in results),
+        "Max. Recv-Rate": max((r["Recv-Rate"] for r in results), default=0.0),
+        **(curve.stats() if curve else {}),
+    }, stages=results, files={"Markdown": md_file, "Ressourcen": resource_csv, "Lastverlauf": curve_csv}, qos=args.qos)
+    return results
\ No newline at end of file
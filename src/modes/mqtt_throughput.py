@@ -1,78 +1,118 @@
 # modes/mqtt_throughput.py
 import time, threading, paho.mqtt.client as mqtt
-from utils import generate_payload, save_summary
+from utils import PayloadFactory, RateScheduler, target_rate, PublishWindow, save_summary
+from utils import SequenceTracker, write_sequence_lines
+from publisher_fleet import FleetReceiver, run_publishers, merge_worker_results, write_worker_table
+from results_db import record_run
+from resource_monitor import sampler_from_args, GeneratorMonitor, write_generator_lines
 from datetime import datetime
 import os
-import psutil
 
 def run_mqtt_throughput(args, BROKER_IP):
     qos = getattr(args, "qos", 1)  # Standard: QoS 1
     print(f"\n🚀 Starte MQTT-Durchsatztest mit QoS {qos} …")
 
-    total_sent = 0
-    total_received = 0
-    start_time = time.time()
-
-    # --- Subscriber ---
-    def on_message(client, userdata, msg):
-        nonlocal total_received
-        total_received += 1
-
-    sub_client = mqtt.Client()
-    sub_client.on_message = on_message
-    sub_client.connect(BROKER_IP, 1883)
-    sub_client.subscribe(args.topic, qos=qos)
-
-    def sub_loop():
-        sub_client.loop_forever()
-
-    sub_thread = threading.Thread(target=sub_loop, daemon=True)
-    sub_thread.start()
-
-    # --- Publisher ---
-    pub_client = mqtt.Client()
-    pub_client.connect(BROKER_IP, 1883)
-    pub_client.loop_start()
-
-    # --- Monitoring ---
-    cpu_samples = []
-    ram_samples = []
-
-    while time.time() - start_time < args.duration * 60:
-        msg_id = f"msg_{total_sent}"
-        payload = generate_payload(args.payload_size, msg_id)
-
-        info = pub_client.publish(args.topic, payload, qos=qos)
-        if qos > 0:
-            info.wait_for_publish()
-
-        total_sent += 1
-        if args.delay > 0:
-            time.sleep(args.delay)
-
-        # alle 5 Sekunden CPU/RAM loggen
-        if total_sent % int(max(1, 5 / max(args.delay, 0.001))) == 0:
-            cpu_usage = psutil.cpu_percent(interval=None)
-            ram_usage = psutil.virtual_memory().percent
-            cpu_samples.append(cpu_usage)
-            ram_samples.append(ram_usage)
-
-    pub_client.loop_stop()
-    sub_client.loop_stop()
-
-    duration = time.time() - start_time
+    workers = getattr(args, "workers", 1)
+    catch_up = not getattr(args, "skip_missed", False)
+    worker_results = []
+    thread_cpu = None
+
+    # --- Monitoring (eigener Thread, festes Intervall) ---
+    sampler = sampler_from_args(args, BROKER_IP).start()
+
+    if workers > 1:
+        # --- Publisher-Flotte: N Prozesse senden, ein eigener Prozess zählt ---
+        receiver = FleetReceiver(BROKER_IP, args.topic, qos)
+        start_time = time.time()
+        worker_results = run_publishers(BROKER_IP, args.topic, qos, args.payload_size, target_rate(args),
+                                        args.duration * 60, workers, prefix="tp", window=getattr(args, "window", 1),
+                                        catch_up=catch_up)
+        time.sleep(2)  # Nachzügler abwarten
+        seq_stats = receiver.sequences("tp_msg")
+        receiver.stop()
+        fleet = merge_worker_results(worker_results)
+        total_sent = fleet["Gesendet"]
+        sched = fleet
+        win = fleet
+        gen_stats = fleet  # Generator-Kennzahlen bereits über die Worker zusammengefasst
+        duration = fleet["Dauer_s"]
+        if not worker_results:
+            print("⚠️ Kein Publisher-Worker hat ein Ergebnis geliefert – Zähler bleiben leer.")
+    else:
+        total_sent = 0
+        start_time = time.time()
+        sequences = SequenceTracker()
+
+        # --- Subscriber ---
+        def on_message(client, userdata, msg):
+            sequences.receive(msg.payload)
+
+        sub_client = mqtt.Client()
+        sub_client.on_message = on_message
+        sub_client.connect(BROKER_IP, 1883)
+        sub_client.subscribe(args.topic, qos=qos)
+
+        def sub_loop():
+            sub_client.loop_forever()
+
+        sub_thread = threading.Thread(target=sub_loop, daemon=True)
+        sub_thread.start()
+
+        # --- Publisher ---
+        pub_client = mqtt.Client()
+        pub_client.connect(BROKER_IP, 1883)
+        pub_client.loop_start()
+        window = PublishWindow(pub_client, getattr(args, "window", 1))
+
+        scheduler = RateScheduler(target_rate(args), catch_up=catch_up)
+
+        payloads = PayloadFactory(args.payload_size, "msg_")
+        gen = GeneratorMonitor(pub_client).start()
+        while time.time() - start_time < args.duration * 60:
+            scheduler.wait()
+            payload = payloads.make(total_sent)
+
+            t_pub = time.perf_counter_ns()
+            window.publish(args.topic, payload, qos)  # blockiert nur bei vollem Fenster
+            gen.publish_done(t_pub)
+
+            total_sent += 1
+
+        gen_stats = gen.stop().stats(scheduler.stats(), window.stats())
+        thread_cpu = gen.thread_cpu
+        window.drain()
+        pub_client.loop_stop()
+        sub_client.loop_stop()
+        sched = scheduler.stats()
+        win = window.stats()
+        duration = time.time() - start_time
+        seq_stats = sequences.stats()
+
+    total_received = seq_stats["Eindeutig"]  # Duplikate/Redeliveries zählen nicht als empfangen
     send_rate = total_sent / duration if duration > 0 else 0
     recv_rate = total_received / duration if duration > 0 else 0
     loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
+    has_window = qos > 0 and "Window" in win  # fehlt, wenn kein Worker zurückgemeldet hat
 
-    avg_cpu = sum(cpu_samples) / len(cpu_samples) if cpu_samples else 0
-    avg_ram = sum(ram_samples) / len(ram_samples) if ram_samples else 0
+    sampler.stop()
+    avg_cpu = sampler.mean("CPU%")
+    avg_ram = sampler.mean("RAM%")
+    resource_csv = sampler.save_csv(f"mqtt_throughput_qos{qos}")
 
     print(f"\n📊 QoS {qos} abgeschlossen:")
     print(f"   Gesendet:   {total_sent} → {send_rate:.2f} msg/s")
     print(f"   Empfangen:  {total_received} → {recv_rate:.2f} msg/s")
     print(f"   Verlust:    {total_sent - total_received} ({loss_pct:.2f}%)")
+    print(f"   Duplikate: {seq_stats['Duplikate']} | Außer der Reihe: {seq_stats['Außer Reihe']} | Lücken: {seq_stats['Lücken']}")
     print(f"   CPU: {avg_cpu:.1f}% | RAM: {avg_ram:.1f}%")
+    print(f"   Soll-Rate: {sched['Soll-Rate']:.2f} msg/s | Verspätet: {sched['Verspätet']} | Verpasst: {sched['Verpasst']}")
+    if has_window:
+        print(f"   In-Flight-Fenster: {win['Window']} (max. {win['Max. In-Flight']}) | "
+              f"Ack Ø {win['Ack Ø (ms)']:.2f} ms | Ack Max {win['Ack Max (ms)']:.2f} ms")
+    if worker_results:
+        print(f"   Worker: {workers}")
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Durchsatz ist durch den Client begrenzt: {gen_stats['Grund']}")
 
     # --- Markdown speichern ---
     os.makedirs("latency_markdowns", exist_ok=True)
@@ -87,19 +127,47 @@ def run_mqtt_throughput(args, BROKER_IP):
         f.write(f"- Send-Rate: {send_rate:.2f} msg/s\n")
         f.write(f"- Empfangsrate: {recv_rate:.2f} msg/s\n")
         f.write(f"- Verlustquote: {loss_pct:.2f}%\n")
+        write_sequence_lines(f, seq_stats)
         f.write(f"- CPU%: {avg_cpu:.1f}\n")
         f.write(f"- RAM%: {avg_ram:.1f}\n")
+        f.write(f"- Soll-Rate: {sched['Soll-Rate']:.2f} msg/s\n")
+        f.write(f"- Verspätete Slots: {sched['Verspätet']}\n")
+        f.write(f"- Verpasste Slots: {sched['Verpasst']}\n")
+        f.write(f"- Max. Verzug: {sched['Max. Verzug (ms)']:.2f} ms\n")
+        if has_window:
+            f.write(f"- In-Flight-Fenster: {win['Window']}\n")
+            f.write(f"- Max. In-Flight: {win['Max. In-Flight']}\n")
+            f.write(f"- Ack-Latenz Ø: {win['Ack Ø (ms)']:.2f} ms\n")
+            f.write(f"- Ack-Latenz Max: {win['Ack Max (ms)']:.2f} ms\n")
+        write_generator_lines(f, gen_stats, thread_cpu)
+
+        if worker_results:
+            f.write(f"\n## Publisher-Worker ({workers} Prozesse)\n\n")
+            write_worker_table(f, worker_results)
+
+        sampler.write_markdown(f, resource_csv)
 
     print(f"\n📝 MQTT-Durchsatztest gespeichert unter: {md_file}")
 
-    return {
+    result = {
         "QoS": qos,
         "Gesendet": total_sent,
         "Empfangen": total_received,
         "Send-Rate": send_rate,
         "Recv-Rate": recv_rate,
         "Verlust%": loss_pct,
+        "Duplikate": seq_stats["Duplikate"],
+        "Außer Reihe": seq_stats["Außer Reihe"],
+        "Lücken": seq_stats["Lücken"],
         "Dauer_s": duration,
         "CPU%": avg_cpu,
         "RAM%": avg_ram,
-    }
\ No newline at end of file
+        "Soll-Rate": sched["Soll-Rate"],
+        "Verpasst": sched["Verpasst"],
+        "Window": win["Window"] if has_window else None,
+        "Ack Ø (ms)": win["Ack Ø (ms)"] if has_window else None,
+        "Generator gesättigt": gen_stats["Generator gesättigt"],
+        "Worker": worker_results,
+    }
+    record_run("mqtt_throughput", args, result, files={"Markdown": md_file, "Ressourcen": resource_csv}, qos=qos)
+    return result
\ No newline at end of file
@@ -1,17 +1,52 @@
 # modes/openhab_bridge_echo.py
 import time, json, paho.mqtt.client as mqtt
-from utils import save_latency_csv, save_summary
+from utils import LatencyLogWriter, save_summary, RateScheduler, target_rate, LatencyHistogram
+from utils import InflightTracker, probe_seq
+from utils import PROBE_HEADER, PROBE_SUFFIX, encode_probe, decode_probe, use_binary_probe
 from plot_latency import plot_latency
+from resource_monitor import sampler_from_args, GeneratorMonitor
+from columnar_log import ColumnarWriter
 
 def run_openhab_bridge_echo(args, BROKER_IP):
     command = "ON"
-    latency_data = []
-    sent_timestamps = {}
+    latency_log = LatencyLogWriter(args.mode)  # streamt (Sekunde, Latenz) auf die Platte
+    # pro Nachricht binär: Rundlauf am Client plus openHAB-Command/State-Zeitstempel
+    columns = ColumnarWriter(args.mode, hops=("openhab_command_ns", "openhab_state_ns"))
     total_sent = total_received = 0
+    histogram = LatencyHistogram()  # Perzentile ohne alle Rohwerte sortieren zu müssen
+    # Binärformat: Tag = Command/State (1 = ON, 0 = OFF), Zeitstempel = openHAB Command/State in ns
+    binary = use_binary_probe(args)
+    suffix = PROBE_SUFFIX if binary else ""
+    pad_len = max(0, args.payload_size - PROBE_HEADER.size)
+
+    def on_binary_message(msg):
+        nonlocal command, total_received
+        probe = decode_probe(msg.payload)
+        if not probe or len(probe[3]) < 2:
+            print(f"⚠️ Ungültige Binär-Antwort: {msg.payload!r}")
+            return
+        tag, seq, _, stamps = probe
+        cmd_ns, state_ns = stamps[:2]
+        command = "OFF" if tag else "ON"
+        # Latenz kommt aus den openHAB-Zeitstempeln, der Tracker zählt nur Verlust/Duplikate
+        rtt = inflight.ack(seq)
+        if rtt is None:
+            return
+        t_recv_ns = time.time_ns()
+        columns.append(seq, t_recv_ns - int(rtt * 1e6), t_recv_ns, hops=(cmd_ns, state_ns))
+        latency = (state_ns - cmd_ns) / 1e6
+        duration = time.time() - start_time
+        latency_log.append(duration, latency)
+        histogram.record(latency)
+        print(f"📨 [openHAB Bridge] msg_{seq}: {latency:.2f} ms")
+        total_received += 1
 
     def on_message(client, userdata, msg):
         nonlocal command, total_received
         try:
+            if binary:
+                on_binary_message(msg)
+                return
             payload = json.loads(msg.payload.decode())
             msg_id = payload.get("id")
             cmd_ts = payload.get("openhab_command_time")
@@ -23,10 +58,19 @@ def run_openhab_bridge_echo(args, BROKER_IP):
               command = "ON" if value == "OFF" else "OFF"
 
             # Latenzberechnung
-            if msg_id and isinstance(cmd_ts, (int, float)) and isinstance(state_ts, (int, float)):
+            seq = probe_seq(msg_id)
+            if seq is not None and isinstance(cmd_ts, (int, float)) and isinstance(state_ts, (int, float)):
+                rtt = inflight.ack(seq)
+                if rtt is None:
+                    print(f"⚠️ Verspätete oder doppelte Antwort: {msg_id}")
+                    return
+                t_recv_ns = time.time_ns()
+                columns.append(seq, t_recv_ns - int(rtt * 1e6), t_recv_ns,
+                               hops=(int(cmd_ts * 1e9), int(state_ts * 1e9)))
                 latency = (state_ts - cmd_ts) * 1000
                 duration = time.time() - start_time
-                latency_data.append((duration, latency))
+                latency_log.append(duration, latency)
+                histogram.record(latency)
                 print(f"📨 [openHAB Bridge] {msg_id}: {latency:.2f} ms")
                 total_received += 1
             else:
@@ -35,30 +79,54 @@ def run_openhab_bridge_echo(args, BROKER_IP):
         except Exception as e:
             print("Fehler beim Verarbeiten der Antwort:", e)
 
+    # vor loop_start(), damit on_message nie auf ein noch nicht zugewiesenes inflight trifft
+    scheduler = RateScheduler(target_rate(args), catch_up=not getattr(args, "skip_missed", False))
+    inflight = InflightTracker.for_rate(scheduler.rate, getattr(args, "inflight_timeout", 30.0))
+    start_time = scheduler.t0_wall
     client = mqtt.Client()
     client.on_message = on_message
     client.connect(BROKER_IP, 1883)
-    client.subscribe("/latency/openhab/state", qos=0)
+    client.subscribe("/latency/openhab/state" + suffix, qos=0)
     client.loop_start()
 
-    start_time = time.time()
+    sampler = sampler_from_args(args, BROKER_IP).start()
+    scheduler.start()
+    start_time = scheduler.t0_wall
     i = 0
 
+    gen = GeneratorMonitor(client).start()
     while True:
-        now = time.time()
-        if now - start_time >= args.duration * 60:
+        planned = scheduler.wait()
+        if planned - start_time >= args.duration * 60:
             break
         i += 1
         msg_id = f"msg_{i}"
-        payload = json.dumps({"id": msg_id, "client_timestamp": now, "command": command})
-        print(f"➡️ [openHAB Bridge] Gesendet: {payload}")
-        client.publish("/latency/openhab/command", payload, qos=args.qos)
-        sent_timestamps[msg_id] = now
+        if binary:
+            payload = encode_probe(i, int(planned * 1e9), pad_len, tag=1 if command == "ON" else 0)
+            print(f"➡️ [openHAB Bridge] Gesendet: {msg_id} {command} (binär, {len(payload)} B)")
+        else:
+            payload = json.dumps({"id": msg_id, "client_timestamp": planned, "command": command})
+            print(f"➡️ [openHAB Bridge] Gesendet: {payload}")
+        inflight.send(i, scheduler.perf_ns(planned))
+        t_pub = time.perf_counter_ns()
+        client.publish("/latency/openhab/command" + suffix, payload, qos=args.qos)
+        gen.publish_done(t_pub)
         total_sent += 1
-        time.sleep(args.delay)
 
+    gen_stats = gen.stop().stats(scheduler.stats())
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Latenzen enthalten Verzug des Clients: {gen_stats['Grund']}")
     time.sleep(5)
     client.loop_stop()
-    path = save_latency_csv(latency_data, args.mode)
-    save_summary(latency_data, total_sent, total_received, filepath="openhab_bridge_echo", mode="openhab_bridge_echo", qos=args.qos)
+    inflight.finish()
+    sampler.stop()
+    path = latency_log.close()
+    columns_path = columns.close()
+    save_summary([], total_sent, total_received, duration=latency_log.last_ts,
+                 filepath="openhab_bridge_echo", mode="openhab_bridge_echo", qos=args.qos,
+                 scheduler_stats=scheduler.stats(), histogram=histogram,
+                 inflight_stats=inflight.stats(), resources=sampler, columns=columns_path, args=args,
+                 generator_stats=gen_stats)
+    # Latenz-Log statt Spaltenlog: dieser Modus berichtet openHAB State − Command, das Spaltenlog
+    # enthält als recv_ns − send_ns den Client-Rundlauf
     plot_latency(path, output_folder="latency_plots")
\ No newline at end of file
@@ -1,20 +1,26 @@
 import time, threading, paho.mqtt.client as mqtt
-from utils import generate_payload
+from utils import PayloadFactory, SequenceTracker
+from results_db import record_run
+from load_profiles import scheduler_from_args, curve_from_args
+from resource_monitor import sampler_from_args, GeneratorMonitor
 from datetime import datetime
 import os
-import psutil
 
 def run_openhab_stresstest(args, BROKER_IP):
+    curve = curve_from_args(args)  # Soll/Gesendet/Empfangen je Sekunde, nur mit --profile
     results = []
 
     qos = getattr(args, "qos", 1)  # Standard: QoS 1, kann über CLI gesetzt werden
     print(f"\n🚀 Starte openHAB-Stresstest mit QoS {qos} …")
 
     # --- Subscriber ---
-    total_received = 0
+    # Antworten werden über das Stufen-Präfix der msg_id ihrer Stufe zugeordnet,
+    # auch wenn sie erst während der nächsten Stufe eintreffen
+    sequences = SequenceTracker()
     def on_message(client, userdata, msg):
-        nonlocal total_received
-        total_received += 1
+        sequences.receive(msg.payload)
+        if curve:
+            curve.receive()
 
     sub_client = mqtt.Client(clean_session=True)
     sub_client.on_message = on_message
@@ -29,55 +35,61 @@ def run_openhab_stresstest(args, BROKER_IP):
     pub_client.loop_start()
 
     # --- Stresstest ---
-    current_delay = args.delay       # Start-Delay
+    current_delay = 1.0 / args.rate if getattr(args, "rate", None) else args.delay  # Start-Delay
     step_factor = 0.5                # halbiert Delay pro Stufe
     stage_duration = args.duration   # Dauer pro Stufe in Sekunden
+    drain = getattr(args, "drain", 2.0)  # Wartezeit auf Antworten nach jeder Stufe
     stage = 0
+    sampler = sampler_from_args(args, BROKER_IP).start()  # Systemmonitoring im eigenen Thread
 
     while current_delay > 0.0001:  # Abbruchbedingung
         stage += 1
         total_sent = 0
-        total_received = 0  # Reset pro Stufe
         start_time = time.time()
+        scheduler = scheduler_from_args(args, 1.0 / current_delay, stage_duration, curve)
 
-        # --- Monitoring pro Stufe ---
-        cpu_samples = []
-        ram_samples = []
-
+        stage_prefix = f"openhab_qos{qos}_stage{stage}_msg"
+        payloads = PayloadFactory(args.payload_size, stage_prefix)
+        gen = GeneratorMonitor(pub_client).start()
         while time.time() - start_time < stage_duration:
-            msg_id = f"openhab_qos{qos}_stage{stage}_msg{total_sent}"
-            payload = generate_payload(args.payload_size, msg_id)
+            scheduler.wait()
+            payload = payloads.make(total_sent)
+            t_pub = time.perf_counter_ns()
             pub_client.publish("/stresstest/openhab/command", payload, qos=qos)
+            gen.publish_done(t_pub)
             total_sent += 1
-            if current_delay > 0:
-                time.sleep(current_delay)
-
-            # alle ~5 Sekunden CPU/RAM loggen
-            if total_sent % int(max(1, 5 / current_delay)) == 0:
-                cpu_usage = psutil.cpu_percent(interval=None)
-                ram_usage = psutil.virtual_memory().percent
-                cpu_samples.append(cpu_usage)
-                ram_samples.append(ram_usage)
 
         duration = time.time() - start_time
-        stage_received = total_received  # direkt gezählt in dieser Stufe
+        gen_stats = gen.stop().stats(scheduler.stats())
+        time.sleep(drain)  # Nachzügler dieser Stufe abwarten
+        seq_stats = sequences.stats(stage_prefix)
+        stage_received = seq_stats["Eindeutig"]  # Duplikate/Redeliveries zählen nicht als empfangen
 
         send_rate = total_sent / duration if duration > 0 else 0
         recv_rate = stage_received / duration if duration > 0 else 0
         loss_pct = (1 - (stage_received / total_sent)) * 100 if total_sent > 0 else 0
 
-        avg_cpu = sum(cpu_samples) / len(cpu_samples) if cpu_samples else 0
-        avg_ram = sum(ram_samples) / len(ram_samples) if ram_samples else 0
+        stage_samples = sampler.between(start_time, start_time + duration)
+        avg_cpu = sampler.mean("CPU%", stage_samples)
+        avg_ram = sampler.mean("RAM%", stage_samples)
 
         print(f"\n📊 QoS{qos} – Stufe {stage}: Delay={current_delay:.6f}s")
         print(f"   Gesendet:   {total_sent} → {send_rate:.2f} msg/s")
         print(f"   Empfangen:  {stage_received} → {recv_rate:.2f} msg/s")
         print(f"   Verlust:    {total_sent - stage_received} ({loss_pct:.2f}%)")
+        print(f"   Duplikate: {seq_stats['Duplikate']} | Außer der Reihe: {seq_stats['Außer Reihe']} | Lücken: {seq_stats['Lücken']}")
         print(f"   CPU: {avg_cpu:.1f}% | RAM: {avg_ram:.1f}%")
+        print(f"   Soll-Rate: {scheduler.rate:.2f} msg/s | Verspätet: {scheduler.late} | Verpasst: {scheduler.missed}")
+        print(f"   Generator: Sender-CPU {gen_stats['Sender-CPU%']:.1f}% | publish() p99 {gen_stats['Publish p99 (µs)']:.0f} µs | "
+              f"Queue max {gen_stats['Queue Max']}")
+        if gen_stats["Generator gesättigt"]:
+            print(f"⚠️ Generator gesättigt – Ergebnis dieser Stufe ist durch den Client begrenzt: {gen_stats['Grund']}")
 
         results.append({
             "QoS": qos,
             "Stufe": stage,
+            "Präfix": stage_prefix,
+            "Start": start_time,
             "Delay": current_delay,
             "Gesendet": total_sent,
             "Empfangen": stage_received,
@@ -87,12 +99,29 @@ def run_openhab_stresstest(args, BROKER_IP):
             "Dauer_s": duration,
             "CPU%": avg_cpu,
             "RAM%": avg_ram,
+            "Soll-Rate": scheduler.rate,
+            "Verpasst": scheduler.missed,
+            "Duplikate": seq_stats["Duplikate"],
+            "Außer Reihe": seq_stats["Außer Reihe"],
+            "Lücken": seq_stats["Lücken"],
+            "Sender-CPU%": gen_stats["Sender-CPU%"],
+            "Publish p99 (µs)": gen_stats["Publish p99 (µs)"],
+            "Queue Max": gen_stats["Queue Max"],
+            "Generator gesättigt": gen_stats["Generator gesättigt"],
+            "Grund": gen_stats["Grund"],
         })
 
         current_delay *= step_factor
 
     pub_client.loop_stop()
     sub_client.loop_stop()
+    sampler.stop()
+    resource_csv = sampler.save_csv(f"openhab_stresstest_qos{qos}")
+    curve_csv = curve.save_csv(f"openhab_stresstest_qos{qos}") if curve else None
+
+    # Antworten, die erst nach der Drain-Phase ihrer Stufe ankamen
+    for r in results:
+        r["Nachzügler"] = sequences.stats(r["Präfix"])["Eindeutig"] - r["Empfangen"]
 
     # --- Markdown speichern ---
     os.makedirs("latency_markdowns", exist_ok=True)
@@ -101,12 +130,34 @@ def run_openhab_stresstest(args, BROKER_IP):
 
     with open(md_file, "w", encoding="utf-8") as f:
         f.write(f"# openHAB Stresstest QoS {qos}\n\n")
-        f.write("| Stufe | Delay (s) | Gesendet | Empfangen | Send-Rate (msg/s) | Empfangsrate (msg/s) | Verlust% | CPU% | RAM% |\n")
-        f.write("|-------|-----------|----------|-----------|-------------------|----------------------|----------|------|------|\n")
+        f.write(f"Drain pro Stufe: {drain:.1f} s – Antworten werden über die msg_id ihrer Stufe zugeordnet.\n\n")
+        f.write("| Stufe | Delay (s) | Gesendet | Empfangen | Send-Rate (msg/s) | Empfangsrate (msg/s) | Verlust% | CPU% | RAM% | Soll-Rate (msg/s) | Verpasst | Duplikate | Außer Reihe | Lücken | Nachzügler | Sender-CPU% | Publish p99 (µs) | Queue Max | Generator gesättigt |\n")
+        f.write("|-------|-----------|----------|-----------|-------------------|----------------------|----------|------|------|-------------------|----------|-----------|-------------|--------|------------|-------------|------------------|-----------|---------------------|\n")
         for r in results:
             f.write(f"| {r['Stufe']} | {r['Delay']:.6f} | {r['Gesendet']} | {r['Empfangen']} | "
                     f"{r['Send-Rate']:.2f} | {r['Recv-Rate']:.2f} | {r['Verlust%']:.2f}% | "
-                    f"{r['CPU%']:.1f} | {r['RAM%']:.1f} |\n")
+                    f"{r['CPU%']:.1f} | {r['RAM%']:.1f} | {r['Soll-Rate']:.2f} | {r['Verpasst']} | "
+                    f"{r['Duplikate']} | {r['Außer Reihe']} | {r['Lücken']} | {r['Nachzügler']} | "
+                    f"{r['Sender-CPU%']:.1f} | {r['Publish p99 (µs)']:.0f} | {r['Queue Max']} | "
+                    f"{'ja' if r['Generator gesättigt'] else 'nein'} |\n")
+
+        saturated = [r for r in results if r["Generator gesättigt"]]
+        if saturated:
+            f.write("\n**Generator gesättigt** – diese Stufen messen den Lastgenerator, nicht das SUT:\n\n")
+            for r in saturated:
+                f.write(f"- Stufe {r['Stufe']}: {r['Grund']}\n")
+
+        if curve:
+            curve.write_markdown(f, curve_csv, args.profile)
+        sampler.write_markdown(f, resource_csv)
+        sampler.write_stage_table(f, [(r["Stufe"], r["Start"], r["Start"] + r["Dauer_s"]) for r in results])
 
     print(f"\n📝 openHAB-Stresstest gespeichert unter: {md_file}")
+    record_run("openhab_stresstest", args, {
+        "Stufen": len(results),
+        "Gesendet": sum(r["Gesendet"] for r in results),
+        "Empfangen": sum(r["Empfangen"] for r in results),
+        "Max. Recv-Rate": max((r["Recv-Rate"] for r in results), default=0.0),
+        **(curve.stats() if curve else {}),
+    }, stages=results, files={"Markdown": md_file, "Ressourcen": resource_csv, "Lastverlauf": curve_csv}, qos=qos)
     return results
\ No newline at end of file
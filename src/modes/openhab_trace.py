@@ -0,0 +1,231 @@
+# modes/openhab_trace.py
+# Einzelner Rundlauf MQTT → HABApp → openHAB → HABApp → MQTT, bei dem jeder Hop den
+# Payload stempelt (LatencyOpenHABResponder). Statt Differenzen von Ø-Latenzen aus drei
+# getrennten Läufen (save_segment_markdown) entstehen Segmentverteilungen pro Nachricht.
+import os, time, json, paho.mqtt.client as mqtt
+from datetime import datetime
+from utils import LatencyLogWriter, save_summary, RateScheduler, target_rate, LatencyHistogram
+from utils import InflightTracker, probe_seq
+from utils import PROBE_HEADER, PROBE_SUFFIX, encode_probe, decode_probe, use_binary_probe
+from resource_monitor import sampler_from_args, GeneratorMonitor, write_generator_lines
+from clock_sync import ClockSync, finish_clock_sync, write_clock_lines
+from columnar_log import ColumnarWriter, ColumnarLog
+
+HOPS = ("client_send", "habapp_recv", "openhab_command", "openhab_state", "habapp_publish", "client_recv")
+SUT_HOPS = HOPS[1:-1]
+
+# (Segment, von, bis, Uhr) – "Client/SUT" heißt: Differenz über zwei Hosts, enthält den Uhrenversatz
+# (mit --clock_sync um den geschätzten Versatz korrigiert)
+SEGMENTS = (
+    ("Client → HABApp", "client_send", "habapp_recv", "Client/SUT"),
+    ("HABApp → openHAB-Command", "habapp_recv", "openhab_command", "SUT"),
+    ("openHAB Command → State", "openhab_command", "openhab_state", "SUT"),
+    ("HABApp State → Publish", "openhab_state", "habapp_publish", "SUT"),
+    ("HABApp → Client", "habapp_publish", "client_recv", "Client/SUT"),
+)
+
+
+def trace_segments(stamps):
+    """
+    Segmentdauern in ms aus den Hop-Zeitstempeln (Sekunden) einer Nachricht.
+    Zusätzlich: Netz hin+zurück (Versatz hebt sich auf), SUT gesamt und Rundlauf.
+    """
+    seg = {name: (stamps[b] - stamps[a]) * 1000 for name, a, b, _ in SEGMENTS}
+    sut = (stamps["habapp_publish"] - stamps["habapp_recv"]) * 1000
+    rtt = (stamps["client_recv"] - stamps["client_send"]) * 1000
+    seg["SUT gesamt"] = sut
+    seg["Netz hin+zurück"] = rtt - sut
+    seg["Rundlauf"] = rtt
+    return seg
+
+
+SEGMENT_CLOCKS = {**{name: clock for name, _, _, clock in SEGMENTS},
+                  "SUT gesamt": "SUT", "Netz hin+zurück": "Client + SUT", "Rundlauf": "Client"}
+CROSS_HOST = [name for name, _, _, clock in SEGMENTS if clock == "Client/SUT"]
+
+
+def run_openhab_trace(args, BROKER_IP):
+    qos = getattr(args, "qos", 0)
+    command = "ON"
+    latency_log = LatencyLogWriter("openhab_trace")  # streamt (Sekunde, Latenz) auf die Platte
+    # Rohstempel pro Nachricht (SUT-Hops unkorrigiert auf der SUT-Uhr); Segmente werden nach dem
+    # Lauf blockweise daraus berechnet, der Speicher bleibt unabhängig von der Laufzeit konstant
+    columns = ColumnarWriter("openhab_trace", hops=tuple(f"{hop}_ns" for hop in SUT_HOPS))
+    histograms = {name: LatencyHistogram() for name in SEGMENT_CLOCKS}
+    clock = ClockSync(BROKER_IP).start() if getattr(args, "clock_sync", False) else None
+    rtt_histogram = LatencyHistogram()
+    total_sent = total_received = 0
+    binary = use_binary_probe(args)
+    suffix = PROBE_SUFFIX if binary else ""
+    pad_len = max(0, args.payload_size - PROBE_HEADER.size)
+    print(f"\n🚀 Starte openHAB-Trace mit QoS {qos} ({'binär' if binary else 'JSON'}) …")
+
+    def parse(msg, t_recv):
+        """(seq, neuer State, Hop-Zeitstempel) oder None"""
+        if binary:
+            probe = decode_probe(msg.payload)
+            if not probe or len(probe[3]) < 4:
+                print(f"⚠️ Binär-Antwort ohne Trace-Stempel (Responder aktuell?): {msg.payload!r}")
+                return None
+            tag, seq, send_ns, (cmd_ns, state_ns, recv_ns, pub_ns) = probe[0], probe[1], probe[2], probe[3][:4]
+            stamps = (send_ns, recv_ns, cmd_ns, state_ns, pub_ns)
+            return seq, "ON" if tag else "OFF", dict(zip(HOPS, [s / 1e9 for s in stamps] + [t_recv]))
+
+        payload = json.loads(msg.payload.decode())
+        values = [payload.get(f"{hop}_time") for hop in HOPS[:-1]]
+        if not all(isinstance(v, (int, float)) for v in values):
+            print(f"⚠️ Antwort ohne vollständige Trace-Stempel (Responder aktuell?): {payload}")
+            return None
+        return probe_seq(payload.get("id")), payload.get("state"), dict(zip(HOPS, values + [t_recv]))
+
+    def on_message(client, userdata, msg):
+        nonlocal command, total_received
+        t_recv = time.time()
+        try:
+            parsed = parse(msg, t_recv)
+            if parsed is None:
+                return
+            seq, state, stamps = parsed
+            if state in ("ON", "OFF"):
+                command = "ON" if state == "OFF" else "OFF"
+            if seq is None:
+                return
+            rtt = inflight.ack(seq)  # ab geplantem Sendezeitpunkt, gegen Coordinated Omission korrigiert
+            if rtt is None:
+                return
+            rtt_histogram.record(rtt)
+            latency_log.append(t_recv - start_time, rtt)
+            columns.append(seq, int(stamps["client_send"] * 1e9), int(t_recv * 1e9),
+                           hops=[int(stamps[hop] * 1e9) for hop in SUT_HOPS])
+            total_received += 1
+        except Exception as e:
+            print("Fehler beim Verarbeiten der Antwort:", e)
+
+    # vor loop_start(), damit on_message nie auf ein noch nicht zugewiesenes inflight trifft
+    scheduler = RateScheduler(target_rate(args), catch_up=not getattr(args, "skip_missed", False))
+    inflight = InflightTracker.for_rate(scheduler.rate, getattr(args, "inflight_timeout", 30.0))
+    start_time = scheduler.t0_wall
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(BROKER_IP, 1883)
+    client.subscribe("/latency/openhab/state" + suffix, qos=qos)
+    client.loop_start()
+
+    sampler = sampler_from_args(args, BROKER_IP).start()
+    scheduler.start()
+    start_time = scheduler.t0_wall
+    i = 0
+
+    gen = GeneratorMonitor(client).start()
+    while True:
+        planned = scheduler.wait()
+        if planned - start_time >= args.duration * 60:
+            break
+        i += 1
+        inflight.send(i, scheduler.perf_ns(planned))
+        t_send = time.time()
+        if binary:
+            # Sendezeit im Header = tatsächlicher Sendezeitpunkt (erster Hop)
+            payload = encode_probe(i, int(t_send * 1e9), pad_len, tag=1 if command == "ON" else 0)
+        else:
+            payload = json.dumps({"id": f"msg_{i}", "client_timestamp": planned,
+                                  "client_send_time": t_send, "command": command})
+        t_pub = time.perf_counter_ns()
+        client.publish("/latency/openhab/command" + suffix, payload, qos=qos)
+        gen.publish_done(t_pub)
+        total_sent += 1
+
+    gen_stats = gen.stop().stats(scheduler.stats())
+    if gen_stats["Generator gesättigt"]:
+        print(f"⚠️ Generator gesättigt – Latenzen enthalten Verzug des Clients: {gen_stats['Grund']}")
+    time.sleep(getattr(args, "drain", 2.0))
+    client.loop_stop()
+    inflight.finish()
+    sampler.stop()
+
+    path = latency_log.close()
+    columns_path = columns.close()
+    clock_stats = finish_clock_sync(clock)  # None ohne --clock_sync oder ohne beantwortete Probe
+
+    # --- Segmente und Rohdaten pro Nachricht ---
+    # Erst nach dem Lauf, damit der Versatz alle Sync-Proben nutzt; gelesen wird das Spaltenlog
+    # blockweise per mmap, nicht eine Liste aller Nachrichten im Speicher.
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs("latency_logs_stability", exist_ok=True)
+    trace_csv = os.path.join("latency_logs_stability", f"trace_openhab_{ts}.csv")
+    # Ohne --clock_sync enthalten Client/SUT-Segmente den unbekannten Uhrenversatz – nicht auswerten
+    reported = [name for name in SEGMENT_CLOCKS if clock_stats or name not in CROSS_HOST]
+    log = ColumnarLog(columns_path)
+    with open(trace_csv, "w", encoding="utf-8") as f:
+        f.write("Seq;" + ";".join(HOPS) + ";" + ";".join(f"{name} (ms)" for name in SEGMENT_CLOCKS) + "\n")
+        for chunk in log.chunks(["seq", "send_ns"] + [f"{hop}_ns" for hop in SUT_HOPS] + ["recv_ns"]):
+            for seq, *hop_ns in zip(*chunk):
+                stamps = dict(zip(HOPS, [ns / 1e9 for ns in hop_ns]))
+                if clock_stats:
+                    offset = clock.offset_at(stamps["client_send"])
+                    for hop in SUT_HOPS:
+                        stamps[hop] -= offset
+                segments = trace_segments(stamps)
+                for name in reported:
+                    histograms[name].record(segments[name])
+                f.write(f"{seq};" + ";".join(f"{stamps[h]:.6f}" for h in HOPS) + ";"
+                        + ";".join(f"{segments[name]:.3f}" if name in reported else ""
+                                   for name in SEGMENT_CLOCKS) + "\n")
+    log.close()
+
+    save_summary([], total_sent, total_received, duration=latency_log.last_ts,
+                 filepath="openhab_trace", mode="openhab_trace", qos=qos,
+                 scheduler_stats=scheduler.stats(), histogram=rtt_histogram,
+                 inflight_stats=inflight.stats(), resources=sampler, clock_stats=clock_stats, columns=columns_path,
+                 one_way={name: histograms[name] for name in CROSS_HOST} if clock_stats else None, args=args,
+                 generator_stats=gen_stats)
+
+    # --- Segmentverteilungen ---
+    rtt_mean = histograms["Rundlauf"].mean()
+    os.makedirs("latency_markdowns", exist_ok=True)
+    md_file = os.path.join("latency_markdowns", f"openhab_trace_qos{qos}_{ts}.md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(f"# openHAB Trace QoS {qos}\n\n")
+        f.write(f"- Gesendet: {total_sent}\n")
+        f.write(f"- Empfangen: {total_received}\n")
+        loss = (total_sent - total_received) / total_sent * 100 if total_sent else 0
+        f.write(f"- Verlustquote: {loss:.2f}%\n")
+        f.write(f"- Rundlauf ab geplantem Sendezeitpunkt p50/p99: {rtt_histogram.percentile(50):.2f} / "
+                f"{rtt_histogram.percentile(99):.2f} ms\n")
+        write_generator_lines(f, gen_stats, gen.thread_cpu)
+        if clock_stats:
+            write_clock_lines(f, clock_stats)
+            f.write(f"- Segmente über Client/SUT sind um den Versatz korrigiert, Unsicherheit "
+                    f"± {clock_stats['Fehlergrenze (ms)']:.3f} ms.\n\n")
+        else:
+            f.write("- Segmente über Client/SUT (–) werden ohne `--clock_sync` (bzw. ohne beantwortete "
+                    "Sync-Probe) nicht ausgewertet: sie enthielten den "
+                    "unbekannten Uhrenversatz beider Hosts. \"Netz hin+zurück\" und alle SUT-Segmente sind davon "
+                    "unabhängig.\n\n")
+        f.write("| Segment | Uhr | Anzahl | Ø (ms) | Min | p50 | p90 | p99 | Max | Anteil am Rundlauf |\n")
+        f.write("|---------|-----|--------|--------|-----|-----|-----|-----|-----|--------------------|\n")
+        negative = []
+        for name, segment_clock in SEGMENT_CLOCKS.items():
+            if name not in reported:
+                f.write(f"| {name} | {segment_clock} | – | – | – | – | – | – | – | – |\n")
+                continue
+            s = histograms[name].summary()
+            share = s["Ø"] / rtt_mean * 100 if rtt_mean else 0
+            f.write(f"| {name} | {segment_clock} | {s['Anzahl']} | {s['Ø']:.2f} | {s['Min']:.2f} | {s['p50']:.2f} | "
+                    f"{s['p90']:.2f} | {s['p99']:.2f} | {s['Max']:.2f} | {share:.1f}% |\n")
+            if s["Negativ"]:
+                negative.append(f"{name}: {s['Negativ']}")
+        if negative:
+            f.write(f"\nNegative Werte (Versatzschätzung ungenauer als das Segment, nicht in der Tabelle): "
+                    f"{', '.join(negative)}\n")
+        f.write(f"\nWerte pro Nachricht: `{trace_csv}`\n")
+        sampler.write_markdown(f, sampler.save_csv("openhab_trace"))
+
+    print(f"\n📊 openHAB-Trace: {total_received}/{total_sent} Rundläufe")
+    for name in SEGMENT_CLOCKS:
+        if name in reported:
+            print(f"   {name:<26} Ø {histograms[name].mean():8.2f} ms | p99 {histograms[name].percentile(99):8.2f} ms")
+        else:
+            print(f"   {name:<26} – (Uhrenversatz unbekannt, --clock_sync)")
+    print(f"\n📝 openHAB-Trace gespeichert unter: {md_file}")
+    return path
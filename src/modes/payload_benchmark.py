@@ -0,0 +1,65 @@
+# modes/payload_benchmark.py
+# Mikro-Benchmark: Payload-Erzeugung mit generate_payload (json.dumps pro Nachricht)
+# gegen PayloadFactory (vorgerendertes Template). Kein Broker nötig.
+import os, time
+from datetime import datetime
+from utils import generate_payload, PayloadFactory
+from results_db import record_run
+
+
+def _rate_per_core(fn, iterations):
+    # process_time misst CPU-Zeit dieses Prozesses → msg/s pro Kern
+    t0 = time.process_time()
+    fn(iterations)
+    cpu = time.process_time() - t0
+    return iterations / cpu if cpu > 0 else 0
+
+
+def run_payload_benchmark(args, BROKER_IP):
+    iterations = getattr(args, "iterations", 200000)
+    sizes = sorted({64, 256, 1024, 4096, args.payload_size})
+    print(f"\n🚀 Starte Payload-Benchmark ({iterations} Nachrichten pro Größe) …")
+
+    results = []
+    for size in sizes:
+        def old(n):
+            # paho kodiert str-Payloads bei jedem publish() nach UTF-8
+            for i in range(n):
+                generate_payload(size, f"bench_msg{i}").encode()
+
+        payloads = PayloadFactory(size, "bench_msg")
+
+        def new(n):
+            make = payloads.make
+            for i in range(n):
+                make(i)
+
+        old_rate = _rate_per_core(old, iterations)
+        new_rate = _rate_per_core(new, iterations)
+        speedup = new_rate / old_rate if old_rate > 0 else 0
+        print(f"   {size:>5} B: vorher {old_rate:,.0f} msg/s | nachher {new_rate:,.0f} msg/s | Faktor {speedup:.1f}x")
+        results.append({
+            "Payload (B)": size,
+            "Vorher (msg/s/Kern)": old_rate,
+            "Nachher (msg/s/Kern)": new_rate,
+            "Faktor": speedup,
+        })
+
+    os.makedirs("latency_markdowns", exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    md_file = os.path.join("latency_markdowns", f"payload_benchmark_{ts}.md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write("# Payload-Benchmark\n\n")
+        f.write(f"- Nachrichten pro Größe: {iterations}\n")
+        f.write("- Vorher: generate_payload() + UTF-8-Kodierung\n")
+        f.write("- Nachher: PayloadFactory.make()\n\n")
+        f.write("| Payload (B) | Vorher (msg/s/Kern) | Nachher (msg/s/Kern) | Faktor |\n")
+        f.write("|-------------|---------------------|----------------------|--------|\n")
+        for r in results:
+            f.write(f"| {r['Payload (B)']} | {r['Vorher (msg/s/Kern)']:.0f} | "
+                    f"{r['Nachher (msg/s/Kern)']:.0f} | {r['Faktor']:.1f}x |\n")
+
+    print(f"\n📝 Payload-Benchmark gespeichert unter: {md_file}")
+    record_run("payload_benchmark", args, {"Nachrichten pro Größe": iterations}, stages=results,
+               files={"Markdown": md_file})
+    return results
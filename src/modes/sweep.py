@@ -0,0 +1,176 @@
+# modes/sweep.py
+# Führt einen oder mehrere Modi über ein Parameter-Raster aus, z. B.
+#   python3 main.py --mode sweep --duration 1 \
+#       --grid "mode=mqtt_throughput,habapp_throughput qos=0,1,2 payload_size=64,1024 rate=100,1000"
+# Nach jeder Zelle wird latency_sweeps/<name>/checkpoint.json geschrieben; ein erneuter Aufruf mit
+# demselben --sweep_name überspringt die fertigen Zellen. Die Kennzahlen jeder Zelle kommen aus der
+# Ergebnisdatenbank, Logs und Markdown-Berichte legen die Modi wie gewohnt ab.
+import argparse, itertools, json, os, time, traceback
+from datetime import datetime
+from mode_registry import MODES, OPTIONS, load_mode, mode_defaults
+from results_db import last_run_id, runs_after
+
+SWEEP_FOLDER = "latency_sweeps"
+SWEEP_OPTIONS = ("grid", "cooldown", "sweep_name")
+TABLE_METRICS = ("Gesendet", "Empfangen", "Send-Rate", "Recv-Rate", "Max. Recv-Rate", "Verlust%",
+                 "Ø Latenz", "p50", "p99", "CPU%", "Generator gesättigt")
+
+
+def _value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return {"true": True, "false": False}.get(text.lower(), text)
+
+
+def parse_grid(spec: str):
+    """
+    Raster als {Name: [Werte]}: entweder "qos=0,1,2 payload_size=64,1024" (Leerzeichen oder ';'
+    getrennt) oder Pfad einer JSON-Datei {"qos": [0, 1, 2], ...}. "mode" steht immer vorn.
+    """
+    if spec.endswith(".json"):
+        with open(spec, encoding="utf-8") as f:
+            grid = {k: v if isinstance(v, list) else [v] for k, v in json.load(f).items()}
+    else:
+        grid = {}
+        for item in spec.replace(";", " ").split():
+            key, _, values = item.partition("=")
+            if not values:
+                raise ValueError(f"Rasterangabe ohne Werte: {item!r} (Format name=w1,w2)")
+            grid[key.lstrip("-")] = [_value(v) for v in values.split(",")]
+    return {"mode": grid.pop("mode", ["mqtt_throughput"]), **grid}
+
+
+def grid_cells(grid):
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def _cell_key(cell):
+    return json.dumps(cell, sort_keys=True, ensure_ascii=False)
+
+
+def _save_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, default=str)
+    os.replace(tmp, path)  # atomar: ein Abbruch hinterlässt nie einen halben Checkpoint
+
+
+def run_sweep(args, BROKER_IP):
+    grid = parse_grid(getattr(args, "grid", None) or "qos=0,1,2")
+    unknown = [m for m in grid["mode"] if m not in MODES or m == "sweep"]
+    if unknown:
+        print(f"❌ Unbekannte Modi im Raster: {', '.join(map(str, unknown))} (siehe --list-modes)")
+        return None
+    base = {k: v for k, v in vars(args).items() if k not in SWEEP_OPTIONS}
+    known = set(base) | {flag.lstrip("-") for flag in OPTIONS}
+    for key in grid:
+        if key not in known:
+            print(f"⚠️ Rasterparameter {key!r} wird von keinem Modus gelesen")
+
+    cooldown = getattr(args, "cooldown", None)
+    if cooldown is None:
+        cooldown = getattr(args, "pause_between_qos", 5)
+    name = getattr(args, "sweep_name", None) or datetime.now().strftime("%Y%m%d_%H%M%S")
+    folder = os.path.join(SWEEP_FOLDER, name)
+    os.makedirs(folder, exist_ok=True)
+    checkpoint_path = os.path.join(folder, "checkpoint.json")
+    cells = grid_cells(grid)
+
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint["Raster"] != grid:
+            print(f"❌ {checkpoint_path} gehört zu einem anderen Raster – anderen --sweep_name wählen")
+            return None
+        done = sum(1 for c in checkpoint["Zellen"].values() if c["Status"] == "ok")
+        print(f"\n↩️ Setze Sweep {name} fort: {done}/{len(cells)} Zellen bereits fertig")
+    else:
+        checkpoint = {"Raster": grid, "Basis": base, "Zellen": {}}
+        _save_json(checkpoint_path, checkpoint)
+
+    print(f"\n🚀 Starte Sweep {name}: {len(cells)} Zellen über "
+          + " × ".join(f"{k} ({len(v)})" for k, v in grid.items()) + f", Abkühlpause {cooldown} s")
+
+    first = True
+    for nr, cell in enumerate(cells, start=1):
+        key = _cell_key(cell)
+        if checkpoint["Zellen"].get(key, {}).get("Status") == "ok":
+            continue
+        if not first and cooldown > 0:
+            print(f"⏸️ Abkühlpause {cooldown} s …")
+            time.sleep(cooldown)
+        first = False
+
+        print(f"\n🔲 Zelle {nr}/{len(cells)}: " + ", ".join(f"{k}={v}" for k, v in cell.items()))
+        cell_args = argparse.Namespace(**{**mode_defaults(cell["mode"]), **base, **cell})
+        marker = last_run_id()
+        entry = {"Nr": nr, "Parameter": cell, "Start": datetime.now().isoformat(timespec="seconds")}
+        t0 = time.time()
+        try:
+            load_mode(cell["mode"])(cell_args, BROKER_IP)
+            entry["Status"] = "ok"
+        except Exception as e:  # Strg+C bricht ab, der Checkpoint steht dann auf der letzten fertigen Zelle
+            traceback.print_exc()
+            entry["Status"] = f"Fehler: {e}"
+            print(f"⚠️ Zelle {nr} fehlgeschlagen – wird beim Fortsetzen wiederholt")
+        entry["Dauer_s"] = time.time() - t0
+        runs = runs_after(marker)
+        entry["Läufe"] = [r["id"] for r in runs]
+        _save_json(os.path.join(folder, f"cell_{nr:03d}.json"), {**entry, "Ergebnisse": runs})
+        checkpoint["Zellen"][key] = entry
+        _save_json(checkpoint_path, checkpoint)
+
+    return _write_sweep_table(name, folder, grid, cells, checkpoint)
+
+
+def _write_sweep_table(name, folder, grid, cells, checkpoint):
+    """Eine Zeile pro gespeichertem Lauf aller Zellen, als CSV im Sweep-Ordner und als Markdown."""
+    rows = []
+    for nr, cell in enumerate(cells, start=1):
+        entry = checkpoint["Zellen"].get(_cell_key(cell))
+        cell_file = os.path.join(folder, f"cell_{nr:03d}.json")
+        if not entry or not os.path.exists(cell_file):
+            rows.append({"Zelle": nr, **cell, "Status": "offen", "Lauf": "–", "metrics": {}})
+            continue
+        with open(cell_file, encoding="utf-8") as f:
+            runs = json.load(f)["Ergebnisse"]
+        for run in runs or [{"id": None, "mode": cell["mode"], "metrics": {}}]:
+            rows.append({"Zelle": nr, **cell, "Status": entry["Status"],
+                         "Lauf": f"#{run['id']} {run['mode']}" if run["id"] else "–", "metrics": run["metrics"]})
+
+    metrics = [m for m in TABLE_METRICS if any(m in r["metrics"] for r in rows)]
+    columns = ["Zelle", *grid, "Status", "Lauf"]
+
+    def cell_text(r, m, digits, missing="–"):
+        v = r["metrics"].get(m)
+        if v is None:
+            return missing
+        return f"{v:.0f}" if float(v).is_integer() else f"{v:.{digits}f}"
+
+    csv_file = os.path.join(folder, "sweep.csv")
+    with open(csv_file, "w", encoding="utf-8") as f:
+        f.write(";".join(columns + metrics) + "\n")
+        for r in rows:
+            f.write(";".join([str(r[c]) for c in columns] + [cell_text(r, m, 3, "") for m in metrics]) + "\n")
+
+    os.makedirs("latency_markdowns", exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    md_file = os.path.join("latency_markdowns", f"sweep_{name}_{ts}.md")
+    done = sum(1 for c in checkpoint["Zellen"].values() if c["Status"] == "ok")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write(f"# Sweep {name}\n\n")
+        f.write(f"- Raster: " + " × ".join(f"{k} = {', '.join(map(str, v))}" for k, v in grid.items()) + "\n")
+        f.write(f"- Zellen fertig: {done}/{len(cells)}\n")
+        f.write(f"- Rohdaten pro Zelle: `{folder}/cell_<nr>.json`, Tabelle als CSV: `{csv_file}`\n\n")
+        f.write("| " + " | ".join(columns + metrics) + " |\n")
+        f.write("|" + "|".join("---" for _ in columns + metrics) + "|\n")
+        for r in rows:
+            f.write("| " + " | ".join([str(r[c]) for c in columns]
+                                      + [cell_text(r, m, 2) for m in metrics]) + " |\n")
+
+    print(f"\n📝 Sweep-Tabelle gespeichert unter: {md_file} ({done}/{len(cells)} Zellen fertig)")
+    return rows
@@ -0,0 +1,78 @@
+# modes/traffic_record.py
+# Schneidet den Verkehr eines Brokers mit (Standard: alles unter "#") und schreibt Topic, QoS,
+# Payload und Empfangszeit in ein Traffic-Log (traffic_log.py). Abonniert wird mit QoS 2,
+# damit jede Nachricht mit ihrer ursprünglichen QoS ankommt. Retained-Nachrichten, die der
+# Broker beim Abonnieren ausliefert, sind Zustand und kein Verkehr – sie werden nur gezählt.
+#   python3 main.py --mode traffic_record --duration 60 --record_topics "#"
+import os, time, paho.mqtt.client as mqtt
+from datetime import datetime
+from traffic_log import TrafficWriter
+from results_db import record_run
+
+
+def run_traffic_record(args, BROKER_IP):
+    topics = [t.strip() for t in (getattr(args, "record_topics", None) or "#").split(",") if t.strip()]
+    writer = TrafficWriter()
+    skipped_retained = 0
+
+    def on_message(client, userdata, msg):
+        nonlocal skipped_retained
+        if msg.retain:
+            skipped_retained += 1
+            return
+        writer.append(msg.topic, msg.payload, msg.qos)
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(BROKER_IP, 1883)
+    for topic in topics:
+        client.subscribe(topic, qos=2)
+    client.loop_start()
+
+    print(f"\n⏺️ Zeichne {', '.join(topics)} für {args.duration} min auf → {writer.path} (Strg+C beendet früher)")
+    start_time = time.time()
+    next_report = start_time + 10
+    try:
+        while time.time() - start_time < args.duration * 60:
+            time.sleep(0.5)
+            if time.time() >= next_report:
+                print(f"   {writer.messages} Nachrichten, {len(writer.topics)} Topics, {writer.bytes / 1e6:.1f} MB")
+                next_report += 10
+    except KeyboardInterrupt:
+        print("\n⏹️ Aufnahme abgebrochen – Log bleibt bis zur letzten Nachricht gültig")
+    client.loop_stop()
+    client.disconnect()
+    duration = time.time() - start_time
+    path = writer.close()
+
+    rate = writer.messages / duration if duration > 0 else 0
+    top = sorted(writer.topics.items(), key=lambda kv: writer.counts[kv[1]], reverse=True)
+
+    os.makedirs("latency_markdowns", exist_ok=True)
+    md_file = os.path.join("latency_markdowns", f"traffic_record_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write("# Traffic-Mitschnitt\n\n")
+        f.write(f"- Log: `{path}` ({os.path.getsize(path) / 1e6:.2f} MB)\n")
+        f.write(f"- Abonniert: {', '.join(f'`{t}`' for t in topics)}\n")
+        f.write(f"- Dauer: {duration:.1f} s\n")
+        f.write(f"- Nachrichten: {writer.messages} ({rate:.2f} msg/s), Payload gesamt {writer.bytes / 1e6:.2f} MB\n")
+        f.write(f"- Topics: {len(writer.topics)}\n")
+        f.write(f"- Übersprungene Retained-Nachrichten: {skipped_retained}\n\n")
+        f.write("## Häufigste Topics\n\n")
+        f.write("| Topic | Nachrichten | Anteil |\n")
+        f.write("|-------|-------------|--------|\n")
+        for topic, topic_id in top[:30]:
+            count = writer.counts[topic_id]
+            f.write(f"| `{topic}` | {count} | {count / writer.messages * 100:.1f}% |\n")
+
+    print(f"\n📝 {writer.messages} Nachrichten aufgezeichnet: {path}")
+    print(f"📝 Übersicht gespeichert unter: {md_file}")
+    record_run("traffic_record", args, {
+        "Dauer_s": duration,
+        "Nachrichten": writer.messages,
+        "Topics": len(writer.topics),
+        "Bytes": writer.bytes,
+        "Rate": rate,
+        "Retained übersprungen": skipped_retained,
+    }, files={"Traffic-Log": path, "Markdown": md_file})
+    return path
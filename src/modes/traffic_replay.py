@@ -0,0 +1,157 @@
+# modes/traffic_replay.py
+# Spielt ein Traffic-Log (traffic_record) erneut ab:
+#   --speed 1   Echtzeit, --speed N  N-fach schneller, --speed 0  so schnell wie möglich
+#   --connections N   Topics werden fest auf N Verbindungen verteilt (Reihenfolge je Topic bleibt)
+#   --profile …       Abstände neu formen (z. B. constant, poisson) bei gleicher mittlerer Rate
+# Topics bekommen --topic_prefix vorangestellt (Standard "replay/"), damit ein Mitschnitt aus
+# dem Produktivsystem keine echten Geräte schaltet; --topic_prefix "" spielt 1:1 ab.
+# Gemessen wird der Verzug jeder Nachricht gegenüber ihrem Soll-Zeitpunkt.
+#   python3 main.py --mode traffic_replay --log latency_traffic/traffic_<ts>.mqtr --speed 10 --connections 20
+import os, time, paho.mqtt.client as mqtt
+from datetime import datetime
+from traffic_log import TrafficLog, latest_traffic_log
+from load_profiles import ProfileScheduler, LoadCurve
+from utils import LatencyHistogram
+from results_db import record_run
+
+DRIFT_SEGMENTS = 20
+
+
+def run_traffic_replay(args, BROKER_IP):
+    path = getattr(args, "log", None) or latest_traffic_log()
+    if not path or not os.path.exists(path):
+        print(f"❌ Kein Traffic-Log gefunden ({path or 'latency_traffic/ ist leer'}) – erst --mode traffic_record")
+        return None
+    log = TrafficLog(path)
+    messages, size, span, counts = log.scan()
+    if not messages:
+        print(f"❌ {path} enthält keine Nachrichten")
+        return None
+    speed = getattr(args, "speed", 1.0) or 0.0
+    connections = max(1, getattr(args, "connections", 1))
+    prefix = getattr(args, "topic_prefix", "replay/") or ""
+    profile = getattr(args, "profile", None)
+    if profile and speed <= 0:
+        print("⚠️ --profile braucht eine Zielgeschwindigkeit (--speed > 0) – spiele ohne Profil ab")
+        profile = None
+    target_span = span / speed if speed > 0 else 0.0
+
+    print(f"\n▶️ Spiele {messages} Nachrichten ({len(counts)} Topics, {span:.1f} s aufgezeichnet) ab: "
+          + (f"{speed:g}× → {target_span:.1f} s" if speed > 0 else "maximale Geschwindigkeit")
+          + f", {connections} Verbindung(en)" + (f", Profil {profile}" if profile else ""))
+
+    clients = []
+    for i in range(connections):
+        client = mqtt.Client(client_id=f"replay_{os.getpid()}_{i}")
+        client.connect(BROKER_IP, 1883)
+        client.loop_start()
+        clients.append(client)
+
+    curve = LoadCurve()
+    drift = LatencyHistogram()  # Verzug gegenüber dem Soll-Zeitpunkt in ms
+    segment_max = [0.0] * DRIFT_SEGMENTS
+    scheduler = None
+    if profile:
+        scheduler = ProfileScheduler(profile, messages / target_span if target_span > 0 else messages,
+                                     target_span, catch_up=True, seed=getattr(args, "seed", None), curve=curve)
+    out_topics = []
+    first_ns = None
+    sent = 0
+
+    t0_wall = time.time()
+    t0 = time.perf_counter()
+    if scheduler:
+        scheduler.start()  # Profil-Takt ab jetzt, der Scheduler führt die Soll/Ist-Kurve selbst
+    else:
+        curve.start(t0_wall)
+    try:
+        for offset_ns, topic_id, qos, _, payload in log:
+            if first_ns is None:
+                first_ns = offset_ns
+            if scheduler:
+                planned = scheduler.wait()
+                due = scheduler.perf_ns(planned) / 1e9
+                now = time.perf_counter()
+            elif speed > 0:
+                due = t0 + (offset_ns - first_ns) / 1e9 / speed
+                curve.offer(due - t0)
+                now = time.perf_counter()
+                if now < due:
+                    time.sleep(due - now)
+                    now = time.perf_counter()
+                curve.send(now - t0)
+            else:
+                due = now = time.perf_counter()
+            while topic_id >= len(out_topics):
+                out_topics.append(prefix + log.topics[len(out_topics)])
+            clients[topic_id % connections].publish(out_topics[topic_id], payload, qos=qos)
+            sent += 1
+
+            lag_ms = max(0.0, now - due) * 1000
+            drift.record(lag_ms)
+            segment = min(int(sent / messages * DRIFT_SEGMENTS), DRIFT_SEGMENTS - 1)
+            segment_max[segment] = max(segment_max[segment], lag_ms)
+    except KeyboardInterrupt:
+        print("\n⏹️ Wiedergabe abgebrochen")
+    elapsed = time.perf_counter() - t0
+    log.close()
+
+    time.sleep(1.0)  # ausgehende Queues der Verbindungen leeren lassen
+    for client in clients:
+        client.loop_stop()
+        client.disconnect()
+
+    result = {
+        "Nachrichten": sent,
+        "Topics": len(counts),
+        "Verbindungen": connections,
+        "Aufgezeichnet_s": span,
+        "Wiedergabe_s": elapsed,
+        "Soll-Speed": speed,
+        "Ist-Speed": span / elapsed if elapsed > 0 else 0.0,
+        "Send-Rate": sent / elapsed if elapsed > 0 else 0.0,
+    }
+    if speed > 0:
+        summary = drift.summary()
+        result.update({
+            "Soll-Dauer_s": target_span,
+            "Enddrift_s": elapsed - target_span,
+            "Drift Ø (ms)": summary["Ø"],
+            "Drift p50 (ms)": summary["p50"],
+            "Drift p99 (ms)": summary["p99"],
+            "Drift Max (ms)": summary["Max"],
+        })
+
+    print(f"\n📊 {sent} Nachrichten in {elapsed:.2f} s ({result['Send-Rate']:.0f} msg/s, {result['Ist-Speed']:.2f}×)")
+    if speed > 0:
+        print(f"   Verzug: Ø {result['Drift Ø (ms)']:.2f} ms | p99 {result['Drift p99 (ms)']:.2f} ms | "
+              f"max {result['Drift Max (ms)']:.2f} ms | Ende {result['Enddrift_s'] * 1000:+.0f} ms")
+
+    curve_csv = curve.save_csv("traffic_replay") if speed > 0 else None
+    os.makedirs("latency_markdowns", exist_ok=True)
+    md_file = os.path.join("latency_markdowns", f"traffic_replay_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md")
+    with open(md_file, "w", encoding="utf-8") as f:
+        f.write("# Traffic-Wiedergabe\n\n")
+        f.write(f"- Log: `{path}`\n")
+        f.write(f"- Nachrichten: {sent} von {messages}, {len(counts)} Topics, {size / 1e6:.2f} MB Payload\n")
+        f.write(f"- Verbindungen: {connections}, Topic-Präfix: `{prefix}`\n")
+        f.write(f"- Geschwindigkeit: " + (f"{speed:g}× (Soll {target_span:.2f} s)" if speed > 0 else "maximal")
+                + (f", Abstände nach Profil `{profile}`" if profile else ", Abstände wie aufgezeichnet") + "\n")
+        f.write(f"- Aufgezeichnet: {span:.2f} s | Wiedergabe: {elapsed:.2f} s | Ist: {result['Ist-Speed']:.2f}× "
+                f"| {result['Send-Rate']:.0f} msg/s\n")
+        if speed > 0:
+            f.write(f"- Verzug je Nachricht: Ø {result['Drift Ø (ms)']:.3f} ms | p50 {result['Drift p50 (ms)']:.3f} ms "
+                    f"| p99 {result['Drift p99 (ms)']:.3f} ms | max {result['Drift Max (ms)']:.3f} ms\n")
+            f.write(f"- Enddrift: {result['Enddrift_s'] * 1000:+.1f} ms\n\n")
+            f.write("## Verzug über die Wiedergabe\n\n")
+            f.write("| Abschnitt | Nachrichten | Max. Verzug (ms) |\n")
+            f.write("|-----------|-------------|------------------|\n")
+            for i, value in enumerate(segment_max):
+                f.write(f"| {i * 100 // DRIFT_SEGMENTS}–{(i + 1) * 100 // DRIFT_SEGMENTS}% "
+                        f"| {messages * i // DRIFT_SEGMENTS}–{messages * (i + 1) // DRIFT_SEGMENTS} | {value:.3f} |\n")
+            curve.write_markdown(f, curve_csv, profile)
+
+    print(f"📝 Wiedergabe-Bericht gespeichert unter: {md_file}")
+    record_run("traffic_replay", args, result, files={"Traffic-Log": path, "Markdown": md_file,
+                                                      "Lastverlauf": curve_csv})
+    return result
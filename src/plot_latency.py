@@ -1,44 +1,141 @@
-import matplotlib.pyplot as plt
-import csv
-import os
-import datetime
-
-def plot_latency(csv_path, output_folder="latency_plots"):
-    timestamps = []
-    latencies = []
-
-    with open(csv_path, encoding="utf-8") as f:
-        reader = csv.reader(f, delimiter=";")
-        next(reader)  # Header überspringen
-        for row in reader:
-            try:
-                time_s = int(row[0])
-                latency_ms = float(row[1].replace(",", "."))
-                timestamps.append(time_s)
-                latencies.append(latency_ms)
-            except:
-                continue 
-
-    plt.figure(figsize=(10, 5))
-    plt.plot(timestamps, latencies, marker="o", linestyle="-", color="blue", label="Latenz (ms)")
-    plt.title("MQTT Latenz über Zeit")
-    plt.xlabel("Zeit (s)")
-    plt.ylabel("Latenz (ms)")
-    plt.grid(True)
-    plt.legend()
-    plt.tight_layout()
-
-    # Ordner erstellen
-    os.makedirs(output_folder, exist_ok=True)
-
-    # Dateiname mit Zeitstempel
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"latenz_plot_{timestamp}.png"
-    filepath = os.path.join(output_folder, filename)
+# plot_latency.py
+# Latenzverlauf eines Laufs als PNG. Geladen wird spaltenweise (Spaltenlog per mmap, CSV-Teile
+# per np.loadtxt), gezeichnet werden Min/Max je Pixelspalte und Perzentilbänder je Zeitfenster.
+# matplotlib (Agg) wird erst im Render-Prozess importiert – main.py und die Modi bezahlen den
+# Import nicht, und der Lauf wartet nicht auf das Diagramm.
+#
+#   python3 plot_latency.py latency_logs_stability/latency_cols_mqtt_echo_<ts>
+import argparse, datetime, gzip, io, os, subprocess, sys
+from utils import latency_log_parts, iter_latency_log
+from columnar_log import ColumnarLog, is_columnar_log
+
+WIDTH_PX = 1000      # 10 Zoll × 100 dpi (matplotlib-Standard)
+BAND_WINDOWS = 200   # Zeitfenster für die Perzentilbänder
+BANDS = (50, 90, 99)
+
+
+def _load_part(np, part):
+    opener = gzip.open if part.endswith(".gz") else open
+    with opener(part, "rt", encoding="utf-8") as f:
+        text = f.read().replace(",", ".")  # ältere Logs mit Dezimalkomma
+    if text.count("\n") < 2:
+        return np.empty((0, 2))
+    try:
+        return np.loadtxt(io.StringIO(text), delimiter=";", skiprows=1, usecols=(0, 1), ndmin=2)
+    except ValueError:
+        # z. B. abgeschnittene letzte Zeile nach Abbruch – zeilenweise mit Fehlertoleranz
+        return np.array(list(iter_latency_log(part)), dtype=float).reshape(-1, 2)
+
+
+def load_latency(path):
+    """(Sekunden, Latenz in ms) als NumPy-Arrays, nach Zeit sortiert."""
+    import numpy as np
+    if is_columnar_log(path):
+        log = ColumnarLog(path)
+        t = np.asarray(log.seconds(), dtype=float)
+        lat = np.asarray(log.latency_ms(), dtype=float)
+    else:
+        # CSV, .csv.gz oder .index eines rotierten LatencyLogWriter-Logs
+        parts = [_load_part(np, part) for part in latency_log_parts(path)]
+        data = np.concatenate(parts) if parts else np.empty((0, 2))
+        t, lat = data[:, 0], data[:, 1]
+    order = np.argsort(t, kind="stable")
+    return t[order], lat[order]
+
+
+def _group(np, t, lat, n):
+    """
+    Teilt die Zeitachse in n gleich breite Fenster. Liefert die Indizes sortiert nach
+    (Fenster, Latenz) sowie Fensternummer, Start und Ende jeder nicht leeren Gruppe.
+    """
+    span = t[-1] - t[0]
+    bucket = np.zeros(len(t), dtype=np.int64) if span <= 0 else \
+        np.minimum(((t - t[0]) / span * n).astype(np.int64), n - 1)
+    order = np.lexsort((lat, bucket))
+    b = bucket[order]
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    ends = np.r_[starts[1:], len(b)]
+    return order, b[starts], starts, ends
+
+
+def decimate_minmax(t, lat, width=WIDTH_PX):
+    """Min und Max je Pixelspalte in Zeitreihenfolge – höchstens 2·width Punkte, Spitzen bleiben sichtbar."""
+    import numpy as np
+    if len(t) <= 2 * width:
+        return t, lat
+    order, _, starts, ends = _group(np, t, lat, width)
+    keep = np.unique(np.concatenate([order[starts], order[ends - 1]]))
+    return t[keep], lat[keep]
 
-    # Diagramm speichern
-    plt.savefig(filepath)
+
+def percentile_bands(t, lat, windows=BAND_WINDOWS, percentiles=BANDS):
+    """Perzentile (nächster Rang) je Zeitfenster: (Fenstermitte in s, {p: Werte})."""
+    import numpy as np
+    order, bucket, starts, ends = _group(np, t, lat, windows)
+    sorted_lat = lat[order]
+    counts = ends - starts
+    width = (t[-1] - t[0]) / windows
+    mid = t[0] + (bucket + 0.5) * width
+    bands = {}
+    for p in percentiles:
+        rank = np.maximum(np.ceil(p / 100 * counts).astype(np.int64), 1)
+        bands[p] = sorted_lat[starts + rank - 1]
+    return mid, bands
+
+
+def render(path, filepath, width=WIDTH_PX):
+    import matplotlib
+    matplotlib.use("Agg")  # ohne Display, auch auf dem Messrechner per SSH
+    import matplotlib.pyplot as plt
+
+    t, lat = load_latency(path)
+    fig, ax = plt.subplots(figsize=(width / 100, 5))
+    if len(t):
+        td, ld = decimate_minmax(t, lat, width)
+        ax.plot(td, ld, linewidth=0.5, color="blue", alpha=0.35,
+                label=f"Latenz (ms), Min/Max je Pixel aus {len(t)} Werten")
+        mid, bands = percentile_bands(t, lat)
+        ax.fill_between(mid, bands[BANDS[0]], bands[BANDS[-1]], step="mid", color="orange", alpha=0.2,
+                        label=f"p{BANDS[0]}–p{BANDS[-1]} je {(t[-1] - t[0]) / BAND_WINDOWS:.2f} s")
+        for p, style in zip(BANDS, ("-", "--", ":")):
+            ax.step(mid, bands[p], where="mid", linestyle=style, linewidth=1, color="darkorange", label=f"p{p}")
+    ax.set_title("MQTT Latenz über Zeit")
+    ax.set_xlabel("Zeit (s)")
+    ax.set_ylabel("Latenz (ms)")
+    ax.grid(True)
+    ax.legend(loc="upper right")
+    fig.tight_layout()
+
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    fig.savefig(filepath)
+    plt.close(fig)
     print(f"Diagramm gespeichert unter {filepath}")
+    return filepath
+
+
+def plot_latency(csv_path, output_folder="latency_plots", background=True, width=WIDTH_PX):
+    """
+    Zeichnet den Latenzverlauf aus einer CSV, .csv.gz, .index oder einem Spaltenlog.
+    Mit background=True rendert ein eigener Python-Prozess, der Aufruf kehrt sofort mit
+    dem Zielpfad zurück.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filepath = os.path.join(output_folder, f"latenz_plot_{timestamp}.png")
+    if not background:
+        return render(csv_path, filepath, width)
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), csv_path, "--output", filepath,
+                      "--width", str(width)], stdin=subprocess.DEVNULL)
+    print(f"🖼️ Diagramm wird im Hintergrund erstellt: {filepath}")
+    return filepath
+
 
-# Beispielaufruf
-# plot_latency("latency_logs_stability/latency_log_20250821_145851.csv")
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latenzverlauf als PNG zeichnen")
+    parser.add_argument("path", help="Latenz-CSV, .csv.gz, .index oder Spaltenlog-Verzeichnis")
+    parser.add_argument("--output", help="Zieldatei (Standard: latency_plots/latenz_plot_<ts>.png)")
+    parser.add_argument("--width", type=int, default=WIDTH_PX, help="Breite in Pixeln = Anzahl Min/Max-Spalten")
+    a = parser.parse_args()
+    if a.output:
+        render(a.path, a.output, a.width)
+    else:
+        plot_latency(a.path, background=False, width=a.width)
@@ -0,0 +1,193 @@
+# publisher_fleet.py
+# Mehrere Publisher-Prozesse + separater Empfänger-Prozess, damit der
+# Lastgenerator nicht am GIL eines einzelnen Interpreters hängen bleibt.
+import os, time
+import multiprocessing as mp
+import paho.mqtt.client as mqtt
+from utils import PayloadFactory, RateScheduler, PublishWindow, SequenceTracker
+from resource_monitor import GeneratorMonitor
+from load_profiles import ProfileScheduler
+
+ID_RANGE = 10**9  # jeder Worker bekommt einen eigenen Bereich von Nachrichtennummern
+
+
+def _receiver_main(BROKER_IP, topic, qos, conn):
+    sequences = SequenceTracker(stream_span=ID_RANGE)  # ein Sequenzstrom pro Worker
+
+    def on_message(client, userdata, msg):
+        sequences.receive(msg.payload)
+
+    client = mqtt.Client(client_id=f"fleet_recv_{os.getpid()}")
+    client.on_message = on_message
+    client.connect(BROKER_IP, 1883)
+    client.subscribe(topic, qos=qos)
+    client.loop_start()
+    conn.send("ready")
+
+    while True:
+        cmd = conn.recv()
+        if isinstance(cmd, tuple) and cmd[0] == "sequences":
+            conn.send(sequences.stats(cmd[1]))
+            continue
+        conn.send("stopped")
+        break
+
+    client.loop_stop()
+    client.disconnect()
+
+
+def _publisher_main(worker, BROKER_IP, topic, qos, payload_size, rate, duration,
+                    prefix, window_size, catch_up, result_queue, profile=None, seed=None):
+    client = mqtt.Client(client_id=f"fleet_pub_{os.getpid()}_{worker}")
+    client.connect(BROKER_IP, 1883)
+    client.loop_start()
+    window = PublishWindow(client, window_size) if window_size else None
+
+    if profile and rate > 0:
+        # gleiches Profil in jedem Worker: Verläufe liegen zeitgleich übereinander, Poisson bleibt Poisson
+        scheduler = ProfileScheduler(profile, rate, duration, catch_up, seed=None if seed is None else seed + worker)
+    else:
+        scheduler = RateScheduler(rate, catch_up=catch_up)
+    id_base = worker * ID_RANGE
+    payloads = PayloadFactory(payload_size, f"{prefix}_msg")
+    sent = 0
+    gen = GeneratorMonitor(client).start()
+    start_time = time.time()
+
+    while time.time() - start_time < duration:
+        scheduler.wait()
+        payload = payloads.make(id_base + sent)
+        t_pub = time.perf_counter_ns()
+        if window:
+            window.publish(topic, payload, qos)
+        else:
+            client.publish(topic, payload, qos=qos)
+        gen.publish_done(t_pub)
+        sent += 1
+
+    elapsed = time.time() - start_time
+    gen.stop()
+    if window:
+        window.drain()
+    client.loop_stop()
+    client.disconnect()
+
+    result_queue.put({
+        "Worker": worker,
+        "Gesendet": sent,
+        "Dauer_s": elapsed,
+        "Send-Rate": sent / elapsed if elapsed > 0 else 0,
+        **scheduler.stats(),
+        **(window.stats() if window else {}),
+        **gen.stats(scheduler.stats(), window.stats() if window else None),
+    })
+
+
+class FleetReceiver:
+    """
+    Empfänger in eigenem Prozess, prüft die Sequenzen pro msg_id-Präfix. Empfangen zählt
+    nur eindeutige Nachrichten ("Eindeutig"), Duplikate und Redeliveries stehen getrennt.
+    """
+
+    def __init__(self, BROKER_IP, topic, qos):
+        self._conn, child_conn = mp.Pipe()
+        self._proc = mp.Process(target=_receiver_main, args=(BROKER_IP, topic, qos, child_conn), daemon=True)
+        self._proc.start()
+        self._conn.recv()  # warten bis Subscription steht
+
+    def sequences(self, prefix=None):
+        """Sequenzprüfung (Duplikate, außer der Reihe, Lücken) für ein msg_id-Präfix, z. B. 'stage3_msg'."""
+        self._conn.send(("sequences", prefix))
+        return self._conn.recv()
+
+    def stop(self):
+        self._conn.send("stop")
+        self._conn.recv()
+        self._proc.join(timeout=5)
+
+
+def run_publishers(BROKER_IP, topic, qos, payload_size, rate, duration, workers, prefix,
+                   window=0, catch_up=True, on_tick=None, tick_interval=5, profile=None, seed=None):
+    """
+    Startet `workers` Publisher-Prozesse (Gesamtrate wird gleichmäßig aufgeteilt)
+    und blockiert, bis alle fertig sind. on_tick() wird alle tick_interval Sekunden
+    im Hauptprozess aufgerufen (z. B. für CPU/RAM-Monitoring).
+    window > 0: QoS-1/2-Bestätigungen über ein PublishWindow dieser Größe pro Worker
+    abwarten, 0: ohne Bestätigung senden.
+    profile: Ankunftsprozess aus load_profiles, jeder Worker mit seinem Anteil der Rate.
+    Liefert die Zähler pro Worker, sortiert nach Worker-Nummer.
+    """
+    result_queue = mp.Queue()
+    per_worker_rate = rate / workers if rate > 0 else 0
+    procs = [
+        mp.Process(target=_publisher_main,
+                   args=(w, BROKER_IP, topic, qos, payload_size, per_worker_rate, duration,
+                         prefix, window, catch_up, result_queue, profile, seed))
+        for w in range(workers)
+    ]
+    for p in procs:
+        p.start()
+
+    results = []
+    while len(results) < workers:
+        try:
+            results.append(result_queue.get(timeout=tick_interval))
+        except Exception:
+            if not any(p.is_alive() for p in procs) and result_queue.empty():
+                print("⚠️ Publisher-Prozess ohne Ergebnis beendet.")
+                break
+        if on_tick:
+            on_tick()
+
+    for p in procs:
+        p.join()
+    return sorted(results, key=lambda r: r["Worker"])
+
+
+def merge_worker_results(worker_results):
+    """
+    Fasst die Zähler aller Worker zusammen (Summen, bzw. Maximum für Dauer/Verzug und
+    Generator-Kennzahlen). Der Generator gilt als gesättigt, sobald es ein Worker ist.
+    """
+    merged = {
+        "Gesendet": sum(r["Gesendet"] for r in worker_results),
+        "Dauer_s": max((r["Dauer_s"] for r in worker_results), default=0),
+        "Soll-Rate": sum(r["Soll-Rate"] for r in worker_results),
+        "Slots": sum(r["Slots"] for r in worker_results),
+        "Verspätet": sum(r["Verspätet"] for r in worker_results),
+        "Verpasst": sum(r["Verpasst"] for r in worker_results),
+        "Max. Verzug (ms)": max((r["Max. Verzug (ms)"] for r in worker_results), default=0),
+        "Leerlauf (s)": sum(r["Leerlauf (s)"] for r in worker_results),
+        "Sender-CPU%": max((r["Sender-CPU%"] for r in worker_results), default=0),
+        "paho-CPU%": max((r["paho-CPU%"] for r in worker_results), default=0),
+        "Publish p50 (µs)": max((r["Publish p50 (µs)"] for r in worker_results), default=0),
+        "Publish p99 (µs)": max((r["Publish p99 (µs)"] for r in worker_results), default=0),
+        "Publish Max (µs)": max((r["Publish Max (µs)"] for r in worker_results), default=0),
+        "Queue Max": max((r["Queue Max"] for r in worker_results), default=0),
+        "Queue Ende": sum(r["Queue Ende"] for r in worker_results),
+        "Generator gesättigt": any(r["Generator gesättigt"] for r in worker_results),
+        "Grund": "; ".join(f"Worker {r['Worker']}: {r['Grund']}" for r in worker_results if r["Generator gesättigt"]),
+    }
+    if worker_results and "Window" in worker_results[0]:
+        acked = sum(r["Bestätigt"] for r in worker_results)
+        merged.update({
+            "Window": worker_results[0]["Window"],
+            "Bestätigt": acked,
+            "Max. In-Flight": max(r["Max. In-Flight"] for r in worker_results),
+            "Ack Ø (ms)": sum(r["Ack Ø (ms)"] * r["Bestätigt"] for r in worker_results) / acked if acked else 0,
+            "Ack Max (ms)": max(r["Ack Max (ms)"] for r in worker_results),
+            "Fenster-Wartezeit (s)": sum(r["Fenster-Wartezeit (s)"] for r in worker_results),
+        })
+    return merged
+
+
+def write_worker_table(f, worker_results):
+    """Markdown-Tabelle mit den Zählern pro Worker."""
+    f.write("| Worker | Gesendet | Send-Rate (msg/s) | Verspätet | Verpasst | Max. Verzug (ms) | "
+            "Sender-CPU% | Publish p99 (µs) | Queue Max | Generator gesättigt |\n")
+    f.write("|--------|----------|-------------------|-----------|----------|------------------|"
+            "-------------|------------------|-----------|---------------------|\n")
+    for r in worker_results:
+        f.write(f"| {r['Worker']} | {r['Gesendet']} | {r['Send-Rate']:.2f} | {r['Verspätet']} | "
+                f"{r['Verpasst']} | {r['Max. Verzug (ms)']:.2f} | {r['Sender-CPU%']:.1f} | "
+                f"{r['Publish p99 (µs)']:.0f} | {r['Queue Max']} | {'ja' if r['Generator gesättigt'] else 'nein'} |\n")
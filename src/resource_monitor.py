@@ -0,0 +1,445 @@
+# resource_monitor.py
+# Systemmonitoring in eigenem Thread mit festem Intervall, unabhängig von der Senderate.
+# Neben CPU/RAM des Hosts werden benannte Zielprozesse (Broker, HABApp, openHAB-JVM)
+# einzeln erfasst: CPU, RSS, Threads, File-Deskriptoren und Kontextwechsel.
+import os, json, time, threading
+from datetime import datetime
+import psutil
+import paho.mqtt.client as mqtt
+
+DEFAULT_TARGETS = ("mosquitto", "habapp", "openhab")
+SUT_TOPIC = "/sut/metrics"   # Steuer-Topic des SUT-Agenten (sut_agent.py)
+
+
+def _matches(proc, pattern):
+    name = (proc.info.get("name") or "").lower()
+    if pattern in name:
+        return True
+    cmdline = " ".join(proc.info.get("cmdline") or []).lower()
+    return pattern in cmdline
+
+
+def _fmt(value):
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+class ResourceSampler:
+    """
+    Startet mit start() einen Daemon-Thread, der alle `interval` Sekunden eine Probe nimmt.
+    Zielprozesse werden über Teilstrings von Prozessname oder Kommandozeile gefunden
+    (z. B. "openhab" passt auf die openHAB-JVM) und bei Bedarf neu gesucht, falls sie
+    erst später starten oder neu gestartet werden. Der eigene Prozess, seine Kind-
+    und Elternprozesse werden nie als Ziel gewertet.
+    """
+
+    def __init__(self, interval: float = 1.0, targets=DEFAULT_TARGETS, rescan_every: int = 10,
+                 on_sample=None, keep=True):
+        self.interval = interval
+        self.on_sample = on_sample  # Callback(row) nach jeder Probe, z. B. zum Publizieren
+        self.keep = keep            # False: Proben nicht sammeln (Dauerbetrieb im Agenten)
+        self.targets = [t.strip().lower() for t in targets if t.strip()]
+        self.rescan_every = rescan_every
+        self.samples = []     # Zeilen: {"Zeit_s", "CPU%", "RAM%", "<ziel> CPU%", ...}
+        self.procs = {}       # Ziel → psutil.Process
+        self._ctx = {}        # Ziel → (Zeitpunkt, Kontextwechsel gesamt)
+        self._stop = threading.Event()
+        self._thread = None
+        self.t0 = None
+
+    # --- Steuerung ---
+
+    def start(self):
+        self.t0 = time.time()
+        psutil.cpu_percent(interval=None)  # erster Aufruf liefert nur den Bezugspunkt
+        self._discover()
+        self._thread = threading.Thread(target=self._run, name="ResourceSampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Erfassung ---
+
+    def _discover(self):
+        # eigener Prozess, Kindprozesse (Publisher-Flotte) und Eltern (Shell mit "--mode habapp_…")
+        own = {os.getpid()}
+        try:
+            me = psutil.Process()
+            own.update(p.pid for p in me.children(recursive=True))
+            own.update(p.pid for p in me.parents())
+        except psutil.Error:
+            pass
+        missing = [t for t in self.targets if t not in self.procs]
+        if not missing:
+            return
+        for proc in psutil.process_iter(["pid", "name", "cmdline"]):
+            if proc.pid in own:
+                continue
+            for target in missing:
+                if target not in self.procs and _matches(proc, target):
+                    try:
+                        proc.cpu_percent(interval=None)
+                        self.procs[target] = proc
+                    except psutil.Error:
+                        pass
+
+    def _run(self):
+        n = 0
+        next_due = time.perf_counter() + self.interval
+        while not self._stop.wait(max(0.0, next_due - time.perf_counter())):
+            next_due += self.interval
+            n += 1
+            if n % self.rescan_every == 0:
+                self._discover()
+            row = self._sample()
+            if self.keep:
+                self.samples.append(row)
+            if self.on_sample:
+                self.on_sample(row)
+
+    def _sample(self):
+        now = time.time()
+        row = {
+            "Zeit_s": now - self.t0,
+            "CPU%": psutil.cpu_percent(interval=None),
+            "RAM%": psutil.virtual_memory().percent,
+        }
+        for target in self.targets:
+            proc = self.procs.get(target)
+            if proc is None:
+                continue
+            try:
+                with proc.oneshot():
+                    ctx = proc.num_ctx_switches()
+                    ctx_total = ctx.voluntary + ctx.involuntary
+                    row[f"{target} PID"] = proc.pid
+                    row[f"{target} CPU%"] = proc.cpu_percent(interval=None)
+                    row[f"{target} RSS_MB"] = proc.memory_info().rss / 1024 / 1024
+                    row[f"{target} Threads"] = proc.num_threads()
+                    row[f"{target} FDs"] = proc.num_fds() if hasattr(proc, "num_fds") else proc.num_handles()
+            except psutil.Error:
+                # Prozess beendet oder neu gestartet → beim nächsten Scan neu suchen
+                self.procs.pop(target, None)
+                self._ctx.pop(target, None)
+                continue
+            last = self._ctx.get(target)
+            if last and now > last[0]:
+                row[f"{target} Ctx/s"] = (ctx_total - last[1]) / (now - last[0])
+            self._ctx[target] = (now, ctx_total)
+        return row
+
+    # --- Auswertung ---
+
+    def between(self, t_start: float, t_end: float):
+        """Proben zwischen zwei time.time()-Zeitpunkten (z. B. einer Stresstest-Stufe)."""
+        return [s for s in self.samples if t_start - self.t0 <= s["Zeit_s"] <= t_end - self.t0]
+
+    def mean(self, key="CPU%", samples=None):
+        values = [s[key] for s in (self.samples if samples is None else samples) if key in s]
+        return sum(values) / len(values) if values else 0
+
+    def per_minute(self):
+        """Mittelwerte pro angefangener Minute: [(Minute, CPU%, RAM%)]."""
+        minutes = {}
+        for s in self.samples:
+            minutes.setdefault(int(s["Zeit_s"] // 60), []).append(s)
+        return [(m, self.mean("CPU%", rows), self.mean("RAM%", rows)) for m, rows in sorted(minutes.items())]
+
+    def process_summary(self):
+        """Pro gefundenem Zielprozess: PID, CPU Ø/Max, RSS Max, Threads Max, FDs Max, Kontextwechsel Ø/s."""
+        summary = []
+        for target in self.targets:
+            rows = [s for s in self.samples if f"{target} CPU%" in s]
+            if not rows:
+                continue
+            summary.append({
+                "Prozess": target,
+                "PID": rows[-1].get(f"{target} PID", "–"),
+                "CPU Ø%": self.mean(f"{target} CPU%", rows),
+                "CPU Max%": max(s[f"{target} CPU%"] for s in rows),
+                "RSS Max (MB)": max(s[f"{target} RSS_MB"] for s in rows),
+                "Threads Max": max(s[f"{target} Threads"] for s in rows),
+                "FDs Max": max(s[f"{target} FDs"] for s in rows),
+                "Ctx/s Ø": self.mean(f"{target} Ctx/s", rows),
+            })
+        return summary
+
+    def write_stage_table(self, f, stages):
+        """Tabelle CPU Ø% und RSS Max pro Zielprozess und Abschnitt; stages = [(Bezeichnung, t_start, t_end)]."""
+        targets = [t for t in self.targets if any(f"{t} CPU%" in s for s in self.samples)]
+        if not targets:
+            return
+        f.write("\n## Zielprozesse pro Stufe\n\n")
+        f.write("| Stufe | " + " | ".join(f"{t} CPU Ø% | {t} RSS Max (MB)" for t in targets) + " |\n")
+        f.write("|-------|" + "|".join("---|---" for _ in targets) + "|\n")
+        for label, t_start, t_end in stages:
+            rows = self.between(t_start, t_end)
+            cells = []
+            for t in targets:
+                rss = [s[f"{t} RSS_MB"] for s in rows if f"{t} RSS_MB" in s]
+                cells.append(f"{self.mean(f'{t} CPU%', rows):.1f} | {max(rss) if rss else 0:.1f}")
+            f.write(f"| {label} | " + " | ".join(cells) + " |\n")
+
+    def save_csv(self, mode: str, folder: str = "latency_logs_stability"):
+        """Zeitreihe als CSV (Semikolon, wie die übrigen Logs); liefert den Pfad."""
+        os.makedirs(folder, exist_ok=True)
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(folder, f"resources_{mode}_{ts}.csv")
+        columns = ["Zeit_s", "CPU%", "RAM%"]
+        for s in self.samples:
+            columns += [k for k in s if k not in columns]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(";".join(columns) + "\n")
+            for s in self.samples:
+                f.write(";".join(_fmt(s[c]) if c in s else "" for c in columns) + "\n")
+        return path
+
+    def write_markdown(self, f, csv_path=None):
+        """Abschnitt mit Host-Mittelwerten und einer Tabelle pro Zielprozess."""
+        f.write(f"\n## Ressourcen (Abtastung alle {self.interval:g} s)\n\n")
+        f.write(f"- Host CPU% Ø: {self.mean('CPU%'):.1f} | RAM% Ø: {self.mean('RAM%'):.1f}\n")
+        procs = self.process_summary()
+        if procs:
+            f.write("\n| Prozess | PID | CPU Ø% | CPU Max% | RSS Max (MB) | Threads Max | FDs Max | Kontextwechsel Ø/s |\n")
+            f.write("|---------|-----|--------|----------|--------------|-------------|---------|--------------------|\n")
+            for p in procs:
+                f.write(f"| {p['Prozess']} | {p['PID']} | {p['CPU Ø%']:.1f} | {p['CPU Max%']:.1f} | "
+                        f"{p['RSS Max (MB)']:.1f} | {p['Threads Max']} | {p['FDs Max']} | {p['Ctx/s Ø']:.0f} |\n")
+        else:
+            f.write(f"- Keine Zielprozesse gefunden ({', '.join(self.targets)})\n")
+        if csv_path:
+            f.write(f"\nZeitreihe: `{csv_path}`\n")
+
+
+class GeneratorMonitor:
+    """
+    Eigenaufwand des Lastgenerators während eines Laufs bzw. einer Stufe:
+    - CPU-Zeit pro Thread (Sende-Thread, paho-Netzwerkthread, übrige) über psutil
+    - Dauer der publish()-Aufrufe (publish_done() im Sende-Loop aufrufen)
+    - Länge der ausgehenden paho-Queue, in eigenem Thread alle `interval` Sekunden
+    verdict() fasst das zu "Generator gesättigt: ja/nein" samt Begründung zusammen,
+    damit Ergebnisse, die am Client und nicht am SUT hängen, erkennbar sind.
+    """
+    CPU_LIMIT = 90.0        # % eines Kerns, ab dem ein Thread als ausgelastet gilt
+    LAG_LIMIT = 0.01        # Anteil verspäteter/verpasster Slots
+    IDLE_LIMIT = 0.05       # Anteil der Laufzeit, den der Sende-Loop mindestens wartet
+
+    def __init__(self, client=None, interval: float = 0.1):
+        from utils import LatencyHistogram
+        self.client = client
+        self.interval = interval
+        self.publish_hist = LatencyHistogram(max_ms=60_000)
+        self.queue_samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu0 = {}
+        self.thread_cpu = {}
+
+    @staticmethod
+    def _thread_times():
+        try:
+            return {t.id: t.user_time + t.system_time for t in psutil.Process().threads()}
+        except (psutil.Error, AttributeError):
+            return {}
+
+    def _queue_depth(self):
+        # paho hält ausgehende Pakete in _out_packet (nicht öffentlich, daher defensiv)
+        return len(getattr(self.client, "_out_packet", ()) or ())
+
+    def start(self):
+        self.sender_tid = threading.get_native_id()
+        self._cpu0 = self._thread_times()
+        self._wall0 = time.perf_counter()
+        if self.client is not None:
+            self._thread = threading.Thread(target=self._run, name="GeneratorMonitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.queue_samples.append(self._queue_depth())
+
+    def publish_done(self, t_start_ns: int):
+        """Nach client.publish(): t_start_ns = time.perf_counter_ns() vor dem Aufruf."""
+        self.publish_hist.record((time.perf_counter_ns() - t_start_ns) / 1e6)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        self.wall = time.perf_counter() - self._wall0
+        cpu1 = self._thread_times()
+        names = {t.native_id: t.name for t in threading.enumerate() if t.native_id}
+        paho_thread = getattr(self.client, "_thread", None)
+        paho_tid = getattr(paho_thread, "native_id", None)
+        self.thread_cpu = {}
+        for tid, total in cpu1.items():
+            used = total - self._cpu0.get(tid, 0.0)
+            if tid == self.sender_tid:
+                name = "Sender"
+            elif tid == paho_tid:
+                name = "paho"
+            else:
+                name = names.get(tid, f"TID {tid}")
+            self.thread_cpu[name] = self.thread_cpu.get(name, 0.0) + used
+        return self
+
+    def cpu_percent(self, name):
+        return self.thread_cpu.get(name, 0.0) / self.wall * 100 if getattr(self, "wall", 0) > 0 else 0.0
+
+    def verdict(self, scheduler_stats=None, window_stats=None):
+        """
+        (gesättigt, [Gründe]). Der Sende-Loop gilt als gesättigt, wenn er kaum noch auf
+        Slots wartet und trotzdem in Verzug gerät – unabhängig von der CPU-Last, denn unter
+        GIL-Konkurrenz erreicht kein einzelner Thread 100 %. Wartezeit im PublishWindow
+        zählt nicht dagegen: dann bremst der Broker/SUT, nicht der Generator.
+        """
+        reasons = []
+        wall = getattr(self, "wall", 0)
+        sender = self.cpu_percent("Sender")
+        paho = self.cpu_percent("paho")
+        if sender >= self.CPU_LIMIT:
+            reasons.append(f"Sende-Thread {sender:.0f}% CPU")
+        if paho >= self.CPU_LIMIT:
+            reasons.append(f"paho-Thread {paho:.0f}% CPU")
+
+        blocked = window_stats.get("Fenster-Wartezeit (s)", 0.0) if window_stats else 0.0
+        sut_bound = wall > 0 and blocked / wall >= 0.5
+        if scheduler_stats and wall > 0 and not sut_bound:
+            idle = (scheduler_stats.get("Leerlauf (s)", 0.0) + blocked) / wall
+            slots = scheduler_stats.get("Slots", 0)
+            behind = (scheduler_stats["Verspätet"] + scheduler_stats["Verpasst"]) / slots if slots else 0
+            if not scheduler_stats.get("Soll-Rate"):
+                reasons.append("unbegrenzte Rate – Durchsatz ist die Sendegrenze des Generators")
+            elif behind > self.LAG_LIMIT and idle < self.IDLE_LIMIT:
+                reasons.append(f"{behind * 100:.1f}% der Slots verspätet/verpasst bei {idle * 100:.0f}% Leerlauf")
+
+        if self.queue_samples:
+            rate = scheduler_stats.get("Soll-Rate", 0) if scheduler_stats else 0
+            if max(self.queue_samples) > max(1000, rate):
+                reasons.append(f"paho-Queue bis {max(self.queue_samples)} Pakete")
+        return bool(reasons), reasons
+
+    def stats(self, scheduler_stats=None, window_stats=None):
+        saturated, reasons = self.verdict(scheduler_stats, window_stats)
+        return {
+            "Sender-CPU%": self.cpu_percent("Sender"),
+            "paho-CPU%": self.cpu_percent("paho"),
+            "Publish p50 (µs)": self.publish_hist.percentile(50) * 1000,
+            "Publish p99 (µs)": self.publish_hist.percentile(99) * 1000,
+            "Publish Max (µs)": (self.publish_hist.max if self.publish_hist.count else 0) * 1000,
+            "Queue Max": max(self.queue_samples, default=0),
+            "Queue Ende": self.queue_samples[-1] if self.queue_samples else 0,
+            "Generator gesättigt": saturated,
+            "Grund": "; ".join(reasons),
+        }
+
+
+def write_generator_lines(f, gen_stats, thread_cpu=None):
+    """Markdown-Aufzählung zum Eigenaufwand des Lastgenerators."""
+    verdict = "ja – " + gen_stats["Grund"] if gen_stats["Generator gesättigt"] else "nein"
+    f.write(f"- Generator gesättigt: {verdict}\n")
+    f.write(f"- Sende-Thread CPU: {gen_stats['Sender-CPU%']:.1f}% | paho-Thread CPU: {gen_stats['paho-CPU%']:.1f}%\n")
+    f.write(f"- publish()-Dauer p50/p99/Max: {gen_stats['Publish p50 (µs)']:.0f} / "
+            f"{gen_stats['Publish p99 (µs)']:.0f} / {gen_stats['Publish Max (µs)']:.0f} µs\n")
+    f.write(f"- paho-Queue max/Ende: {gen_stats['Queue Max']} / {gen_stats['Queue Ende']}\n")
+    if thread_cpu:
+        f.write("- CPU-Zeit pro Thread: " + ", ".join(f"{k} {v:.2f}s" for k, v in sorted(thread_cpu.items(), key=lambda kv: -kv[1]) if v > 0.005) + "\n")
+
+
+class RemoteResourceSampler(ResourceSampler):
+    """
+    Empfängt die Proben des SUT-Agenten (sut_agent.py) über MQTT, statt lokal zu messen.
+    Gleiche Auswertungs-Schnittstelle wie ResourceSampler, d. h. CPU%/RAM% in den
+    Stufen- und Minutentabellen beschreiben dann den SUT-Host. Der Lastgenerator wird
+    parallel lokal gemessen und getrennt ausgewiesen.
+    Zeit_s ist die lokale Empfangszeit, damit Uhrabweichungen zwischen den Hosts
+    die Zuordnung zu Stufen nicht verschieben.
+    """
+
+    def __init__(self, BROKER_IP, topic: str = SUT_TOPIC, interval: float = 1.0):
+        super().__init__(interval=interval, targets=())
+        self.BROKER_IP = BROKER_IP
+        self.topic = topic
+        self.generator = ResourceSampler(interval=interval, targets=())
+        self.sut_host = None
+        self._lock = threading.Lock()
+        self._client = None
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            row = json.loads(msg.payload.decode())
+        except (ValueError, UnicodeDecodeError):
+            return
+        if self.t0 is None:
+            return
+        self.sut_host = row.pop("Host", self.sut_host)
+        row.pop("t", None)
+        row["Zeit_s"] = time.time() - self.t0
+        with self._lock:
+            self.samples.append(row)
+            for key in row:
+                target = key[:-5] if key.endswith(" CPU%") else None
+                if target and target not in self.targets:
+                    self.targets.append(target)
+
+    def start(self):
+        self.t0 = time.time()
+        self.generator.start()
+        self._client = mqtt.Client()
+        self._client.on_message = self._on_message
+        self._client.connect(self.BROKER_IP, 1883)
+        self._client.subscribe(self.topic, qos=0)
+        self._client.loop_start()
+        return self
+
+    def stop(self):
+        self.generator.stop()
+        if self._client:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+        if not self.samples:
+            print(f"⚠️ Keine SUT-Metriken auf {self.topic} empfangen – läuft sut_agent.py auf dem SUT-Host?")
+        return self
+
+    def save_csv(self, mode: str, folder: str = "latency_logs_stability"):
+        self.generator.save_csv(f"{mode}_generator", folder)
+        return super().save_csv(f"{mode}_sut", folder)
+
+    def write_markdown(self, f, csv_path=None):
+        f.write(f"\n## Ressourcen SUT-Host {self.sut_host or '(keine Daten)'} (über {self.topic})\n\n")
+        f.write(f"- Proben: {len(self.samples)}\n")
+        f.write(f"- SUT CPU% Ø: {self.mean('CPU%'):.1f} | RAM% Ø: {self.mean('RAM%'):.1f}\n")
+        f.write(f"- Lastgenerator CPU% Ø: {self.generator.mean('CPU%'):.1f} | RAM% Ø: {self.generator.mean('RAM%'):.1f}\n")
+        procs = self.process_summary()
+        if procs:
+            f.write("\n| Prozess | PID | CPU Ø% | CPU Max% | RSS Max (MB) | Threads Max | FDs Max | Kontextwechsel Ø/s |\n")
+            f.write("|---------|-----|--------|----------|--------------|-------------|---------|--------------------|\n")
+            for p in procs:
+                f.write(f"| {p['Prozess']} | {p['PID']} | {p['CPU Ø%']:.1f} | {p['CPU Max%']:.1f} | "
+                        f"{p['RSS Max (MB)']:.1f} | {p['Threads Max']} | {p['FDs Max']} | {p['Ctx/s Ø']:.0f} |\n")
+        if csv_path:
+            f.write(f"\nZeitreihe: `{csv_path}`\n")
+
+
+def sampler_from_args(args, BROKER_IP=None):
+    """
+    --sut_metrics: Proben des SUT-Agenten über MQTT (RemoteResourceSampler),
+    sonst lokaler ResourceSampler mit --sample_interval und --monitor_procs (kommagetrennt).
+    """
+    interval = getattr(args, "sample_interval", 1.0)
+    if getattr(args, "sut_metrics", False) and BROKER_IP:
+        return RemoteResourceSampler(BROKER_IP, getattr(args, "sut_topic", SUT_TOPIC), interval)
+    targets = getattr(args, "monitor_procs", ",".join(DEFAULT_TARGETS)).split(",")
+    return ResourceSampler(interval=interval, targets=targets)
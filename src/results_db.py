@@ -0,0 +1,268 @@
+# results_db.py
+# Ergebnisablage aller Modi in einer SQLite-Datenbank (latency_summaries/results.db).
+# Pro Lauf eine Zeile in `runs` (Modus, Zeitpunkt, Parameter), die Kennzahlen als
+# (Lauf, Stufe, Name, Wert) in `metrics` – Stufe 0 ist der ganze Lauf, Stresstests legen
+# zusätzlich eine Zeile pro Stufe ab. Abfragen laufen über Indizes statt über das
+# Einlesen aller summary_*.txt:
+#
+#   python3 results_db.py                                   # neuester Lauf pro Modus
+#   python3 results_db.py --mode stresstest --qos 1 --metric Recv-Rate --min 2000
+import argparse, json, os, socket, sqlite3
+from datetime import datetime
+from mode_registry import duration_seconds
+
+DB_PATH = os.path.join("latency_summaries", "results.db")
+SCHEMA_VERSION = 1  # PRAGMA user_version, siehe _migrate()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY,
+    mode         TEXT NOT NULL,
+    started      TEXT NOT NULL,      -- ISO-Zeitstempel beim Speichern
+    host         TEXT,
+    qos          INTEGER,
+    payload_size INTEGER,
+    delay        REAL,
+    rate         REAL,
+    duration_s   REAL,               -- angeforderte Dauer (--duration) in s, bei Stresstests je Stufe
+    workers      INTEGER,
+    params       TEXT,               -- alle Argumente als JSON
+    files        TEXT                -- erzeugte Dateien als JSON {"Art": Pfad}
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    stage  INTEGER NOT NULL DEFAULT 0,
+    name   TEXT NOT NULL,
+    value  REAL,
+    PRIMARY KEY (run_id, stage, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_runs_mode ON runs(mode);
+CREATE INDEX IF NOT EXISTS idx_runs_qos ON runs(qos, mode);
+CREATE INDEX IF NOT EXISTS idx_metrics_name ON metrics(name, value);
+"""
+
+RUN_COLUMNS = ("id", "mode", "started", "host", "qos", "payload_size", "delay", "rate",
+               "duration_s", "workers", "params", "files")
+
+
+def connect(db_path: str = DB_PATH):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=10)  # Worker/parallele Läufe warten statt zu scheitern
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn
+
+
+def _migrate(conn):
+    """
+    Version 1: duration_min enthielt --duration in der Einheit des Modus (Minuten oder Sekunden)
+    und wird als duration_s nachgetragen; die Verlustquote hieß in save_summary "Verlust" und
+    heißt wie in allen übrigen Modi "Verlust%".
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    columns = {r["name"] for r in conn.execute("PRAGMA table_info(runs)")}
+    with conn:
+        if "duration_s" not in columns:
+            conn.execute("ALTER TABLE runs ADD COLUMN duration_s REAL")
+            for (mode,) in conn.execute("SELECT DISTINCT mode FROM runs").fetchall():
+                conn.execute("UPDATE runs SET duration_s = duration_min * ? WHERE mode = ?",
+                             (duration_seconds(mode, 1), mode))
+        conn.execute("UPDATE OR IGNORE metrics SET name = 'Verlust%' WHERE name = 'Verlust'")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _numeric(value):
+    """Nur Zahlen landen in metrics; bool als 0/1, Text/Listen/None werden übersprungen."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+
+def _params(args):
+    if args is None:
+        return {}
+    raw = vars(args) if hasattr(args, "__dict__") else dict(args)
+    return {k: v for k, v in raw.items() if not k.startswith("_")}
+
+
+def record_run(mode: str, args=None, metrics=None, stages=(), files=None, qos=None,
+               db_path: str = DB_PATH):
+    """
+    Legt einen Lauf mit seinen Kennzahlen ab und liefert dessen id.
+    - args: argparse.Namespace (oder dict) – QoS, Payload, Delay, Rate, Dauer (in Sekunden,
+      je nach Modus aus Minuten umgerechnet), Worker als Spalten, alle Argumente zusätzlich als JSON
+    - metrics: {Name: Wert} für den ganzen Lauf (Stufe 0)
+    - stages: Liste von Dicts pro Stufe; Stufennummer aus "Stufe", sonst fortlaufend ab 1
+    - files: {"Markdown": Pfad, ...}
+    - qos: überschreibt args.qos
+    Fehler der Datenbank brechen den Messlauf nicht ab, sie werden nur gemeldet.
+    """
+    params = _params(args)
+    row = (
+        mode,
+        datetime.now().isoformat(timespec="seconds"),
+        socket.gethostname(),
+        qos if qos is not None else params.get("qos"),
+        params.get("payload_size"),
+        params.get("delay"),
+        params.get("rate"),
+        duration_seconds(mode, params.get("duration")),
+        params.get("workers"),
+        json.dumps(params, ensure_ascii=False, default=str),
+        json.dumps(files or {}, ensure_ascii=False, default=str),
+    )
+    values = [(0, k, _numeric(v)) for k, v in (metrics or {}).items() if _numeric(v) is not None]
+    for i, stage in enumerate(stages or (), start=1):
+        number = stage.get("Stufe", i)
+        values += [(number, k, _numeric(v)) for k, v in stage.items() if _numeric(v) is not None]
+
+    try:
+        conn = connect(db_path)
+        try:
+            with conn:  # Transaktion: commit bzw. rollback, schließt aber nicht
+                run_id = conn.execute(
+                    "INSERT INTO runs (mode, started, host, qos, payload_size, delay, rate, duration_s, "
+                    "workers, params, files) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+                conn.executemany("INSERT OR REPLACE INTO metrics (run_id, stage, name, value) VALUES (?, ?, ?, ?)",
+                                 [(run_id, *v) for v in values])
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️ Ergebnis konnte nicht in {db_path} gespeichert werden: {e}")
+        return None
+    print(f"🗄️  Lauf #{run_id} ({mode}) in {db_path} gespeichert")
+    return run_id
+
+
+def _run_dict(row, metrics):
+    run = {k: row[k] for k in RUN_COLUMNS}
+    run["params"] = json.loads(run["params"] or "{}")
+    run["files"] = json.loads(run["files"] or "{}")
+    run["metrics"] = metrics
+    return run
+
+
+def load_metrics(conn, run_id: int, stage: int = 0):
+    rows = conn.execute("SELECT name, value FROM metrics WHERE run_id = ? AND stage = ?", (run_id, stage))
+    return {r["name"]: r["value"] for r in rows}
+
+
+def latest_per_mode(modes=None, qos=None, db_path: str = DB_PATH):
+    """Neuester Lauf je Modus (optional auf modes/qos eingeschränkt) inkl. Kennzahlen der Stufe 0."""
+    if not os.path.exists(db_path):
+        return []
+    where, params = [], []
+    if modes:
+        where.append(f"mode IN ({', '.join('?' * len(modes))})")
+        params += list(modes)
+    if qos is not None:
+        where.append("qos = ?")
+        params.append(qos)
+    sql = "SELECT MAX(id) AS id FROM runs" + (" WHERE " + " AND ".join(where) if where else "") + " GROUP BY mode"
+    conn = connect(db_path)
+    try:
+        ids = [r["id"] for r in conn.execute(sql, params)]
+        rows = conn.execute(f"SELECT * FROM runs WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY mode", ids)
+        return [_run_dict(r, load_metrics(conn, r["id"])) for r in rows]
+    finally:
+        conn.close()
+
+
+def last_run_id(db_path: str = DB_PATH):
+    """Höchste vergebene Lauf-id (0 ohne Datenbank) – Marke, um danach gespeicherte Läufe zu finden."""
+    if not os.path.exists(db_path):
+        return 0
+    conn = connect(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM runs").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def runs_after(run_id: int, db_path: str = DB_PATH):
+    """Alle Läufe mit id > run_id in Reihenfolge, inkl. Kennzahlen der Stufe 0."""
+    if not os.path.exists(db_path):
+        return []
+    conn = connect(db_path)
+    try:
+        rows = conn.execute("SELECT * FROM runs WHERE id > ? ORDER BY id", (run_id,)).fetchall()
+        return [_run_dict(r, load_metrics(conn, r["id"])) for r in rows]
+    finally:
+        conn.close()
+
+
+def find_stages(metric: str, min_value=None, max_value=None, mode=None, qos=None, db_path: str = DB_PATH):
+    """
+    Alle Stufen (Stufe > 0) bzw. Läufe (Stufe 0), deren Kennzahl `metric` im Bereich liegt,
+    z. B. find_stages("Recv-Rate", 2000, mode="%stresstest", qos=1). mode darf % enthalten.
+    """
+    if not os.path.exists(db_path):
+        return []
+    sql = ("SELECT r.*, m.stage, m.value FROM metrics m JOIN runs r ON r.id = m.run_id "
+           "WHERE m.name = ?")
+    params = [metric]
+    if min_value is not None:
+        sql += " AND m.value >= ?"
+        params.append(min_value)
+    if max_value is not None:
+        sql += " AND m.value <= ?"
+        params.append(max_value)
+    if mode:
+        sql += " AND r.mode LIKE ?" if "%" in mode else " AND r.mode = ?"
+        params.append(mode)
+    if qos is not None:
+        sql += " AND r.qos = ?"
+        params.append(qos)
+    sql += " ORDER BY r.id, m.stage"
+    conn = connect(db_path)
+    try:
+        result = []
+        for r in conn.execute(sql, params):
+            run = _run_dict(r, load_metrics(conn, r["id"], r["stage"]))
+            run["stage"] = r["stage"]
+            result.append(run)
+        return result
+    finally:
+        conn.close()
+
+
+def _print_runs(runs, metric=None):
+    if not runs:
+        print("Keine Läufe gefunden.")
+        return
+    keys = [metric] if metric else ["Dauer", "Gesendet", "Empfangen", "Recv-Rate", "Ø Latenz", "p99", "Verlust%"]
+    print(f"{'#':>5} {'Modus':<26} {'Zeit':<19} {'QoS':>3} {'Stufe':>5} " + " ".join(f"{k:>12}" for k in keys))
+    for run in runs:
+        m = run["metrics"]
+        cells = " ".join(f"{m[k]:>12.2f}" if m.get(k) is not None else f"{'–':>12}" for k in keys)
+        print(f"{run['id']:>5} {run['mode']:<26} {run['started']:<19} {run['qos'] if run['qos'] is not None else '–':>3} "
+              f"{run.get('stage', 0):>5} {cells}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Abfragen der Ergebnisdatenbank")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--mode", help="Modus oder Teil davon, z. B. stresstest")
+    parser.add_argument("--qos", type=int)
+    parser.add_argument("--metric", help="Kennzahl für die Bereichsabfrage, z. B. Recv-Rate")
+    parser.add_argument("--min", type=float, dest="min_value")
+    parser.add_argument("--max", type=float, dest="max_value")
+    a = parser.parse_args()
+
+    if a.metric:
+        mode = f"%{a.mode}%" if a.mode else None
+        _print_runs(find_stages(a.metric, a.min_value, a.max_value, mode=mode, qos=a.qos, db_path=a.db), a.metric)
+    else:
+        runs = latest_per_mode(qos=a.qos, db_path=a.db)
+        if a.mode:
+            runs = [r for r in runs if a.mode in r["mode"]]
+        _print_runs(runs)
@@ -0,0 +1,54 @@
+# sut_agent.py
+# Läuft auf dem SUT-Host (Broker, HABApp, openHAB) und publiziert dessen Ressourcen
+# als JSON auf einem Steuer-Topic. Die Testmodi empfangen die Proben mit --sut_metrics
+# und verwenden sie für die CPU/RAM-Spalten statt der Werte des Lastgenerators.
+#
+#   python3 sut_agent.py --broker 127.0.0.1 --interval 1 --procs mosquitto,habapp,openhab
+#
+# Benötigt resource_monitor.py im selben Verzeichnis sowie psutil und paho-mqtt.
+import argparse, json, signal, socket, threading, time
+import paho.mqtt.client as mqtt
+from resource_monitor import ResourceSampler, DEFAULT_TARGETS, SUT_TOPIC
+
+
+def run_agent(broker, port=1883, topic=SUT_TOPIC, interval=1.0, targets=DEFAULT_TARGETS, host=None):
+    host = host or socket.gethostname()
+    client = mqtt.Client(client_id=f"sut_agent_{host}")
+    client.connect(broker, port)
+    client.loop_start()
+
+    def publish(row):
+        row = {k: v for k, v in row.items() if k != "Zeit_s"}
+        row["Host"] = host
+        row["t"] = time.time()
+        client.publish(topic, json.dumps(row), qos=0)
+
+    sampler = ResourceSampler(interval=interval, targets=targets, on_sample=publish, keep=False).start()
+    found = ", ".join(f"{t} (PID {p.pid})" for t, p in sampler.procs.items()) or "keine"
+    print(f"📡 SUT-Agent {host}: alle {interval:g} s → {topic} @ {broker}:{port}")
+    print(f"   Zielprozesse: {found}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    sampler.stop()
+    client.loop_stop()
+    client.disconnect()
+    print("🛑 SUT-Agent beendet.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ressourcen-Agent für den SUT-Host")
+    parser.add_argument("--broker", default="127.0.0.1", help="MQTT-Broker, über den die Metriken laufen")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default=SUT_TOPIC, help="Steuer-Topic für die Metriken")
+    parser.add_argument("--interval", type=float, default=1.0, help="Abtastintervall in Sekunden")
+    parser.add_argument("--procs", default=",".join(DEFAULT_TARGETS),
+                        help="Kommagetrennte Teilstrings der Zielprozesse (Name oder Kommandozeile)")
+    parser.add_argument("--host", help="Anzeigename des Hosts (Standard: Hostname)")
+    a = parser.parse_args()
+    run_agent(a.broker, a.port, a.topic, a.interval, a.procs.split(","), a.host)
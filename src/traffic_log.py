@@ -0,0 +1,120 @@
+# traffic_log.py
+# Kompaktes Binärlog mitgeschnittener MQTT-Nachrichten für traffic_record / traffic_replay.
+# Aufbau (little endian):
+#   Kopf:      Magic "MQTR" | Version (1 B) | Startzeit ns (8 B)
+#   Datensatz: Versatz zur Startzeit ns (8 B) | Topic-Nr. (4 B) | Flags (1 B) | Payload-Länge (4 B)
+#              [bei Flag NEW_TOPIC: Topic-Länge (2 B) + Topic UTF-8] | Payload
+# Flags: Bit 0–1 QoS, Bit 2 Retain, Bit 3 NEW_TOPIC. Jedes Topic steht nur beim ersten
+# Auftreten im Log, danach nur seine Nummer. Ein abgebrochener Mitschnitt ist bis zum letzten
+# vollständigen Datensatz lesbar.
+import atexit, mmap, os, struct, time
+from datetime import datetime
+
+TRAFFIC_FOLDER = "latency_traffic"
+MAGIC = b"MQTR"
+VERSION = 1
+HEADER = struct.Struct("<4sBq")
+RECORD = struct.Struct("<qIBI")
+TOPIC_LEN = struct.Struct("<H")
+RETAIN = 0x04
+NEW_TOPIC = 0x08
+
+
+class TrafficWriter:
+    """Schreibt Nachrichten gepuffert nach latency_traffic/traffic_<ts>.mqtr (Aufruf aus einem Thread)."""
+
+    def __init__(self, folder: str = TRAFFIC_FOLDER, path: str = None):
+        if path is None:
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"traffic_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mqtr")
+        self.path = path
+        self.start_ns = time.time_ns()
+        self.topics = {}
+        self.counts = []     # Nachrichten je Topic-Nr.
+        self.bytes = 0
+        self.messages = 0
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.start_ns))
+        atexit.register(self.close)
+
+    def append(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False, t_ns: int = None):
+        t_ns = time.time_ns() if t_ns is None else t_ns
+        flags = (qos & 3) | (RETAIN if retain else 0)
+        topic_id = self.topics.get(topic)
+        if topic_id is None:
+            topic_id = self.topics[topic] = len(self.topics)
+            self.counts.append(0)
+            raw = topic.encode("utf-8")
+            self._file.write(RECORD.pack(t_ns - self.start_ns, topic_id, flags | NEW_TOPIC, len(payload))
+                             + TOPIC_LEN.pack(len(raw)) + raw)
+        else:
+            self._file.write(RECORD.pack(t_ns - self.start_ns, topic_id, flags, len(payload)))
+        self._file.write(payload)
+        self.counts[topic_id] += 1
+        self.messages += 1
+        self.bytes += len(payload)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        return self.path
+
+
+class TrafficLog:
+    """Liest ein .mqtr per mmap; Iteration liefert (Versatz ns, Topic-Nr., QoS, Retain, Payload)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path}: kein Traffic-Log (zu kurz)")
+        magic, version, self.start_ns = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: kein Traffic-Log (Magic {magic!r}, Version {version})")
+        self.topics = []
+
+    def __iter__(self):
+        mm, pos, end = self._mm, HEADER.size, len(self._mm)
+        topics = self.topics
+        while pos + RECORD.size <= end:
+            offset_ns, topic_id, flags, length = RECORD.unpack_from(mm, pos)
+            pos += RECORD.size
+            if flags & NEW_TOPIC:
+                if pos + TOPIC_LEN.size > end:
+                    return
+                (n,) = TOPIC_LEN.unpack_from(mm, pos)
+                pos += TOPIC_LEN.size
+                if topic_id == len(topics):
+                    topics.append(bytes(mm[pos:pos + n]).decode("utf-8"))
+                pos += n
+            if pos + length > end:
+                return  # abgeschnittener letzter Datensatz
+            yield offset_ns, topic_id, flags & 3, bool(flags & RETAIN), mm[pos:pos + length]
+            pos += length
+
+    def scan(self):
+        """Ein Durchlauf: (Nachrichten, Bytes, Spanne erste–letzte Nachricht in s, {Topic: Anzahl})."""
+        messages = size = last = 0
+        first = None
+        counts = {}
+        for offset_ns, topic_id, _, _, payload in self:
+            if first is None:
+                first = offset_ns
+            messages += 1
+            size += len(payload)
+            last = offset_ns
+            counts[topic_id] = counts.get(topic_id, 0) + 1
+        return messages, size, (last - (first or 0)) / 1e9, {self.topics[i]: c for i, c in counts.items()}
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+
+
+def latest_traffic_log(folder: str = TRAFFIC_FOLDER):
+    """Neuester Mitschnitt im Ordner oder None."""
+    if not os.path.isdir(folder):
+        return None
+    logs = sorted(f for f in os.listdir(folder) if f.endswith(".mqtr"))
+    return os.path.join(folder, logs[-1]) if logs else None
@@ -1,12 +1,49 @@
 # utils.py
-import os, statistics, json, glob
+import os, statistics, json, glob, threading, struct, zlib, gzip, shutil, atexit
+from array import array
 from datetime import datetime
 from collections import defaultdict
+from columnar_log import ColumnarLog, is_columnar_log
+from results_db import record_run, latest_per_mode
+from habapp_lib.probe_codec import PROBE_MAGIC, PROBE_HEADER, PROBE_SUFFIX, encode_probe, decode_probe
 
 def generate_payload(size_bytes: int, msg_id: str) -> str:
     content = "x" * max(0, size_bytes - 20)
     return json.dumps({"id": msg_id, "data": content})
 
+# --- Binäres Probe-Format für Echo/Latenz-Modi ---
+# PROBE_HEADER, encode_probe, decode_probe usw. kommen aus habapp_lib/probe_codec.py,
+# das auch die HABApp-Responder importieren – eine Definition für beide Seiten.
+
+def use_binary_probe(args) -> bool:
+    return getattr(args, "probe_format", "json") == "binary"
+
+
+def probe_seq(msg_id):
+    """Sequenznummer aus einer JSON-msg_id wie 'msg_42' (None, wenn nicht lesbar)."""
+    try:
+        return int(str(msg_id).rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+class PayloadFactory:
+    """
+    Vorgerendertes Payload-Template pro Größe und ID-Präfix: im Hot-Loop wird nur noch
+    die laufende Nummer eingesetzt, ohne json.dumps und ohne neuen Füllstring.
+    make(seq) liefert dieselben Bytes wie generate_payload(size_bytes, f"{prefix}{seq}").
+    Jede Nachricht ist ein eigenes bytes-Objekt, weil paho QoS-1/2-Payloads für
+    Wiederholungen referenziert (ein in-place gepatchter Puffer wäre dort falsch).
+    """
+
+    def __init__(self, size_bytes: int, prefix: str):
+        content = "x" * max(0, size_bytes - 20)
+        self._head = ('{"id": ' + json.dumps(prefix)[:-1]).encode()
+        self._tail = ('", "data": ' + json.dumps(content) + "}").encode()
+
+    def make(self, seq: int) -> bytes:
+        return self._head + str(seq).encode() + self._tail
+
 def save_latency_csv(latency_data, mode: str, folder: str = "latency_logs_stability"):
     os.makedirs(folder, exist_ok=True)
     timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -19,6 +56,140 @@ def save_latency_csv(latency_data, mode: str, folder: str = "latency_logs_stabil
     print(f"✅ CSV gespeichert: {filepath}")
     return filepath
 
+
+class LatencyLogWriter:
+    """
+    Streamt (Sekunde, Latenz)-Zeilen in latency_log_<mode>_<ts>.csv, statt am Ende die ganze
+    latency_data-Liste zu schreiben. append() legt die Zeile nur in einen Puffer, ein
+    Hintergrund-Thread schreibt alle flush_interval Sekunden weg – der Speicherbedarf hängt
+    damit nur von Rate × Intervall ab, nicht von der Laufdauer.
+    Ab max_bytes wird rotiert: der volle Teil wird (compress=True) zu .csv.gz komprimiert,
+    weiter geht es in <name>.partNNN.csv. close() – bei Abbruch (Ctrl-C) auch über atexit –
+    schreibt den Rest sowie eine Indexdatei <name>.index mit Teilen, Zeilen und Zeitbereich.
+    """
+
+    def __init__(self, mode: str, folder: str = "latency_logs_stability", flush_interval: float = 1.0,
+                 max_bytes: int = 64 * 1024 * 1024, compress: bool = True):
+        os.makedirs(folder, exist_ok=True)
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.base = os.path.join(folder, f"latency_log_{mode}_{timestamp_str}")
+        self.path = self.base + ".csv"
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.rows = 0
+        self.first_ts = None
+        self.last_ts = 0.0
+        self.parts = []          # (Datei, Zeilen, von_s, bis_s)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._closed = False
+        self._open_part()
+        self._thread = threading.Thread(target=self._run, name="LatencyLogWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open_part(self):
+        n = len(self.parts) + 1
+        self._part_path = self.path if n == 1 else f"{self.base}.part{n:03d}.csv"
+        self._file = open(self._part_path, "w", encoding="utf-8")
+        self._file.write("Timestamp;Latency_ms\n")
+        self._part_rows = 0
+        self._part_from = None
+        self._part_to = None
+
+    def append(self, duration: float, latency: float):
+        with self._lock:
+            self._buffer.append((duration, latency))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        self._file.write("".join(f"{d:.3f};{lat:.3f}\n" for d, lat in rows))
+        self._file.flush()
+        if self.first_ts is None:
+            self.first_ts = rows[0][0]
+        if self._part_from is None:
+            self._part_from = rows[0][0]
+        self._part_to = self.last_ts = rows[-1][0]
+        self._part_rows += len(rows)
+        self.rows += len(rows)
+        if self._file.tell() >= self.max_bytes:
+            self._close_part()
+            self._open_part()
+
+    def _close_part(self):
+        self._file.close()
+        path = self._part_path
+        if self.compress and self._part_rows:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+            path += ".gz"
+        self.parts.append((os.path.basename(path), self._part_rows, self._part_from, self._part_to))
+
+    def close(self):
+        """Schreibt den Puffer, schließt den letzten Teil und liefert den Pfad für iter_latency_log()."""
+        if self._closed:
+            return self.result
+        self._closed = True
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self._flush()
+        if self.parts and not self._part_rows:
+            # leerer Teil direkt nach einer Rotation
+            self._file.close()
+            os.remove(self._part_path)
+        else:
+            # Einziger Teil bleibt unkomprimiert (plot_latency, CSV-Fallback der Summaries)
+            self.compress = self.compress and bool(self.parts)
+            self._close_part()
+        atexit.unregister(self.close)
+
+        self.index_path = self.base + ".index"
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            f.write("Teil;Zeilen;Von_s;Bis_s\n")
+            for name, rows, t_from, t_to in self.parts:
+                f.write(f"{name};{rows};{t_from or 0:.3f};{t_to or 0:.3f}\n")
+            f.write(f"Gesamt;{self.rows};{self.first_ts or 0:.3f};{self.last_ts:.3f}\n")
+        self.result = self.index_path if len(self.parts) > 1 else self.path
+        print(f"✅ Latenz-Log gespeichert: {self.result} ({self.rows} Zeilen, {len(self.parts)} Teil(e))")
+        return self.result
+
+
+def latency_log_parts(path: str):
+    """Dateien eines Latenz-Logs: alle Teile einer .index-Datei in Reihenfolge, sonst nur path."""
+    if not path.endswith(".index"):
+        return [path]
+    folder = os.path.dirname(path)
+    with open(path, encoding="utf-8") as f:
+        return [os.path.join(folder, line.split(";")[0]) for line in f.readlines()[1:]
+                if not line.startswith("Gesamt;")]
+
+
+def iter_latency_log(path: str):
+    """Liefert (Sekunde, Latenz) aus einer Latenz-CSV, einem .csv.gz-Teil oder allen Teilen einer .index-Datei."""
+    if path.endswith(".index"):
+        for part in latency_log_parts(path):
+            yield from iter_latency_log(part)
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        next(f, None)  # Header
+        for line in f:
+            try:
+                t, lat = line.split(";")[:2]
+                yield float(t), float(lat.replace(",", "."))
+            except ValueError:
+                continue
+
 # def save_summary(latency_data, total_sent: int, total_received: int, filepath: str,
 #                  mode: str, qos: int):
 #     folder = os.path.dirname(filepath)
@@ -52,7 +223,9 @@ def save_latency_csv(latency_data, mode: str, folder: str = "latency_logs_stabil
 
 import os, statistics, time
 
-def save_summary(latency_data, total_sent, total_received, filepath, mode, qos, duration=None):
+def save_summary(latency_data, total_sent, total_received, filepath, mode, qos, duration=None,
+                 scheduler_stats=None, histogram=None, inflight_stats=None, resources=None,
+                 clock_stats=None, one_way=None, columns=None, args=None, generator_stats=None):
     """
     Speichert eine Zusammenfassung der Testergebnisse.
     - latency_data: Liste mit (timestamp, latency_ms) oder leer bei Durchsatztests
@@ -62,6 +235,18 @@ def save_summary(latency_data, total_sent, total_received, filepath, mode, qos,
     - mode: Testmodus (z. B. mqtt_echo, mqtt_throughput_combined)
     - qos: MQTT QoS-Level
     - duration: Dauer in Sekunden (optional, für Durchsatztests empfohlen)
+    - scheduler_stats: RateScheduler.stats() (optional, Soll-Rate und verpasste Slots)
+    - histogram: LatencyHistogram (optional, sonst aus latency_data aufgebaut); wird als
+      .hist neben der Zusammenfassung gespeichert und liefert die Perzentile
+    - inflight_stats: InflightTracker.stats() (optional, verlorene/verspätete/doppelte Antworten)
+    - resources: gestoppter ResourceSampler (optional, Host-Mittelwerte und Pfad der Zeitreihe)
+    - clock_stats: ClockSync.estimate() (optional, Uhrenversatz/Drift zwischen Client und SUT)
+    - one_way: {"Hinweg": LatencyHistogram, "Rückweg": ...} (optional, Einweg-Latenzen,
+      Fehlergrenze aus clock_stats)
+    - columns: Pfad eines ColumnarWriter-Verzeichnisses (optional, Messwerte pro Nachricht)
+    - args: argparse-Argumente (optional, Parameter des Laufs für die Ergebnisdatenbank)
+    - generator_stats: GeneratorMonitor.stats() (optional, Eigenaufwand und "Generator gesättigt")
+    Zusätzlich werden alle Kennzahlen über results_db.record_run() abgelegt.
     """
 
     # Ordner für Summaries
@@ -70,13 +255,20 @@ def save_summary(latency_data, total_sent, total_received, filepath, mode, qos,
     os.makedirs(summary_folder, exist_ok=True)
 
     filename = os.path.join(summary_folder, f"summary_{mode}_{timestamp_str}.txt")
+    metrics = {}
+    files = {"Zusammenfassung": filename}
 
     with open(filename, "w") as f:
         f.write(f"Modus: {mode}\n")
         f.write(f"QoS: {qos}\n")
 
+        if histogram is None and latency_data:
+            histogram = LatencyHistogram()
+            for _, lat in latency_data:
+                histogram.record(lat)
+
         # --- Durchsatztest ---
-        if not latency_data:
+        if not histogram or not histogram.count:
             if duration is None:
                 duration = 0
             duration_min = duration / 60 if duration else 0
@@ -91,13 +283,12 @@ def save_summary(latency_data, total_sent, total_received, filepath, mode, qos,
             f.write(f"Send-Rate: {send_rate:.2f} msg/s\n")
             f.write(f"Recv-Rate: {recv_rate:.2f} msg/s\n")
             f.write(f"Verlustquote: {loss_pct:.2f}%\n")
+            metrics.update({"Dauer": duration, "Gesendet": total_sent, "Empfangen": total_received,
+                            "Send-Rate": send_rate, "Recv-Rate": recv_rate, "Verlust%": loss_pct})
 
         # --- Latenztest ---
         else:
-            latencies = [lat for _, lat in latency_data]
-            avg = statistics.mean(latencies) if latencies else 0
-            min_lat = min(latencies) if latencies else 0
-            max_lat = max(latencies) if latencies else 0
+            stats = histogram.summary()
 
             duration = duration or (latency_data[-1][0] if latency_data else 0)
             duration_min = duration / 60 if duration else 0
@@ -105,11 +296,78 @@ def save_summary(latency_data, total_sent, total_received, filepath, mode, qos,
             f.write(f"Dauer: {duration:.2f}s ({duration_min:.2f}min)\n")
             f.write(f"Gesendet: {total_sent}\n")
             f.write(f"Empfangen: {total_received}\n")
-            f.write(f"Durchschnitt: {avg:.2f} ms\n")
-            f.write(f"Minimum: {min_lat:.2f} ms\n")
-            f.write(f"Maximum: {max_lat:.2f} ms\n")
+            f.write(f"Durchschnitt: {stats['Ø']:.2f} ms\n")
+            f.write(f"Minimum: {stats['Min']:.2f} ms\n")
+            f.write(f"Maximum: {stats['Max']:.2f} ms\n")
+            loss_pct = (1 - (total_received / total_sent)) * 100 if total_sent > 0 else 0
+            f.write(f"Verlustquote: {loss_pct:.2f}%\n")
+            for p in ("p50", "p90", "p99", "p99.9"):
+                f.write(f"{p}: {stats[p]:.2f} ms\n")
+            files["Histogramm"] = histogram.save(filename.replace('.txt', '.hist'))
+            f.write(f"Histogramm: {os.path.basename(files['Histogramm'])}\n")
+            metrics.update({"Dauer": duration, "Gesendet": total_sent, "Empfangen": total_received,
+                            "Ø Latenz": stats["Ø"], "Min": stats["Min"], "Max": stats["Max"], "Verlust%": loss_pct})
+            metrics.update({p: stats[p] for p in ("p50", "p90", "p99", "p99.9")})
+
+        if columns:
+            f.write(f"Messwerte: {columns}\n")
+            files["Messwerte"] = columns
+
+        if scheduler_stats:
+            f.write(f"Soll-Rate: {scheduler_stats['Soll-Rate']:.2f} msg/s\n")
+            f.write(f"Verspätete Slots: {scheduler_stats['Verspätet']}\n")
+            f.write(f"Verpasste Slots: {scheduler_stats['Verpasst']}\n")
+            f.write(f"Max. Verzug: {scheduler_stats['Max. Verzug (ms)']:.2f} ms\n")
+            metrics.update({"Soll-Rate": scheduler_stats["Soll-Rate"], "Verspätete Slots": scheduler_stats["Verspätet"],
+                            "Verpasste Slots": scheduler_stats["Verpasst"],
+                            "Max. Verzug (ms)": scheduler_stats["Max. Verzug (ms)"]})
+
+        if generator_stats:
+            verdict = "ja – " + generator_stats["Grund"] if generator_stats["Generator gesättigt"] else "nein"
+            f.write(f"Generator gesättigt: {verdict}\n")
+            f.write(f"Sende-Thread CPU: {generator_stats['Sender-CPU%']:.1f}%\n")
+            f.write(f"publish()-Dauer p99: {generator_stats['Publish p99 (µs)']:.0f} µs\n")
+            metrics.update({"Generator gesättigt": generator_stats["Generator gesättigt"],
+                            "Sender-CPU%": generator_stats["Sender-CPU%"],
+                            "Publish p99 (µs)": generator_stats["Publish p99 (µs)"]})
+
+        if inflight_stats:
+            f.write(f"Timeout: {inflight_stats['Timeout (s)']:.1f}s\n")
+            f.write(f"Verloren (Timeout): {inflight_stats['Verloren']}\n")
+            f.write(f"Verspätete Antworten: {inflight_stats['Verspätet']}\n")
+            f.write(f"Duplikate: {inflight_stats['Duplikate']}\n")
+            metrics.update({"Verloren (Timeout)": inflight_stats["Verloren"],
+                            "Verspätete Antworten": inflight_stats["Verspätet"],
+                            "Duplikate": inflight_stats["Duplikate"]})
+
+        if resources is not None:
+            f.write(f"CPU% Ø: {resources.mean('CPU%'):.1f}\n")
+            f.write(f"RAM% Ø: {resources.mean('RAM%'):.1f}\n")
+            for p in resources.process_summary():
+                f.write(f"{p['Prozess']} CPU% Ø: {p['CPU Ø%']:.1f}\n")
+                f.write(f"{p['Prozess']} RSS Max: {p['RSS Max (MB)']:.1f} MB\n")
+            files["Ressourcen"] = resources.save_csv(mode)
+            f.write(f"Ressourcen: {files['Ressourcen']}\n")
+            metrics.update({"CPU%": resources.mean("CPU%"), "RAM%": resources.mean("RAM%")})
+
+        if clock_stats:
+            f.write(f"Uhrenversatz: {clock_stats['Versatz (ms)']:.3f} ms\n")
+            f.write(f"Fehlergrenze: {clock_stats['Fehlergrenze (ms)']:.3f} ms\n")
+            f.write(f"Drift: {clock_stats['Drift (ppm)']:.2f} ppm\n")
+            metrics.update({"Uhrenversatz (ms)": clock_stats["Versatz (ms)"],
+                            "Fehlergrenze (ms)": clock_stats["Fehlergrenze (ms)"],
+                            "Drift (ppm)": clock_stats["Drift (ppm)"]})
+            for name, hist in (one_way or {}).items():
+                s = hist.summary()
+                metrics.update({f"{name} Ø": s["Ø"], f"{name} p50": s["p50"], f"{name} p99": s["p99"]})
+                f.write(f"{name} Ø/p50/p99: {s['Ø']:.2f} / {s['p50']:.2f} / {s['p99']:.2f} ms "
+                        f"(± {clock_stats['Fehlergrenze (ms)']:.2f} ms)\n")
+                if s["Negativ"]:
+                    f.write(f"{name} negativ (nicht in den Kennzahlen): {s['Negativ']}\n")
+                    metrics[f"{name} negativ"] = s["Negativ"]
 
     print("📋 Zusammenfassung gespeichert:", filename)
+    record_run(mode, args, metrics, files=files, qos=qos)
     return filename
 
 # def save_markdown_table(summaries, output_folder: str = "latency_markdowns"):
@@ -144,8 +402,10 @@ def save_markdown_table(summaries, output_folder: str = "latency_markdowns"):
 
     # Tabellenkopf
     table_header = (
-        "| Modus | Dauer | Gesendet | Empfangen | Ø Latenz (ms) | Verlust (%) | QoS | Min (ms) | Max (ms) |\n"
-        "|-------|-------|----------|-----------|---------------|-------------|-----|----------|----------|\n"
+        "| Modus | Dauer | Gesendet | Empfangen | Ø Latenz (ms) | Verlust (%) | QoS | Min (ms) | "
+        "p50 (ms) | p90 (ms) | p99 (ms) | p99.9 (ms) | Max (ms) |\n"
+        "|-------|-------|----------|-----------|---------------|-------------|-----|----------|"
+        "----------|----------|----------|------------|----------|\n"
     )
 
     # Tabellenzeilen
@@ -153,7 +413,9 @@ def save_markdown_table(summaries, output_folder: str = "latency_markdowns"):
     for s in summaries_sorted:
         rows.append(
             f"| {s['Modus']} | {s['Dauer_str']} | {s['Gesendet']} | {s['Empfangen']} | "
-            f"{s['Ø Latenz']:.2f} | {s['Verlust']:.2f} | {s['QoS']} | {s['Min']:.2f} | {s['Max']:.2f} |"
+            f"{s['Ø Latenz']:.2f} | {s['Verlust']:.2f} | {s['QoS']} | {s['Min']:.2f} | "
+            + " | ".join(f"{s[p]:.2f}" if p in s else "–" for p in ("p50", "p90", "p99", "p99.9"))
+            + f" | {s['Max']:.2f} |"
         )
 
     # Segmentanalyse berechnen
@@ -246,6 +508,29 @@ def summarize_all_results(folder: str = "latency_summaries"):
     # Nur Echo-Modi berücksichtigen
     valid_modes = {"mqtt_echo", "habapp_echo", "openhab_bridge_echo"}
 
+    # Neuester Lauf pro Modus aus der Ergebnisdatenbank (Index statt Einlesen aller Dateien)
+    for run in latest_per_mode(sorted(valid_modes)):
+        m = run["metrics"]
+        duration = m.get("Dauer", 0.0)
+        summary = {
+            "Modus": run["mode"],
+            "QoS": run["qos"],
+            "Dauer": duration,
+            "Dauer_str": f"{duration:.2f}s ({duration / 60:.2f}min)",
+            "Gesendet": int(m.get("Gesendet", 0)),
+            "Empfangen": int(m.get("Empfangen", 0)),
+            "Ø Latenz": m.get("Ø Latenz", 0.0),
+            "Min": m.get("Min", 0.0),
+            "Max": m.get("Max", 0.0),
+            "Verlust": m.get("Verlust%", 0.0),
+        }
+        summary.update({p: m[p] for p in ("p50", "p90", "p99", "p99.9") if p in m})
+        summaries.append(summary)
+    # Summary-Dateien nur noch für Modi, die vor der Datenbank zuletzt gelaufen sind
+    valid_modes -= {s["Modus"] for s in summaries}
+    if not valid_modes:
+        return summaries
+
     # Alle Summary-Dateien einsammeln
     for file in glob.glob(os.path.join(folder, "summary_*.txt")):
         try:
@@ -263,40 +548,55 @@ def summarize_all_results(folder: str = "latency_summaries"):
 
     for file in latest_files:
         try:
+            # Zeilen als "Schlüssel: Wert" lesen, damit zusätzliche Zeilen die Reihenfolge nicht stören
             with open(file, "r", encoding="utf-8") as f:
-                lines = [line.strip() for line in f.readlines()]
-
-                raw_duration = lines[2].split(": ")[1]  # "59.08s (0.98min)"
-                duration_sec = float(raw_duration.split("s")[0])
-
-                summary = {
-                    "Modus": lines[0].split(": ")[1],
-                    "QoS": lines[1].split(": ")[1],
-                    "Dauer": duration_sec,
-                    "Dauer_str": raw_duration,
-                    "Gesendet": int(lines[3].split(": ")[1]),
-                    "Empfangen": int(lines[4].split(": ")[1]),
-                    "Ø Latenz": float(lines[5].split(": ")[1].replace("ms", "").strip()),
-                    "Min": float(lines[6].split(": ")[1].replace("ms", "").strip()),
-                    "Max": float(lines[7].split(": ")[1].replace("ms", "").strip()),
-                    "Verlust": float(lines[8].split(": ")[1].replace("%", "").strip()) if len(lines) > 8 else 0.0,
-                }
-
-                # CSV optional lesen
-                csv_file = file.replace("summary_", "latency_log_").replace(".txt", ".csv")
-                if os.path.exists(csv_file):
-                    try:
-                        with open(csv_file, "r", encoding="utf-8") as cf:
-                            latencies = [float(line.split(";")[1].replace(",", ".")) for line in cf.readlines()[1:]]
-                            summary["Min"] = min(latencies) if latencies else summary["Min"]
-                            summary["Max"] = max(latencies) if latencies else summary["Max"]
-                    except Exception as e:
-                        print(f"⚠️ CSV konnte nicht gelesen werden: {csv_file} → {e}")
-                else:
-                    # Kein CSV vorhanden → Min/Max bleiben wie im Summary-File
-                    pass
+                fields = dict(line.strip().split(": ", 1) for line in f if ": " in line)
+
+            def ms(key, default=0.0):
+                return float(fields[key].replace("ms", "").strip()) if key in fields else default
+
+            raw_duration = fields["Dauer"]  # "59.08s (0.98min)"
+            summary = {
+                "Modus": fields["Modus"],
+                "QoS": fields["QoS"],
+                "Dauer": float(raw_duration.split("s")[0]),
+                "Dauer_str": raw_duration,
+                "Gesendet": int(fields["Gesendet"]),
+                "Empfangen": int(fields["Empfangen"]),
+                "Ø Latenz": ms("Durchschnitt"),
+                "Min": ms("Minimum"),
+                "Max": ms("Maximum"),
+                "Verlust": float(fields.get("Verlustquote", "0").replace("%", "").strip()),
+            }
+            for p in ("p50", "p90", "p99", "p99.9"):
+                if p in fields:
+                    summary[p] = ms(p)
+
+            # Histogramm bevorzugt, dann Spaltenlog (mmap), sonst CSV für exakte Min/Max
+            hist_file = os.path.join(folder, fields["Histogramm"]) if "Histogramm" in fields else None
+            columns_dir = fields.get("Messwerte")
+            csv_file = file.replace("summary_", "latency_log_").replace(".txt", ".csv")
+            if hist_file and os.path.exists(hist_file):
+                try:
+                    stats = LatencyHistogram.load(hist_file).summary()
+                    summary.update({p: stats[p] for p in ("Min", "p50", "p90", "p99", "p99.9", "Max")})
+                except (OSError, ValueError, zlib.error) as e:
+                    print(f"⚠️ Histogramm konnte nicht gelesen werden: {hist_file} → {e}")
+            elif columns_dir and is_columnar_log(columns_dir):
+                latencies = ColumnarLog(columns_dir).latency_ms()
+                if len(latencies):
+                    summary["Min"] = float(min(latencies))
+                    summary["Max"] = float(max(latencies))
+            elif os.path.exists(csv_file):
+                try:
+                    with open(csv_file, "r", encoding="utf-8") as cf:
+                        latencies = [float(line.split(";")[1].replace(",", ".")) for line in cf.readlines()[1:]]
+                        summary["Min"] = min(latencies) if latencies else summary["Min"]
+                        summary["Max"] = max(latencies) if latencies else summary["Max"]
+                except Exception as e:
+                    print(f"⚠️ CSV konnte nicht gelesen werden: {csv_file} → {e}")
 
-                summaries.append(summary)
+            summaries.append(summary)
 
         except Exception as e:
             print(f"⚠️ Fehler beim Verarbeiten von Datei: {file} → {e}")
@@ -338,6 +638,565 @@ def save_segment_markdown(summaries, output_folder: str = "latency_markdowns"):
         f.write("|---------|----------------|\n")
         f.write(f"| MQTT → HABApp | {mqtt_to_habapp:.2f} |\n")
         f.write(f"| HABApp → openHAB | {habapp_to_openhab:.2f} |\n")
+        f.write("\nDifferenzen der Ø-Latenzen getrennter Läufe – Verteilungen pro Nachricht "
+                "aus einem einzigen Lauf liefert `--mode openhab_trace`.\n")
 
     print(f"📝 Segmentanalyse gespeichert unter: {output_path}")
-    return output_path
\ No newline at end of file
+    return output_path
+
+# --- Open-Loop-Taktgeber ---
+
+def target_rate(args, delay=None):
+    """
+    Liefert die Soll-Rate in msg/s.
+    --rate hat Vorrang, sonst wird sie aus dem Delay abgeleitet (0 = unbegrenzt).
+    """
+    rate = getattr(args, "rate", None)
+    if rate:
+        return float(rate)
+    delay = args.delay if delay is None else delay
+    return 1.0 / delay if delay and delay > 0 else 0.0
+
+
+class RateScheduler:
+    """
+    Sendet zu absoluten Zeitpunkten: Slot n ist fällig bei start + n / rate,
+    unabhängig davon, wie lange publish() oder das Payload-Encoding gedauert haben.
+    - rate: Soll-Rate in msg/s (0 = so schnell wie möglich)
+    - catch_up: True  → verspätete Slots werden sofort nachgeholt
+                False → verpasste Slots werden übersprungen und gezählt
+
+    wait() liefert den geplanten Sendezeitpunkt (time.time()-Achse). Wird die
+    Latenz ab diesem Zeitpunkt gemessen, ist sie gegen Coordinated Omission
+    korrigiert: Wartezeit im Rückstau zählt mit zur Latenz.
+    """
+
+    def __init__(self, rate, catch_up=True):
+        self.rate = rate
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.catch_up = catch_up
+        self.start()
+
+    def start(self):
+        self.t0_wall = time.time()
+        self.t0_perf = time.perf_counter()
+        self.slot = 0
+        self.sent = 0
+        self.late = 0
+        self.missed = 0
+        self.max_lag = 0.0
+        self.idle = 0.0     # Summe der Wartezeit bis zum nächsten Slot
+
+    def elapsed(self):
+        return time.perf_counter() - self.t0_perf
+
+    def wait(self):
+        now = time.perf_counter()
+        if self.interval == 0:
+            self.sent += 1
+            return self.t0_wall + (now - self.t0_perf)
+
+        due = self.t0_perf + self.slot * self.interval
+        if now < due:
+            self.idle += due - now
+            time.sleep(due - now)
+        else:
+            lag = now - due
+            if lag > self.interval:
+                if self.catch_up:
+                    self.late += 1
+                else:
+                    # Verpasste Slots überspringen, aktueller Slot bleibt im Takt
+                    skipped = int(lag / self.interval)
+                    self.missed += skipped
+                    self.slot += skipped
+                    due += skipped * self.interval
+                    lag = now - due
+            self.max_lag = max(self.max_lag, lag)
+
+        self.slot += 1
+        self.sent += 1
+        return self.t0_wall + (due - self.t0_perf)
+
+    def stats(self):
+        return {
+            "Soll-Rate": self.rate,
+            "Slots": self.slot,
+            "Verspätet": self.late,
+            "Verpasst": self.missed,
+            "Max. Verzug (ms)": self.max_lag * 1000,
+            "Leerlauf (s)": self.idle,
+        }
+
+    def perf_ns(self, planned):
+        """Rechnet einen von wait() gelieferten Zeitpunkt auf die perf_counter_ns()-Achse um."""
+        return int((self.t0_perf + planned - self.t0_wall) * 1e9)
+
+
+# --- In-Flight-Tracking für Echo-Modi ---
+
+class InflightTracker:
+    """
+    Ringpuffer der Sendezeitpunkte (perf_counter_ns), indiziert über die Sequenznummer.
+    Ersetzt das Dict {"msg_i": t_sent}: konstanter Speicher, keine String-Hashes und
+    Nachrichten ohne Antwort werden nach `timeout` Sekunden als verloren gezählt
+    und ihr Slot freigegeben.
+    - Antwort nach Timeout → verspätet (bleibt als verloren gezählt, keine Latenz)
+    - zweite Antwort auf dieselbe Sequenz → Duplikat
+    Die Kapazität muss mindestens Rate × Timeout betragen, sonst werden ältere
+    Nachrichten beim Überschreiben ihres Slots vorzeitig als verloren gezählt.
+    """
+    PENDING, ACKED, LOST = 0, 1, 2
+
+    def __init__(self, timeout: float = 30.0, capacity: int = 1 << 16):
+        self.timeout_ns = int(timeout * 1e9)
+        self.capacity = capacity
+        self.seqs = array("q", [-1]) * capacity
+        self.sent_ns = array("q", bytes(8 * capacity))
+        self.state = bytearray(capacity)
+        self.oldest = 0      # älteste Sequenz, die noch ausstehen könnte
+        self.next_seq = 0    # höchste gesendete Sequenz + 1
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.unknown = 0
+        self._lock = threading.Lock()  # send() im Hauptthread, ack() im paho-Netzwerkthread
+
+    @classmethod
+    def for_rate(cls, rate, timeout: float = 30.0):
+        """Kapazität passend zur Soll-Rate: alle Nachrichten eines Timeout-Fensters plus Reserve."""
+        return cls(timeout, capacity=max(1 << 16, int((rate or 0) * timeout * 2)))
+
+    def send(self, seq: int, t_ns: int = None):
+        now = time.perf_counter_ns()
+        self.expire(now)
+        slot = seq % self.capacity
+        with self._lock:
+            if self.seqs[slot] >= 0 and self.state[slot] == self.PENDING:
+                self.lost += 1  # Ringpuffer übergelaufen
+            self.seqs[slot] = seq
+            self.sent_ns[slot] = now if t_ns is None else t_ns
+            self.state[slot] = self.PENDING
+            self.next_seq = max(self.next_seq, seq + 1)
+            self.sent += 1
+
+    def ack(self, seq: int, now_ns: int = None):
+        """Liefert die Latenz in ms oder None (verspätet, Duplikat oder unbekannt)."""
+        now = time.perf_counter_ns() if now_ns is None else now_ns
+        slot = seq % self.capacity
+        with self._lock:
+            if self.seqs[slot] != seq:
+                if 0 <= seq < self.next_seq:
+                    self.late += 1  # Slot längst überschrieben
+                else:
+                    self.unknown += 1
+                return None
+            state = self.state[slot]
+            if state == self.ACKED:
+                self.duplicates += 1
+                return None
+            if state == self.LOST:
+                self.late += 1
+                return None
+            self.state[slot] = self.ACKED
+            self.received += 1
+            return (now - self.sent_ns[slot]) / 1e6
+
+    def expire(self, now_ns: int = None):
+        """Zählt ausstehende Nachrichten älter als timeout als verloren (amortisiert O(1))."""
+        now = time.perf_counter_ns() if now_ns is None else now_ns
+        deadline = now - self.timeout_ns
+        with self._lock:
+            while self.oldest < self.next_seq:
+                slot = self.oldest % self.capacity
+                if self.seqs[slot] == self.oldest and self.state[slot] == self.PENDING:
+                    if self.sent_ns[slot] > deadline:
+                        break
+                    self.state[slot] = self.LOST
+                    self.lost += 1
+                self.oldest += 1
+
+    def finish(self):
+        """Am Testende: alles noch Ausstehende gilt als verloren."""
+        self.expire(now_ns=1 << 62)
+
+    def in_flight(self):
+        return self.sent - self.received - self.lost
+
+    def stats(self):
+        return {
+            "Timeout (s)": self.timeout_ns / 1e9,
+            "Verloren": self.lost,
+            "Verspätet": self.late,
+            "Duplikate": self.duplicates,
+            "Unbekannt": self.unknown,
+        }
+
+
+# --- Sequenzprüfung auf Empfängerseite ---
+
+def parse_msg_id(payload: bytes):
+    """
+    (Präfix, Sequenz) aus dem "id"-Feld eines PayloadFactory-/Responder-Payloads,
+    z. B. (b"habapp_qos1_stage3_msg", 42). None, wenn keine Nummer gefunden wird.
+    Arbeitet direkt auf den Bytes, ohne json.loads im Empfangspfad.
+    """
+    start = payload.find(b'"id": "')
+    if start < 0:
+        return None
+    start += 7
+    end = payload.find(b'"', start)
+    if end < 0:
+        return None
+    digits = end
+    while digits > start and 48 <= payload[digits - 1] <= 57:
+        digits -= 1
+    if digits == end:
+        return None
+    return payload[start:digits], int(payload[digits:end])
+
+
+class _SeqWindow:
+    __slots__ = ("base", "top", "bits", "unique", "duplicates", "reordered", "gaps", "stale")
+
+    def __init__(self, seq):
+        self.base = self.top = seq
+        self.bits = 1          # Bit i = Sequenz top - i empfangen
+        self.unique = 1
+        self.duplicates = self.reordered = self.gaps = self.stale = 0
+
+
+class SequenceTracker:
+    """
+    Zählt pro Sequenzstrom (msg_id-Präfix, optional zusätzlich seq // stream_span für
+    Worker mit eigenem Nummernbereich) eindeutige, doppelte und außer der Reihe
+    eingetroffene Nachrichten sowie Lücken. Grundlage ist ein gleitendes Bitfeld über
+    die letzten `window` Sequenznummern:
+    - seq > höchste bisher → Fenster schiebt weiter, übersprungene Nummern sind offen
+    - seq im Fenster, Bit gesetzt → Duplikat (z. B. QoS-1-Redelivery)
+    - seq im Fenster, Bit frei → außer der Reihe, schließt eine offene Lücke
+    - seq älter als das Fenster → "zu alt" (Duplikat oder sehr spät, nicht unterscheidbar)
+    Offene Nummern, die aus dem Fenster fallen, zählen endgültig als Lücke.
+    """
+
+    def __init__(self, window: int = 4096, stream_span: int = None):
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.stream_span = stream_span
+        self.streams = {}
+        self.unparsed = 0
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def receive(self, payload: bytes):
+        parsed = parse_msg_id(payload)
+        if parsed is None:
+            self.unparsed += 1
+            return
+        self.record(*parsed)
+
+    def record(self, prefix, seq: int):
+        key = (prefix, seq // self.stream_span) if self.stream_span else prefix
+        with self._lock:
+            w = self.streams.get(key)
+            if w is None:
+                self.streams[key] = _SeqWindow(seq)
+                return
+            if seq > w.top:
+                shift = seq - w.top
+                valid_before = min(self.window, w.top - w.base + 1)
+                bits = (w.bits << shift) | 1 if shift < self.window else 1
+                w.top = seq
+                dropped = valid_before + shift - min(self.window, w.top - w.base + 1)
+                if dropped > 0:
+                    kept = bin(bits >> self.window if shift < self.window else w.bits).count("1")
+                    w.gaps += dropped - kept
+                w.bits = bits & self.mask
+                w.unique += 1
+                return
+            pos = w.top - seq
+            if pos >= self.window:
+                w.stale += 1
+                return
+            if w.bits >> pos & 1:
+                w.duplicates += 1
+                return
+            w.bits |= 1 << pos
+            w.base = min(w.base, seq)
+            w.unique += 1
+            w.reordered += 1
+
+    def stats(self, prefix=None):
+        """Summen über alle Ströme (bzw. nur über Ströme mit diesem Präfix)."""
+        total = {"Eindeutig": 0, "Duplikate": 0, "Außer Reihe": 0, "Lücken": 0, "Zu alt": 0}
+        if isinstance(prefix, str):
+            prefix = prefix.encode()
+        with self._lock:
+            for key, w in self.streams.items():
+                if prefix is not None and (key[0] if self.stream_span else key) != prefix:
+                    continue
+                valid = min(self.window, w.top - w.base + 1)
+                total["Eindeutig"] += w.unique
+                total["Duplikate"] += w.duplicates
+                total["Außer Reihe"] += w.reordered
+                total["Lücken"] += w.gaps + valid - bin(w.bits).count("1")
+                total["Zu alt"] += w.stale
+        return total
+
+    def interval(self, prefix=None):
+        """Zuwachs seit dem letzten Aufruf (für Zwischenwerte)."""
+        now = self.stats(prefix)
+        last = self._last.get(prefix, {})
+        self._last[prefix] = now
+        return {k: v - last.get(k, 0) for k, v in now.items()}
+
+
+def merge_sequence_stats(stats_list):
+    merged = {}
+    for stats in stats_list:
+        for k, v in stats.items():
+            merged[k] = merged.get(k, 0) + v
+    return merged
+
+
+def write_sequence_lines(f, seq_stats):
+    """Markdown-Aufzählung der Sequenzprüfung für die Kopfzeilen der Berichte."""
+    f.write(f"- Eindeutig empfangen: {seq_stats['Eindeutig']}\n")
+    f.write(f"- Duplikate: {seq_stats['Duplikate']}\n")
+    f.write(f"- Außer der Reihe: {seq_stats['Außer Reihe']}\n")
+    f.write(f"- Lücken (fehlende Sequenzen): {seq_stats['Lücken']}\n")
+    if seq_stats["Zu alt"]:
+        f.write(f"- Zu alt für das Prüffenster: {seq_stats['Zu alt']}\n")
+
+
+# --- Pipelining für QoS 1/2 ---
+
+class PublishWindow:
+    """
+    Begrenztes In-Flight-Fenster für QoS 1/2 statt wait_for_publish() nach jeder Nachricht.
+    publish() blockiert nur, wenn bereits `size` Nachrichten unbestätigt sind; Bestätigungen
+    (PUBACK/PUBCOMP) kommen über on_publish. size=1 entspricht dem bisherigen Stop-and-Wait.
+    """
+
+    def __init__(self, client, size=1):
+        self.client = client
+        self.size = max(1, int(size))
+        self._cond = threading.Condition()
+        self._inflight = {}         # mid → Sendezeitpunkt (perf_counter)
+        self._acked_early = set()   # on_publish kam vor der Registrierung der mid
+        self.completed = 0
+        self.max_inflight = 0
+        self.ack_sum = 0.0
+        self.ack_max = 0.0
+        self.blocked = 0.0          # Zeit, die publish() auf ein freies Fenster gewartet hat
+        client.on_publish = self._on_publish
+        # paho puffert intern ab 20 offenen Nachrichten, Fenster darf größer sein
+        client.max_inflight_messages_set(max(20, self.size))
+
+    def publish(self, topic, payload, qos):
+        if qos == 0:
+            return self.client.publish(topic, payload, qos=0)
+
+        with self._cond:
+            if len(self._inflight) >= self.size:
+                t_block = time.perf_counter()
+                while len(self._inflight) >= self.size:
+                    self._cond.wait()
+                self.blocked += time.perf_counter() - t_block
+        t_sent = time.perf_counter()
+        info = self.client.publish(topic, payload, qos=qos)
+        with self._cond:
+            if info.mid in self._acked_early:
+                self._acked_early.discard(info.mid)
+                self._record_ack(t_sent)
+            else:
+                self._inflight[info.mid] = t_sent
+                self.max_inflight = max(self.max_inflight, len(self._inflight))
+        return info
+
+    def _record_ack(self, t_sent):
+        ack = time.perf_counter() - t_sent
+        self.ack_sum += ack
+        self.ack_max = max(self.ack_max, ack)
+        self.completed += 1
+
+    def _on_publish(self, client, userdata, mid):
+        with self._cond:
+            t_sent = self._inflight.pop(mid, None)
+            if t_sent is None:
+                self._acked_early.add(mid)
+            else:
+                self._record_ack(t_sent)
+            self._cond.notify()
+
+    def drain(self, timeout=10.0):
+        """Wartet, bis alle offenen Nachrichten bestätigt sind (oder timeout abläuft)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._inflight and time.monotonic() < deadline:
+                self._cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+            return len(self._inflight)
+
+    def stats(self):
+        return {
+            "Window": self.size,
+            "Bestätigt": self.completed,
+            "Max. In-Flight": self.max_inflight,
+            "Ack Ø (ms)": self.ack_sum / self.completed * 1000 if self.completed else 0,
+            "Ack Max (ms)": self.ack_max * 1000,
+            "Fenster-Wartezeit (s)": self.blocked,
+        }
+
+
+# --- Latenz-Histogramm (HDR-Prinzip) ---
+
+class LatencyHistogram:
+    """
+    Logarithmisch gebucketetes Histogramm mit fester Speichergröße (~27 KB) für Latenzen
+    von 1 µs bis max_ms. Werte unter 2^SUB_BITS µs werden exakt gezählt, darüber hat jede
+    Zweierpotenz 2^(SUB_BITS-1) lineare Unterbuckets → relativer Fehler < 0,4 %.
+    Histogramme mehrerer Läufe/Worker lassen sich mit merge() zusammenführen und mit
+    to_bytes()/from_bytes() kompakt speichern (nur belegte Buckets, zlib).
+    Negative Werte (z. B. Einweg-Segmente über zwei Uhren) fließen in keine Kennzahl ein,
+    sondern werden nur in `negative` gezählt und in summary() als "Negativ" ausgewiesen.
+    """
+    SUB_BITS = 8
+    MAGIC = b"LHS2"           # LHS2: Kopf mit Anzahl negativer Werte
+    HEADER = struct.Struct("!4sBqdddQI")
+    HEADER_V1 = struct.Struct("!4sBqdddI")   # ältere .hist-Dateien ohne Negativ-Zähler
+
+    def __init__(self, max_ms: float = 3_600_000):
+        self.max_us = int(max_ms * 1000)
+        self.counts = array("Q", bytes(8 * (self._index(self.max_us) + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.negative = 0
+
+    @classmethod
+    def _index(cls, us: int) -> int:
+        sub = 1 << cls.SUB_BITS
+        if us < sub:
+            return us
+        shift = us.bit_length() - cls.SUB_BITS
+        return sub + (shift - 1) * (sub >> 1) + ((us >> shift) - (sub >> 1))
+
+    @classmethod
+    def _value(cls, index: int) -> float:
+        """Mittelwert des Buckets in µs."""
+        sub = 1 << cls.SUB_BITS
+        if index < sub:
+            return float(index)
+        k = index - sub
+        shift = k // (sub >> 1) + 1
+        low = (k % (sub >> 1) + (sub >> 1)) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, latency_ms: float, n: int = 1):
+        if latency_ms < 0:
+            self.negative += n
+            return
+        us = min(int(latency_ms * 1000 + 0.5), self.max_us)
+        self.counts[self._index(us)] += n
+        self.count += n
+        self.total += latency_ms * n
+        self.min = min(self.min, latency_ms)
+        self.max = max(self.max, latency_ms)
+
+    def merge(self, other: "LatencyHistogram"):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend(bytes(8 * (len(other.counts) - len(self.counts))))
+            self.max_us = other.max_us
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.negative += other.negative
+        return self
+
+    def percentile(self, p: float) -> float:
+        """Latenz in ms, unter der p % der Werte liegen (auf Min/Max begrenzt)."""
+        if not self.count:
+            return 0.0
+        target = max(1, int(p / 100 * self.count + 0.5))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(max(self._value(i) / 1000, self.min), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict:
+        empty = not self.count
+        return {
+            "Anzahl": self.count,
+            "Ø": self.mean(),
+            "Min": 0.0 if empty else self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p99.9": self.percentile(99.9),
+            "Max": 0.0 if empty else self.max,
+            "Negativ": self.negative,
+        }
+
+    def to_bytes(self) -> bytes:
+        used = [i for i, c in enumerate(self.counts) if c]
+        header = self.HEADER.pack(self.MAGIC, self.SUB_BITS, self.max_us, self.total,
+                                  self.min if self.count else 0.0, self.max if self.count else 0.0,
+                                  self.negative, len(used))
+        body = array("I", used).tobytes() + array("Q", (self.counts[i] for i in used)).tobytes()
+        return header + zlib.compress(body)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LatencyHistogram":
+        if data[:4] == cls.MAGIC:
+            head = cls.HEADER
+            magic, sub_bits, max_us, total, min_v, max_v, negative, n = head.unpack_from(data)
+        elif data[:4] == b"LHS1":
+            head = cls.HEADER_V1
+            magic, sub_bits, max_us, total, min_v, max_v, n = head.unpack_from(data)
+            negative = 0
+        else:
+            raise ValueError("Kein kompatibles Latenz-Histogramm")
+        if sub_bits != cls.SUB_BITS:
+            raise ValueError("Kein kompatibles Latenz-Histogramm")
+        body = zlib.decompress(data[head.size:])
+        indices = array("I", body[:4 * n])
+        counts = array("Q", body[4 * n:])
+        hist = cls(max_ms=max_us / 1000)
+        for i, c in zip(indices, counts):
+            hist.counts[i] = c
+        hist.count = sum(counts)
+        hist.total = total
+        hist.negative = negative
+        if hist.count:
+            hist.min, hist.max = min_v, max_v
+        return hist
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "LatencyHistogram":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def merge_histograms(paths):
+    """Führt gespeicherte Histogramme (z. B. mehrerer Läufe oder Worker) zusammen."""
+    merged = LatencyHistogram()
+    for path in paths:
+        merged.merge(LatencyHistogram.load(path))
+    return merged